@@ -1,5 +1,6 @@
 import socket
 import threading
+from collections.abc import Iterator
 from dataclasses import dataclass
 from functools import wraps
 
@@ -157,6 +158,65 @@ class Client(Protocol):
         if result is False:
             raise ValueError(self.read_string())
 
+    @synchronized
+    def get_task_page(
+        self, employer_id: int, limit: int, cursor: str = '', from_id: int = None, to_id: int = None,
+    ) -> tuple[list[Task], str]:
+        """Get up to limit tasks of the list and the cursor of the next page ('' when there are no more pages).
+        :param employer_id:
+        :param limit:
+        :param cursor: cursor returned by the previous page, '' for the first one
+        :param from_id:
+        :param to_id:
+        """
+        self.write_opcode(opcodes.CMSG_TASK_LIST_PAGE)
+        self.write_int(employer_id)
+        self.write_int(from_id or 0)
+        self.write_int(to_id or 0)
+        self.write_string(cursor)
+        self.write_int(limit)
+        self.send()
+
+        opcode = self.read_opcode()
+        if opcode != opcodes.SMSG_TASK_LIST_PAGE:
+            raise ValueError("Unknown task list page response opcode")
+
+        result = self.read_bool()
+        if result is False:
+            raise ValueError(self.read_string())
+
+        next_cursor = self.read_string()
+        tasks = []
+        for _ in range(self.read_int()):
+            task = Task()
+            task.id = self.read_int()
+            task.duration = self.read_float()
+            task.done_date = self.read_float()
+            tasks.append(task)
+        return tasks, next_cursor
+
+    def iter_tasks(
+        self, employer_id: int, from_id: int = None, to_id: int = None, page_size: int = 1000,
+    ) -> Iterator[Task]:
+        """Iterate over the task list, fetching it lazily page by page.
+        :param employer_id:
+        :param from_id:
+        :param to_id:
+        :param page_size: tasks per request
+        """
+        prev_task = None
+        cursor = ''
+        while True:
+            tasks, cursor = self.get_task_page(employer_id, page_size, cursor, from_id, to_id)
+            for task in tasks:
+                if prev_task is not None:
+                    prev_task.next_id = task.id
+                    task.prev_id = prev_task.id
+                yield task
+                prev_task = task
+            if not cursor:
+                return
+
     @synchronized
     def get_task_list(self, employer_id: int, from_id: int = None, to_id: int = None) -> list[Task]:
         self.write_opcode(opcodes.CMSG_TASK_LIST)
@@ -250,6 +310,166 @@ class Client(Protocol):
         task_id = self.get_latest_task_id(employer_id)
         return self.get_task(employer_id, task_id)
 
+    @synchronized
+    def get_task_id_at(self, employer_id, position):
+        # position считается от начала очереди с нуля
+        self.write_opcode(opcodes.CMSG_TASK_AT)
+        self.write_int(employer_id)
+        self.write_int(position)
+        self.send()
+
+        opcode = self.read_opcode()
+        if opcode != opcodes.SMSG_TASK_AT:
+            raise ValueError("Unknown task at response opcode")
+
+        result = self.read_bool()
+        if result is False:
+            raise ValueError(self.read_string())
+
+        return self.read_int()
+
+    @synchronized
+    def get_task_at(self, employer_id, position):
+        task_id = self.get_task_id_at(employer_id, position)
+        return self.get_task(employer_id, task_id)
+
+    @synchronized
+    def get_position(self, employer_id, task_id):
+        self.write_opcode(opcodes.CMSG_TASK_POSITION)
+        self.write_int(employer_id)
+        self.write_int(task_id)
+        self.send()
+
+        opcode = self.read_opcode()
+        if opcode != opcodes.SMSG_TASK_POSITION:
+            raise ValueError("Unknown task position response opcode")
+
+        result = self.read_bool()
+        if result is False:
+            raise ValueError(self.read_string())
+
+        return self.read_int()
+
+    @synchronized
+    def get_eta(self, employer_id, task_id):
+        # сколько ждать начала задачи: сумма длительностей задач перед ней
+        self.write_opcode(opcodes.CMSG_TASK_ETA)
+        self.write_int(employer_id)
+        self.write_int(task_id)
+        self.send()
+
+        opcode = self.read_opcode()
+        if opcode != opcodes.SMSG_TASK_ETA:
+            raise ValueError("Unknown task eta response opcode")
+
+        result = self.read_bool()
+        if result is False:
+            raise ValueError(self.read_string())
+
+        return self.read_float()
+
+    @synchronized
+    def get_total_duration(self, employer_id, from_id=None, to_id=None):
+        self.write_opcode(opcodes.CMSG_TASK_DURATION)
+        self.write_int(employer_id)
+        self.write_int(from_id or 0)
+        self.write_int(to_id or 0)
+        self.send()
+
+        opcode = self.read_opcode()
+        if opcode != opcodes.SMSG_TASK_DURATION:
+            raise ValueError("Unknown task duration response opcode")
+
+        result = self.read_bool()
+        if result is False:
+            raise ValueError(self.read_string())
+
+        return self.read_float()
+
+    @synchronized
+    def get_task_ids_by_done_date(self, employer_id, start=None, end=None):
+        """Get ids of tasks with start <= done_date < end, ordered by done_date. Tasks without done_date are skipped.
+        :param employer_id:
+        :param start: None - no lower bound
+        :param end: None - no upper bound
+        """
+        self.write_opcode(opcodes.CMSG_TASK_DONE_RANGE)
+        self.write_int(employer_id)
+        self.write_float(float('-inf') if start is None else start)
+        self.write_float(float('inf') if end is None else end)
+        self.send()
+
+        opcode = self.read_opcode()
+        if opcode != opcodes.SMSG_TASK_DONE_RANGE:
+            raise ValueError("Unknown task done range response opcode")
+
+        result = self.read_bool()
+        if result is False:
+            raise ValueError(self.read_string())
+
+        return [self.read_int() for _ in range(self.read_int())]
+
+    @synchronized
+    def add_tasks(self, employer_id, tasks, prev_id=None):
+        """Add tasks in one request, in the given order after prev_id (or at the end of the queue).
+        :param employer_id:
+        :param tasks: (task_id, duration, done_date) tuples
+        :param prev_id:
+        """
+        self.write_opcode(opcodes.CMSG_TASK_ADD_BATCH)
+        self.write_int(employer_id)
+        self.write_int(prev_id or 0)
+        self.write_int(len(tasks))
+        for task_id, duration, done_date in tasks:
+            self.write_int(task_id)
+            self.write_float(duration)
+            self.write_float(done_date)
+        self.send()
+
+        opcode = self.read_opcode()
+        if opcode != opcodes.SMSG_TASK_ADD_BATCH:
+            raise ValueError("Unknown task add batch response opcode")
+
+        result = self.read_bool()
+        if result is False:
+            raise ValueError(self.read_string())
+
+    @synchronized
+    def move_tasks(self, employer_id, task_ids, prev_id=None):
+        """Move tasks in one request, in the given order after prev_id (or to the start of the queue)."""
+        self.write_opcode(opcodes.CMSG_TASK_MOVE_BATCH)
+        self.write_int(employer_id)
+        self.write_int(prev_id or 0)
+        self.write_int(len(task_ids))
+        for task_id in task_ids:
+            self.write_int(task_id)
+        self.send()
+
+        opcode = self.read_opcode()
+        if opcode != opcodes.SMSG_TASK_MOVE_BATCH:
+            raise ValueError("Unknown task move batch response opcode")
+
+        result = self.read_bool()
+        if result is False:
+            raise ValueError(self.read_string())
+
+    @synchronized
+    def delete_tasks(self, employer_id, task_ids):
+        self.write_opcode(opcodes.CMSG_TASK_DELETE_BATCH)
+        self.write_int(employer_id)
+        self.write_int(len(task_ids))
+        for task_id in task_ids:
+            self.write_int(task_id)
+        self.send()
+
+        opcode = self.read_opcode()
+        if opcode != opcodes.SMSG_TASK_DELETE_BATCH:
+            raise ValueError("Unknown task delete batch response opcode")
+
+        result = self.read_bool()
+        if result is False:
+            raise ValueError(self.read_string())
+
     @synchronized
     def create_queue(self, employer_id):
         self.write_opcode(opcodes.CMSG_QUEUE_CREATE_REQUEST)
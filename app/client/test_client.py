@@ -117,6 +117,82 @@ def test_get_latest_task_id_ok(f_auth_client, f_queue_factory):
     assert isinstance(latest_task_id, int)
 
 
+def test_task_position_ok(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+    f_auth_client.add_task(1, 1, 60.0, 162030.0)
+    f_auth_client.add_task(1, 2, 60.0, 162030.0)
+    f_auth_client.move_task(1, 2, 0)
+    assert f_auth_client.get_task_id_at(1, 0) == 2
+    assert f_auth_client.get_task_at(1, 1).id == 1
+    assert f_auth_client.get_position(1, 1) == 1
+
+
+def test_task_position_fail(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+    with pytest.raises(ValueError):
+        f_auth_client.get_task_at(1, 0)
+    with pytest.raises(ValueError):
+        f_auth_client.get_position(1, 999)
+
+
+def test_task_eta_ok(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+    f_auth_client.add_task(1, 1, 60.0, 162030.0)
+    f_auth_client.add_task(1, 2, 30.0, 162030.0)
+    f_auth_client.add_task(1, 3, 15.0, 162030.0)
+    assert f_auth_client.get_eta(1, 3) == 90.0
+    assert f_auth_client.get_total_duration(1) == 105.0
+    assert f_auth_client.get_total_duration(1, 2, 3) == 45.0
+
+
+def test_task_ids_by_done_date_ok(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+    f_auth_client.add_tasks(1, [(1, 60.0, 300.0), (2, 60.0, 100.0), (3, 60.0, 0.0), (4, 60.0, 200.0)])
+    assert f_auth_client.get_task_ids_by_done_date(1) == [2, 4, 1]
+    assert f_auth_client.get_task_ids_by_done_date(1, 150.0) == [4, 1]
+    assert f_auth_client.get_task_ids_by_done_date(1, 100.0, 300.0) == [2, 4]
+
+
+def test_task_eta_fail(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+    with pytest.raises(ValueError):
+        f_auth_client.get_eta(1, 999)
+    with pytest.raises(ValueError):
+        f_auth_client.get_total_duration(1, 999)
+
+
+def test_bulk_tasks_ok(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+    f_auth_client.add_tasks(1, [(i, 60.0, 162030.0) for i in range(1, 6)])
+    f_auth_client.add_tasks(1, [(6, 30.0, 0.0)], prev_id=1)
+    f_auth_client.move_tasks(1, [5, 4])
+    f_auth_client.delete_tasks(1, [2, 3])
+    assert [t.id for t in f_auth_client.get_task_list(1)] == [5, 4, 1, 6]
+
+
+def test_bulk_tasks_fail(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+    f_auth_client.add_tasks(1, [(1, 60.0, 162030.0)])
+    with pytest.raises(ValueError):
+        f_auth_client.add_tasks(1, [(2, 60.0, 162030.0), (1, 60.0, 162030.0)])
+    with pytest.raises(ValueError):
+        f_auth_client.move_tasks(1, [1, 999])
+    with pytest.raises(ValueError):
+        f_auth_client.delete_tasks(1, [999])
+    assert [t.id for t in f_auth_client.get_task_list(1)] == [1]
+
+
+def test_iter_tasks_ok(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+    f_auth_client.add_tasks(1, [(i, 60.0, 162030.0) for i in range(1, 8)])
+    tasks = list(f_auth_client.iter_tasks(1, page_size=3))
+    assert [t.id for t in tasks] == list(range(1, 8))
+    assert (tasks[3].prev_id, tasks[3].next_id) == (3, 5)
+    assert [t.id for t in f_auth_client.iter_tasks(1, from_id=2, to_id=4, page_size=2)] == [2, 3, 4]
+    page, cursor = f_auth_client.get_task_page(1, 7)
+    assert (len(page), cursor) == (7, '')
+
+
 def test_create_queue_ok(f_auth_client):
     f_auth_client.create_queue(2)
 
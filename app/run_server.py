@@ -1,15 +1,48 @@
 import os
+import threading
+import time
 
 import structlog
 
 from server.server import TcpServer
 from server.serverconfig import ServerConfig
+from task_queue.manager import QueueManager
+from task_queue.persistence import PersistenceManager
+from task_queue.sqlite_storage import SqliteStorage
 
 logger = structlog.get_logger("TcpServer")
 
+def warm_start(config):
+    started = time.perf_counter()
+    timings = QueueManager.warm_start(config.durability, config.recovery_workers)
+    # в лог попадают только самые медленные очереди
+    for employer_id, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True)[:10]:
+        logger.info("queue recovered", employer_id=employer_id, seconds=round(seconds, 4))
+    logger.info("warm start finished", queues=len(timings), seconds=round(time.perf_counter() - started, 4))
+
+def evict_idle(interval):
+    while True:
+        time.sleep(interval)
+        QueueManager.evict_idle()
+        logger.info("queue residency", hits=QueueManager.hits, misses=QueueManager.misses,
+                    evictions=QueueManager.evictions)
+
 def main():
     port = int(os.getenv("QSERVER_PORT", 9999))
     config = ServerConfig()
+    PersistenceManager.snapshot_mode = config.snapshot_mode
+    PersistenceManager.snapshot_codec = config.snapshot_codec
+    SqliteStorage.snapshot_codec = config.snapshot_codec
+    if config.storage == "sqlite":
+        QueueManager.storage = SqliteStorage
+    QueueManager.engine = config.queue_engine
+    QueueManager.memory_budget = config.memory_budget
+    QueueManager.idle_timeout = config.idle_timeout
+    if config.idle_timeout is not None:
+        threading.Thread(target=evict_idle, args=(config.idle_timeout,), daemon=True).start()
+    if config.warm_start:
+        # клиенты принимаются сразу, create_queue дождётся восстановления своей очереди
+        threading.Thread(target=warm_start, args=(config,), daemon=True).start()
     server = TcpServer("0.0.0.0", port, config)
     logger.info("starting server", host=server.host, port=server.port)
     server.start()
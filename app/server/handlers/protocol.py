@@ -1,6 +1,8 @@
 import socket
 import struct
 import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
 
 from .exceptions import DisconnectedException, ServerException
 
@@ -21,8 +23,10 @@ class Protocol:
         self.client_socket = client_socket
         self.is_connected = True
         self._buffers = {}
-        self._write_buffer = b''
+        # bytearray, а не bytes: дописывание в bytes копирует весь буфер, и большой ответ собирался бы за O(n^2)
+        self._write_buffer = bytearray()
         self._read_buffer = b''
+        self._recorded = None
 
     def _get_buffer(self) -> Buffer:
         thread_id = threading.get_ident()
@@ -62,11 +66,34 @@ class Protocol:
             data += packet
             length = len(data)
             if length == size:
+                if self._recorded is not None:
+                    self._recorded += data
                 return data
             if length > size:
                 raise ValueError("Data too big")
             self.read_buffer()
 
+    @contextmanager
+    def recording(self) -> Iterator[bytearray]:
+        """
+        Запись прочитанных данных: всё, что прочитано внутри блока, копится в отдаваемом bytearray.
+
+        :return: прочитанные внутри блока данные
+        """
+        self._recorded = recorded = bytearray()
+        try:
+            yield recorded
+        finally:
+            self._recorded = None
+
+    def unread(self, data: bytes) -> None:
+        """
+        Возврат данных в начало буфера: следующие чтения прочитают их заново.
+
+        :param data: данные для возврата
+        """
+        self._read_buffer = bytes(data) + self._read_buffer
+
     def write(self, data: bytes) -> None:
         """
         Запись данных в сокет.
@@ -195,4 +222,4 @@ class Protocol:
     
     def send(self):
         self.client_socket.sendall(self._write_buffer)
-        self._write_buffer = b""
+        self._write_buffer = bytearray()
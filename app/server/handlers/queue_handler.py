@@ -11,7 +11,7 @@ class QueueCreateRequestHandler(BaseHandler):
         employer_id = self.session.read_int()
         self.session.write_opcode(opcodes.SMSG_QUEUE_CREATE_RESPONSE)
         try:
-            QueueManager.create_queue(employer_id)
+            QueueManager.create_queue(employer_id, self.session.config.durability, self.session.config.queue_engine)
             self.session.write_bool(True)
             self.session.send()
         except ValueError as e:
@@ -1,12 +1,17 @@
 
+import struct
+
 from task_queue.manager import QueueManager
 from task_queue.node import TaskNode
-from task_queue.queue import TaskQueue
+from task_queue.queue import QueueRetiredError, TaskQueue
 
 from .. import opcodes
 from ..opcode_utils import register
 from .base_handler import BaseHandler
 
+# задача в ответе на список: те же поля, что по одному пишут write_int и write_float, без выравнивания
+TASK_RECORD = struct.Struct('=idd')
+
 
 def is_authenticated(session):
     if not session.is_authenticated:
@@ -25,7 +30,16 @@ class BaseTaskHandler(BaseHandler):
 
             self.session.write_opcode(self.return_opcode)
             queue = QueueManager.get_queue(employer_id)
-            self.execute_command(queue)
+            with self.session.recording() as request:
+                try:
+                    self.execute_command(queue)
+                    return
+                except QueueRetiredError:
+                    # очередь выгрузили между get_queue и изменением: оно не выполнено, а ответ пишется только
+                    # после изменения - разбираем запрос заново над поднятой очередью, один раз
+                    pass
+            self.session.unread(request)
+            self.execute_command(QueueManager.get_queue(employer_id))
         except ValueError as e:
             self.session.flush_buffer()
             self.session.write_bool(False)
@@ -108,11 +122,10 @@ class TaskUpdateRequestHandler(BaseTaskHandler):
         duration = self.session.read_float()
         done_date = self.session.read_float()
 
-        task = queue.get_task(task_id)
-        if task is None:
+        if not queue.task_exists(task_id):
             raise ValueError("Task not found.")
-        task.duration = duration
-        task.done_date = done_date
+        # через update_task, чтобы изменение попало в лог и пережило перезапуск
+        queue.update_task(TaskNode(task_id, duration, done_date))
 
         self.session.write_bool(True)
         self.session.send()
@@ -134,16 +147,48 @@ class TaskListRequestHandler(BaseTaskHandler):
         if to_task is None and to_task_id != 0:
             raise ValueError("'to_task_id' is invalid. May be the task not in the queue.")
 
+        # снимок берётся под коротким чтением, кодирование и отправка - уже без блокировки очереди
+        tasks = queue.list_tasks(from_task, to_task)
         self.session.write_bool(True)
-        for task in queue.get_tasks(from_task, to_task):
-            self.session.write_int(task.id)
-            self.session.write_float(task.duration)
-            self.session.write_float(task.done_date if task.done_date else 0)
+        self.session.write(b''.join([
+            TASK_RECORD.pack(task_id, duration, done_date or 0) for task_id, duration, done_date in tasks
+        ]))
 
         self.session.write_int(0)
         self.session.send()
 
 
+@register(opcodes.CMSG_TASK_LIST_PAGE)
+class TaskListPageRequestHandler(BaseTaskHandler):
+    return_opcode = opcodes.SMSG_TASK_LIST_PAGE
+
+    def execute_command(self, queue):
+        from_task_id = self.session.read_int()
+        to_task_id = self.session.read_int()
+        cursor = self.session.read_string()
+        limit = self.session.read_int()
+
+        from_task = to_task = None
+        if not cursor:
+            # границы проверяются только на первой странице, дальше они хранятся в курсоре
+            from_task = queue.get_task(from_task_id)
+            if from_task is None and from_task_id != 0:
+                raise ValueError("'from_task_id' is invalid. May be the task not in the queue.")
+
+            to_task = queue.get_task(to_task_id)
+            if to_task is None and to_task_id != 0:
+                raise ValueError("'to_task_id' is invalid. May be the task not in the queue.")
+
+        tasks, next_cursor = queue.list_tasks_page(limit, cursor, from_task, to_task)
+        self.session.write_bool(True)
+        self.session.write_string(next_cursor)
+        self.session.write_int(len(tasks))
+        self.session.write(b''.join([
+            TASK_RECORD.pack(task_id, duration, done_date or 0) for task_id, duration, done_date in tasks
+        ]))
+        self.session.send()
+
+
 @register(opcodes.CMSG_TASK_MOVE)
 class TaskMoveRequestHandler(BaseTaskHandler):
     return_opcode = opcodes.SMSG_TASK_MOVE
@@ -185,3 +230,147 @@ class TaskLatestRequestHandler(BaseTaskHandler):
         self.session.write_bool(True)
         self.session.write_int(task.id if task else 0)
         self.session.send()
+
+
+@register(opcodes.CMSG_TASK_AT)
+class TaskAtRequestHandler(BaseTaskHandler):
+    return_opcode = opcodes.SMSG_TASK_AT
+
+    def execute_command(self, queue: TaskQueue):
+        position = self.session.read_int()
+
+        task = queue.get_task_at(position)
+        if task is None:
+            raise ValueError("'position' is out of range.")
+
+        self.session.write_bool(True)
+        self.session.write_int(task.id)
+        self.session.send()
+
+
+@register(opcodes.CMSG_TASK_POSITION)
+class TaskPositionRequestHandler(BaseTaskHandler):
+    return_opcode = opcodes.SMSG_TASK_POSITION
+
+    def execute_command(self, queue: TaskQueue):
+        task_id = self.session.read_int()
+
+        if not queue.task_exists(task_id):
+            raise ValueError("Task not found.")
+
+        self.session.write_bool(True)
+        self.session.write_int(queue.get_position(task_id))
+        self.session.send()
+
+
+@register(opcodes.CMSG_TASK_ETA)
+class TaskEtaRequestHandler(BaseTaskHandler):
+    return_opcode = opcodes.SMSG_TASK_ETA
+
+    def execute_command(self, queue: TaskQueue):
+        task_id = self.session.read_int()
+
+        if not queue.task_exists(task_id):
+            raise ValueError("Task not found.")
+
+        self.session.write_bool(True)
+        self.session.write_float(queue.get_eta(task_id))
+        self.session.send()
+
+
+@register(opcodes.CMSG_TASK_DURATION)
+class TaskDurationRequestHandler(BaseTaskHandler):
+    return_opcode = opcodes.SMSG_TASK_DURATION
+
+    def execute_command(self, queue: TaskQueue):
+        from_task_id = self.session.read_int()
+        to_task_id = self.session.read_int()
+
+        from_task = queue.get_task(from_task_id)
+        if from_task is None and from_task_id != 0:
+            raise ValueError("'from_task_id' is invalid. May be the task not in the queue.")
+
+        to_task = queue.get_task(to_task_id)
+        if to_task is None and to_task_id != 0:
+            raise ValueError("'to_task_id' is invalid. May be the task not in the queue.")
+
+        self.session.write_bool(True)
+        self.session.write_float(queue.get_total_duration(from_task, to_task))
+        self.session.send()
+
+
+@register(opcodes.CMSG_TASK_DONE_RANGE)
+class TaskDoneRangeRequestHandler(BaseTaskHandler):
+    return_opcode = opcodes.SMSG_TASK_DONE_RANGE
+
+    def execute_command(self, queue: TaskQueue):
+        # границы - start <= done_date < end; без границы клиент шлёт -inf/inf
+        start = self.session.read_float()
+        end = self.session.read_float()
+
+        task_ids = queue.get_task_ids_by_done_date(start, end)
+        self.session.write_bool(True)
+        self.session.write_int(len(task_ids))
+        self.session.write(struct.pack(f'={len(task_ids)}i', *task_ids))
+        self.session.send()
+
+
+@register(opcodes.CMSG_TASK_ADD_BATCH)
+class TaskAddBatchRequestHandler(BaseTaskHandler):
+    return_opcode = opcodes.SMSG_TASK_ADD_BATCH
+
+    def execute_command(self, queue: TaskQueue):
+        prev_task_id = self.session.read_int()
+        count = self.session.read_int()
+        # запрос дочитывается целиком до проверок, иначе хвост пачки остался бы в сокете
+        tasks = [
+            TaskNode(self.session.read_int(), self.session.read_float(), self.session.read_float())
+            for _ in range(count)
+        ]
+
+        prev_task = queue.get_task(prev_task_id)
+        if prev_task is None and prev_task_id != 0:
+            raise ValueError("'prev_task_id' is invalid. May be the task not in the queue.")
+
+        queue.add_tasks(tasks, prev_task)
+        self.session.write_bool(True)
+        self.session.send()
+
+
+@register(opcodes.CMSG_TASK_MOVE_BATCH)
+class TaskMoveBatchRequestHandler(BaseTaskHandler):
+    return_opcode = opcodes.SMSG_TASK_MOVE_BATCH
+
+    def execute_command(self, queue: TaskQueue):
+        prev_task_id = self.session.read_int()
+        count = self.session.read_int()
+        task_ids = [self.session.read_int() for _ in range(count)]
+
+        tasks = [queue.get_task(task_id) for task_id in task_ids]
+        if None in tasks:
+            raise ValueError("Task not found.")
+
+        prev_task = queue.get_task(prev_task_id)
+        if prev_task is None and prev_task_id != 0:
+            raise ValueError("'prev_task_id' is invalid. May be the task not in the queue.")
+
+        queue.move_tasks(tasks, prev_task)
+        self.session.write_bool(True)
+        self.session.send()
+
+
+@register(opcodes.CMSG_TASK_DELETE_BATCH)
+class TaskDeleteBatchRequestHandler(BaseTaskHandler):
+    return_opcode = opcodes.SMSG_TASK_DELETE_BATCH
+
+    def execute_command(self, queue: TaskQueue):
+        count = self.session.read_int()
+        task_ids = [self.session.read_int() for _ in range(count)]
+
+        tasks = [queue.get_task(task_id) for task_id in task_ids]
+        if None in tasks:
+            raise ValueError("Task not found.")
+
+        queue.delete_tasks(tasks)
+        self.session.write_bool(True)
+        self.session.send()
@@ -20,3 +20,21 @@ CMSG_TASK_FIRST = 18
 SMSG_TASK_FIRST = 19
 CMSG_TASK_LATEST = 20
 SMSG_TASK_LATEST = 21
+CMSG_TASK_AT = 22
+SMSG_TASK_AT = 23
+CMSG_TASK_POSITION = 24
+SMSG_TASK_POSITION = 25
+CMSG_TASK_ETA = 26
+SMSG_TASK_ETA = 27
+CMSG_TASK_DURATION = 28
+SMSG_TASK_DURATION = 29
+CMSG_TASK_ADD_BATCH = 30
+SMSG_TASK_ADD_BATCH = 31
+CMSG_TASK_MOVE_BATCH = 32
+SMSG_TASK_MOVE_BATCH = 33
+CMSG_TASK_DELETE_BATCH = 34
+SMSG_TASK_DELETE_BATCH = 35
+CMSG_TASK_LIST_PAGE = 36
+SMSG_TASK_LIST_PAGE = 37
+CMSG_TASK_DONE_RANGE = 38
+SMSG_TASK_DONE_RANGE = 39
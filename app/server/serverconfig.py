@@ -1,7 +1,24 @@
 import os
 
+from task_queue.manager import QueueEngine
+from task_queue.persistence import Durability, SnapshotMode
+
 
 class ServerConfig:
     password: str = os.getenv("QSERVER_PASSWORD", "password")
-
-
+    # уровень долговечности по умолчанию для очередей, создаваемых через CMSG_QUEUE_CREATE_REQUEST
+    durability: Durability = Durability(os.getenv("QSERVER_DURABILITY", Durability.ASYNC))
+    # движок очередей, создаваемых через CMSG_QUEUE_CREATE_REQUEST: linked или array (см. QueueEngine)
+    queue_engine: QueueEngine = QueueEngine(os.getenv("QSERVER_QUEUE_ENGINE", QueueEngine.LINKED))
+    # откуда снимаются снапшоты очередей, см. SnapshotMode
+    snapshot_mode: SnapshotMode = SnapshotMode(os.getenv("QSERVER_SNAPSHOT_MODE", SnapshotMode.SHADOW))
+    # кодек сжатия снапшотов: raw, zlib, lzma; пустое значение - чистый JSON, как раньше
+    snapshot_codec: str | None = os.getenv("QSERVER_SNAPSHOT_CODEC") or None
+    # тёплый старт: при запуске восстановить все очереди из хранилища в recovery_workers потоков
+    warm_start: bool = os.getenv("QSERVER_WARM_START", "0") == "1"
+    recovery_workers: int = int(os.getenv("QSERVER_RECOVERY_WORKERS", 4))
+    # выгрузка остывших очередей: бюджет резидентных задач и простой в секундах, пустое значение - без ограничения
+    memory_budget: int | None = int(os.getenv("QSERVER_MEMORY_BUDGET")) if os.getenv("QSERVER_MEMORY_BUDGET") else None
+    idle_timeout: float | None = float(os.getenv("QSERVER_IDLE_TIMEOUT")) if os.getenv("QSERVER_IDLE_TIMEOUT") else None
+    # бэкенд хранения очередей: file (PersistenceManager) или sqlite (SqliteStorage)
+    storage: str = os.getenv("QSERVER_STORAGE", "file")
@@ -1,4 +1,7 @@
 from server import opcodes
+from task_queue.manager import QueueManager
+from task_queue.node import TaskNode
+from task_queue.persistence import PersistenceManager
 
 
 def test_get_task(f_auth_client, f_queue_factory, f_task_factory):
@@ -176,6 +179,30 @@ def test_update_task(f_auth_client, f_queue_factory, f_task_factory):
     assert q1.get_task(2).duration == 20
 
 
+def test_update_task_is_logged(f_auth_client, f_queue_factory, f_task_factory, monkeypatch):
+    logged = []
+    log = PersistenceManager.log.__func__
+
+    def spy_log(cls, employer_id, op):
+        logged.append(op)
+        return log(cls, employer_id, op)
+
+    monkeypatch.setattr(PersistenceManager, 'log', classmethod(spy_log))
+    q1 = f_queue_factory(1)
+    q1.add_task(f_task_factory(1, 10))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_UPDATE)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(1)
+    f_auth_client.write_float(20)
+    f_auth_client.write_float(5)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_UPDATE
+    assert f_auth_client.read_bool()
+    assert logged[-1] == {'action': 'update', 'task': {'id': 1, 'duration': 20, 'done_date': 5}}
+
+
 def test_update_task_not_found(f_auth_client, f_queue_factory, f_task_factory):
     f_queue_factory(1)
 
@@ -256,6 +283,67 @@ def test_list_all_tasks(f_auth_client, f_queue_factory, f_task_factory):
     assert tasks == [(1, 10, 0), (2, 10, 0), (3, 10, 0)]
 
 
+def _list_tasks_page(client, employer_id, from_id, to_id, cursor, limit):
+    client.write_opcode(opcodes.CMSG_TASK_LIST_PAGE)
+    client.write_int(employer_id)
+    client.write_int(from_id)
+    client.write_int(to_id)
+    client.write_string(cursor)
+    client.write_int(limit)
+    client.send()
+
+    assert client.read_opcode() == opcodes.SMSG_TASK_LIST_PAGE
+    assert client.read_bool()
+    cursor = client.read_string()
+    count = client.read_int()
+    return [(client.read_int(), client.read_float(), client.read_float()) for _ in range(count)], cursor
+
+
+def test_list_tasks_page(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    for task_id in (1, 2, 3):
+        q1.add_task(f_task_factory(task_id, 10))
+
+    pages = []
+    cursor = ''
+    while True:
+        page, cursor = _list_tasks_page(f_auth_client, 1, 0, 0, cursor, 2)
+        pages.append(page)
+        if not cursor:
+            break
+    assert pages == [[(1, 10, 0), (2, 10, 0)], [(3, 10, 0)]]
+
+
+def test_list_tasks_page_from_task_deleted(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    for task_id in range(1, 6):
+        q1.add_task(f_task_factory(task_id, 10))
+
+    page, cursor = _list_tasks_page(f_auth_client, 1, 2, 4, '', 2)
+    assert [task[0] for task in page] == [2, 3]
+    # границы проверяются только на первой странице: удаление задачи-начала не обрывает обход
+    q1.delete_task(q1.get_task(2))
+    page, cursor = _list_tasks_page(f_auth_client, 1, 2, 4, cursor, 2)
+    assert ([task[0] for task in page], cursor) == ([4], '')
+
+
+def test_list_tasks_page_invalid_limit(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    q1.add_task(f_task_factory(1, 10))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_LIST_PAGE)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(0)
+    f_auth_client.write_int(0)
+    f_auth_client.write_string('')
+    f_auth_client.write_int(0)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_LIST_PAGE
+    assert not f_auth_client.read_bool()
+    assert f_auth_client.read_string() == "'limit' must be positive"
+
+
 def test_list_tasks_not_found(f_auth_client, f_queue_factory, f_task_factory):
     q1 = f_queue_factory(1)
     q1.add_task(f_task_factory(1, 10))
@@ -448,3 +536,246 @@ def test_latest_task_not_found(f_auth_client):
     assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_LATEST
     assert not f_auth_client.read_bool()
     assert f_auth_client.read_string() == "No queue for employer_id 2"
+
+
+def test_task_at(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    q1.add_task(f_task_factory(1, 10))
+    q1.add_task(f_task_factory(2, 10))
+    q1.add_task(f_task_factory(3, 10))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_AT)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(1)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_AT
+    assert f_auth_client.read_bool()
+    assert f_auth_client.read_int() == 2
+
+
+def test_task_at_out_of_range(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    q1.add_task(f_task_factory(1, 10))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_AT)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(1)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_AT
+    assert not f_auth_client.read_bool()
+    assert f_auth_client.read_string() == "'position' is out of range."
+
+
+def test_task_position(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    q1.add_task(f_task_factory(1, 10))
+    q1.add_task(f_task_factory(2, 10))
+    q1.add_task(f_task_factory(3, 10))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_POSITION)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(3)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_POSITION
+    assert f_auth_client.read_bool()
+    assert f_auth_client.read_int() == 2
+
+
+def test_task_position_not_found(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_POSITION)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(3)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_POSITION
+    assert not f_auth_client.read_bool()
+    assert f_auth_client.read_string() == "Task not found."
+
+
+def test_task_eta(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    q1.add_task(f_task_factory(1, 10))
+    q1.add_task(f_task_factory(2, 20))
+    q1.add_task(f_task_factory(3, 30))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_ETA)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(3)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_ETA
+    assert f_auth_client.read_bool()
+    assert f_auth_client.read_float() == 30
+
+
+def test_task_eta_not_found(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_ETA)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(3)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_ETA
+    assert not f_auth_client.read_bool()
+    assert f_auth_client.read_string() == "Task not found."
+
+
+def test_task_duration(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    q1.add_task(f_task_factory(1, 10))
+    q1.add_task(f_task_factory(2, 20))
+    q1.add_task(f_task_factory(3, 30))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_DURATION)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(2)
+    f_auth_client.write_int(0)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_DURATION
+    assert f_auth_client.read_bool()
+    assert f_auth_client.read_float() == 50
+
+
+def test_task_done_range(f_auth_client, f_queue_factory):
+    q1 = f_queue_factory(1)
+    for task_id, done_date in ((1, 300), (2, 100), (3, None), (4, 200)):
+        q1.add_task(TaskNode(task_id, 10, done_date))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_DONE_RANGE)
+    f_auth_client.write_int(1)
+    f_auth_client.write_float(float('-inf'))
+    f_auth_client.write_float(300)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_DONE_RANGE
+    assert f_auth_client.read_bool()
+    assert [f_auth_client.read_int() for _ in range(f_auth_client.read_int())] == [2, 4]
+
+
+def test_task_duration_invalid_range(f_auth_client, f_queue_factory):
+    f_queue_factory(1)
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_DURATION)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(0)
+    f_auth_client.write_int(3)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_DURATION
+    assert not f_auth_client.read_bool()
+    assert f_auth_client.read_string() == "'to_task_id' is invalid. May be the task not in the queue."
+
+
+def test_add_task_batch(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    q1.add_task(f_task_factory(1, 10))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_ADD_BATCH)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(0)
+    f_auth_client.write_int(2)
+    for task_id in (2, 3):
+        f_auth_client.write_int(task_id)
+        f_auth_client.write_float(10)
+        f_auth_client.write_float(0)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_ADD_BATCH
+    assert f_auth_client.read_bool()
+    assert [task.id for task in q1.get_tasks()] == [1, 2, 3]
+
+
+def test_add_task_batch_existing_task(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    q1.add_task(f_task_factory(1, 10))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_ADD_BATCH)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(0)
+    f_auth_client.write_int(2)
+    for task_id in (2, 1):
+        f_auth_client.write_int(task_id)
+        f_auth_client.write_float(10)
+        f_auth_client.write_float(0)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_ADD_BATCH
+    assert not f_auth_client.read_bool()
+    assert f_auth_client.read_string() == "Task with id 1 already exists in the queue"
+    assert [task.id for task in q1.get_tasks()] == [1]
+
+
+def test_move_task_batch(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    for task_id in (1, 2, 3):
+        q1.add_task(f_task_factory(task_id, 10))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_MOVE_BATCH)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(2)
+    f_auth_client.write_int(3)
+    f_auth_client.write_int(2)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_MOVE_BATCH
+    assert f_auth_client.read_bool()
+    assert [task.id for task in q1.get_tasks()] == [1, 3, 2]
+
+
+def test_delete_task_batch_not_found(f_auth_client, f_queue_factory, f_task_factory):
+    q1 = f_queue_factory(1)
+    q1.add_task(f_task_factory(1, 10))
+
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_DELETE_BATCH)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(2)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(4)
+    f_auth_client.send()
+
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_DELETE_BATCH
+    assert not f_auth_client.read_bool()
+    assert f_auth_client.read_string() == "Task not found."
+    assert [task.id for task in q1.get_tasks()] == [1]
+
+
+def test_add_task_retries_after_eviction(f_auth_client, f_queue_factory, f_task_factory, monkeypatch, tmp_path):
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    f_queue_factory(1).add_task(f_task_factory(1, 10))
+    get_queue = QueueManager.get_queue.__func__
+    stale = []
+
+    def racing_get_queue(cls, employer_id):
+        queue = get_queue(cls, employer_id)
+        if not stale:
+            # очередь выгружается между get_queue обработчика и её изменением
+            stale.append(queue)
+            monkeypatch.setattr(QueueManager, 'idle_timeout', 0.0)
+            QueueManager.evict_idle()
+            monkeypatch.setattr(QueueManager, 'idle_timeout', None)
+        return queue
+
+    monkeypatch.setattr(QueueManager, 'get_queue', classmethod(racing_get_queue))
+    f_auth_client.write_opcode(opcodes.CMSG_TASK_ADD)
+    f_auth_client.write_int(1)
+    f_auth_client.write_int(2)
+    f_auth_client.write_float(20)
+    f_auth_client.write_float(0)
+    f_auth_client.write_int(1)
+    f_auth_client.send()
+
+    # выгрузка прозрачна для клиента: запрос повторён над поднятой заново очередью
+    assert f_auth_client.read_opcode() == opcodes.SMSG_TASK_ADD
+    assert f_auth_client.read_bool()
+    queue = QueueManager.get_queue(1)
+    assert queue is not stale[0]
+    assert [task.id for task in queue.get_tasks()] == [1, 2]
+    assert set(QueueManager._access) == {1}
@@ -0,0 +1,314 @@
+from array import array
+from collections.abc import Iterator
+from typing import Any, Optional
+
+from .node import TaskNode
+from .persistence import Durability
+from .queue import TaskQueue, durable, optimistic, reading, synchronized
+from .storage import StorageBackend
+
+NIL = -1
+DELETED = -2
+
+
+class SlotIndex:
+    # Индекс id -> номер слота с открытой адресацией (как у dict, но в array('q')): в таблице лежат только
+    # номера слотов, а id для сравнения берутся из массива ids очереди. dict на миллион задач держал бы
+    # ещё и объекты int для ключей и значений - это больше, чем сами массивы задач.
+    _ids: array
+    _table: array
+    _size: int
+    _filled: int
+
+    def __init__(self, ids: array) -> None:
+        self._ids = ids
+        self._table = array('q', [NIL]) * 8
+        self._size = 0
+        self._filled = 0
+
+    def _find(self, task_id: int) -> int:
+        # номер ячейки с задачей task_id или первой пустой ячейки на её пути проб
+        table, ids = self._table, self._ids
+        mask = len(table) - 1
+        index = task_id & mask
+        perturb = task_id & 0xFFFFFFFFFFFFFFFF
+        while True:
+            slot = table[index]
+            if slot == NIL or (slot != DELETED and ids[slot] == task_id):
+                return index
+            perturb >>= 5
+            index = (index * 5 + perturb + 1) & mask
+
+    def get(self, task_id: int) -> int:
+        return self._table[self._find(task_id)]
+
+    def set(self, task_id: int, slot: int) -> None:
+        # task_id ещё нет в индексе; заполненность с удалёнными ячейками держим не выше 2/3
+        if (self._filled + 1) * 3 >= len(self._table) * 2:
+            self._resize()
+        table = self._table
+        mask = len(table) - 1
+        index = task_id & mask
+        perturb = task_id & 0xFFFFFFFFFFFFFFFF
+        while table[index] >= 0:
+            perturb >>= 5
+            index = (index * 5 + perturb + 1) & mask
+        if table[index] == NIL:
+            self._filled += 1
+        table[index] = slot
+        self._size += 1
+
+    def delete(self, task_id: int) -> None:
+        self._table[self._find(task_id)] = DELETED
+        self._size -= 1
+
+    def _resize(self) -> None:
+        capacity = 8
+        while capacity < (self._size + 1) * 2:
+            capacity <<= 1
+        slots = [slot for slot in self._table if slot >= 0]
+        self._table = array('q', [NIL]) * capacity
+        self._size = self._filled = 0
+        for slot in slots:
+            self.set(self._ids[slot], slot)
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class TaskView:
+    # Задача ArrayTaskQueue для кода, который работает с TaskNode: поля читаются из массивов очереди
+    # по id при каждом обращении, поэтому представление не устаревает при переиспользовании слотов.
+    # Представление только для чтения: поля меняются через update_task, иначе изменение не попадёт в лог.
+    __slots__ = ('_queue', 'id')
+
+    def __init__(self, queue: 'ArrayTaskQueue', task_id: int) -> None:
+        self._queue = queue
+        self.id = task_id
+
+    @property
+    def _slot(self) -> int:
+        return self._queue._slot(self.id)
+
+    @property
+    def duration(self) -> float:
+        return self._queue._durations[self._slot]
+
+    @property
+    def done_date(self) -> float:
+        return self._queue._done_dates[self._slot]
+
+    @property
+    def prev(self) -> Optional['TaskView']:
+        return self._queue._view(self._queue._prevs[self._slot])
+
+    @property
+    def next(self) -> Optional['TaskView']:
+        return self._queue._view(self._queue._nexts[self._slot])
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, TaskView) and other._queue is self._queue and other.id == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __repr__(self) -> str:
+        return f'TaskView(id={self.id})'
+
+
+class ArrayTaskQueue(TaskQueue):
+    # Очередь для очень больших очередей: вместо объекта на задачу - параллельные типизированные массивы
+    # id/duration/done_date и ссылок prev/next по номерам слотов (struct of arrays). Освободившиеся слоты
+    # уходят во free-list и занимаются заново. Снаружи тот же API, что у TaskQueue; задачи наружу
+    # отдаются как TaskView, на вход принимаются TaskNode или TaskView.
+    _ids: array
+    _durations: array
+    _done_dates: array
+    _prevs: array
+    _nexts: array
+    _index: SlotIndex  # type: ignore[assignment]
+    _free: array
+    _head: int
+    _tail: int
+
+    def __init__(
+        self, employer_id: int | None = None, durability: Durability | None = None,
+        storage: StorageBackend | None = None,
+    ) -> None:
+        super().__init__(employer_id, durability, storage)
+        self._ids = array('q')
+        self._durations = array('d')
+        self._done_dates = array('d')
+        self._prevs = array('q')
+        self._nexts = array('q')
+        self._index = SlotIndex(self._ids)
+        self._free = array('q')
+        self._head = self._tail = NIL
+
+    def _view(self, slot: int) -> TaskView | None:
+        return TaskView(self, self._ids[slot]) if slot != NIL else None
+
+    def _alloc(self, task_id: int, duration: float, done_date: float) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = task_id
+            self._durations[slot] = duration
+            self._done_dates[slot] = done_date
+        else:
+            slot = len(self._ids)
+            self._ids.append(task_id)
+            self._durations.append(duration)
+            self._done_dates.append(done_date)
+            self._prevs.append(NIL)
+            self._nexts.append(NIL)
+        self._index.set(task_id, slot)
+        return slot
+
+    def _link_after(self, slot: int, prev: int) -> None:
+        nxt = self._nexts[prev] if prev != NIL else self._head
+        self._prevs[slot] = prev
+        self._nexts[slot] = nxt
+        if nxt != NIL:
+            self._prevs[nxt] = slot
+        else:
+            self._tail = slot
+        if prev != NIL:
+            self._nexts[prev] = slot
+        else:
+            self._head = slot
+
+    def _unlink(self, slot: int) -> None:
+        prev, nxt = self._prevs[slot], self._nexts[slot]
+        if prev != NIL:
+            self._nexts[prev] = nxt
+        else:
+            self._head = nxt
+        if nxt != NIL:
+            self._prevs[nxt] = prev
+        else:
+            self._tail = prev
+        self._prevs[slot] = self._nexts[slot] = NIL
+
+    def _task_fields(self, slot: int) -> dict[str, Any]:
+        return {'id': self._ids[slot], 'duration': self._durations[slot], 'done_date': self._done_dates[slot]}
+
+    def _slot(self, task_id: int) -> int:
+        slot = self._index.get(task_id)
+        if slot == NIL:
+            raise ValueError(f"Task with id {task_id} does not exist in the queue")
+        return slot
+
+    def _add_task(self, task: TaskNode | TaskView, prev_task: TaskNode | TaskView | None, log: bool = True) -> None:
+        if self._index.get(task.id) != NIL:
+            raise ValueError(f"Task with id {task.id} already exists in the queue")
+
+        prev = self._index.get(prev_task.id) if prev_task else self._tail
+        if prev_task and prev == NIL:
+            raise ValueError("prev_task is not in the queue")
+
+        slot = self._alloc(task.id, task.duration or 0, task.done_date or 0)
+        self._link_after(slot, prev)
+        if self._dates is not None:
+            self._dates.add(task.id, task.done_date)
+        if self._rank is not None:
+            self._rank.insert_after(task.id, self._ids[prev] if prev != NIL else None, task.duration or 0)
+        if log:
+            self._log({
+                'action': 'add',
+                'task': self._task_fields(slot),
+                'prev': self._ids[prev] if prev != NIL else None,
+            })
+
+    @optimistic
+    def get_task(self, task_id: int) -> TaskView | None:
+        return TaskView(self, task_id) if self._index.get(task_id) != NIL else None
+
+    @synchronized
+    def unlink_task(self, task: TaskNode | TaskView) -> None:
+        self._unlink(self._slot(task.id))
+
+    def _delete_task(self, task: TaskNode | TaskView) -> TaskView | None:
+        slot = self._slot(task.id)
+        next_task = self._view(self._nexts[slot])
+        self._unlink(slot)
+        self._index.delete(task.id)
+        if self._dates is not None:
+            self._dates.remove(task.id)
+        self._free.append(slot)
+        if self._rank is not None:
+            self._rank.remove(task.id)
+        self._log({
+            'action': 'delete',
+            'task_id': task.id,
+        })
+        return next_task
+
+    @optimistic
+    def task_exists(self, task_id: int) -> bool:
+        return self._index.get(task_id) != NIL
+
+    @durable
+    @synchronized
+    def update_task(self, task: TaskNode | TaskView) -> None:
+        slot = self._slot(task.id)
+        if self._dates is not None:
+            self._dates.remove(task.id)
+            self._dates.add(task.id, task.done_date)
+        self._durations[slot] = task.duration or 0
+        self._done_dates[slot] = task.done_date or 0
+        if self._rank is not None:
+            self._rank.set_duration(task.id, task.duration or 0)
+        self._log({
+            'action': 'update',
+            'task': self._task_fields(slot),
+        })
+
+    def _move_task(self, task: TaskNode | TaskView, prev_task: TaskNode | TaskView | None) -> None:
+        slot = self._slot(task.id)
+        prev = self._index.get(prev_task.id) if prev_task else NIL
+        if prev_task and (prev == NIL or prev == slot):
+            raise ValueError("prev_task is not in the queue")
+        self._unlink(slot)
+        # Если prev_task равен None, добавляем задачу в начало очереди
+        self._link_after(slot, prev)
+        if self._rank is not None:
+            self._rank.move_after(task.id, prev_task.id if prev_task else None)
+        self._log({
+            'action': 'move',
+            'task_id': task.id,
+            'prev': prev_task.id if prev_task else None,
+        })
+
+    @reading
+    def get_tasks(
+        self, from_task: TaskNode | TaskView | None = None, to_task: TaskNode | TaskView | None = None,
+    ) -> Iterator[TaskView]:
+        ids = self._ids
+        return iter([TaskView(self, ids[slot]) for slot in self._iter_slots(from_task, to_task)])
+
+    def _iter_slots(
+        self, from_task: TaskNode | TaskView | None = None, to_task: TaskNode | TaskView | None = None,
+    ) -> Iterator[int]:
+        current = self._slot(from_task.id) if from_task else self._head
+        after = self._nexts[self._slot(to_task.id)] if to_task else NIL
+        nexts = self._nexts
+        while current != NIL and current != after:
+            yield current
+            current = nexts[current]
+
+    def _iter_fields(
+        self, from_task: TaskNode | TaskView | None = None, to_task: TaskNode | TaskView | None = None,
+    ) -> Iterator[tuple[int, float, float]]:
+        ids, durations, done_dates = self._ids, self._durations, self._done_dates
+        for slot in self._iter_slots(from_task, to_task):
+            yield ids[slot], durations[slot], done_dates[slot]
+
+    @property
+    @optimistic
+    def first_task(self) -> TaskView | None:
+        return self._view(self._head)
+
+    @property
+    @optimistic
+    def latest_task(self) -> TaskView | None:
+        return self._view(self._tail)
@@ -0,0 +1,84 @@
+from bisect import bisect_left, insort
+from collections.abc import Iterable, Iterator
+
+# ключей в блоке после построения; блок вдвое больше делится пополам
+LOAD = 512
+
+
+class DoneDateIndex:
+    # Вторичный индекс очереди по done_date: ключи (done_date, id) в отсортированном списке, разбитом на блоки
+    # (как SortedList из sortedcontainers). Вставка и удаление - бинарный поиск блока по максимумам и сдвиг
+    # внутри одного блока, а не всего массива; выборка диапазона - O(log n + k). Задачи без done_date
+    # (None или 0) в индекс не попадают. Как и RankIndex, индекс сам не следит за очередью: она сообщает ему
+    # о вставках, удалениях и смене done_date. Дата, под которой задача лежит в индексе, хранится в _indexed:
+    # удаление не зависит от узла очереди, который вызывающий мог уже изменить на месте.
+    _blocks: list[list[tuple[float, int]]]
+    _maxes: list[tuple[float, int]]
+    _size: int
+    _indexed: dict[int, float | None]
+
+    def __init__(self, tasks: Iterable[tuple[int, float | None]] = ()) -> None:
+        self._indexed = dict(tasks)
+        keys = sorted((done_date, task_id) for task_id, done_date in self._indexed.items() if done_date)
+        self._blocks = [keys[i:i + LOAD] for i in range(0, len(keys), LOAD)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._size = len(keys)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, task_id: int, done_date: float | None) -> None:
+        self._indexed[task_id] = done_date
+        if not done_date:
+            return
+        key = (done_date, task_id)
+        self._size += 1
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            return
+        index = bisect_left(self._maxes, key)
+        if index == len(self._blocks):
+            # ключ больше всех: в конец последнего блока
+            index -= 1
+            self._blocks[index].append(key)
+            self._maxes[index] = key
+        else:
+            insort(self._blocks[index], key)
+        block = self._blocks[index]
+        if len(block) > LOAD * 2:
+            self._blocks[index:index + 1] = [block[:LOAD], block[LOAD:]]
+            self._maxes[index:index + 1] = [block[LOAD - 1], block[-1]]
+
+    def remove(self, task_id: int) -> None:
+        done_date = self._indexed.pop(task_id)
+        if not done_date:
+            return
+        key = (done_date, task_id)
+        index = bisect_left(self._maxes, key)
+        block = self._blocks[index] if index < len(self._blocks) else []
+        position = bisect_left(block, key)
+        if position == len(block) or block[position] != key:
+            raise KeyError(task_id)
+        del block[position]
+        self._size -= 1
+        if not block:
+            del self._blocks[index]
+            del self._maxes[index]
+        elif position == len(block):
+            self._maxes[index] = block[-1]
+
+    def between(self, start: float | None = None, end: float | None = None) -> Iterator[int]:
+        # id задач с start <= done_date < end в порядке done_date; None - без границы.
+        # (start,) меньше любого ключа (start, id), поэтому bisect_left находит первый ключ с done_date >= start
+        blocks = self._blocks
+        index = bisect_left(self._maxes, (start,)) if start is not None else 0
+        position = bisect_left(blocks[index], (start,)) if start is not None and index < len(blocks) else 0
+        while index < len(blocks):
+            block = blocks[index]
+            for done_date, task_id in block[position:]:
+                if end is not None and done_date >= end:
+                    return
+                yield task_id
+            index += 1
+            position = 0
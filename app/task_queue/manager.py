@@ -1,47 +1,252 @@
 import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from enum import StrEnum
 
+from .array_queue import ArrayTaskQueue
 from .node import TaskNode
-from .persistence import PersistenceManager
+from .persistence import Durability, PersistenceManager
 from .queue import TaskQueue
+from .storage import StorageBackend
+
+
+class QueueEngine(StrEnum):
+    # LINKED - связный список объектов TaskNode, ARRAY - параллельные типизированные массивы (ArrayTaskQueue):
+    # в несколько раз меньше памяти на задачу, для очень больших очередей
+    LINKED = 'linked'
+    ARRAY = 'array'
+
+
+ENGINES: dict[QueueEngine, type[TaskQueue]] = {
+    QueueEngine.LINKED: TaskQueue,
+    QueueEngine.ARRAY: ArrayTaskQueue,
+}
 
 
 class QueueManager:
+    # Резидентные очереди и время последнего обращения к ним (по нему - LRU). Остывшие очереди выгружаются:
+    # снапшот на диск, объект из памяти вон; в _evicted остаются только их уровень долговечности и движок,
+    # и get_queue прозрачно поднимает такую очередь заново.
+    # Блокировки: get_queue для резидентной очереди не берёт ни одной - это одно чтение dict.
+    # Создание, удаление и подъём очереди идут под блокировкой её полосы (_stripes по employer_id),
+    # поэтому восстановление с диска одного employer'а не держит остальных. Выгрузка чужих очередей
+    # (_enforce) идёт под _evict_lock и пропускает очереди, чья полоса сейчас занята.
     _queues: dict[int, TaskQueue] = {}
-    _lock = threading.Lock()
+    _evicted: dict[int, tuple[Durability, QueueEngine]] = {}
+    _access: dict[int, float] = {}
+    _stripes = [threading.RLock() for _ in range(64)]
+    _evict_lock = threading.Lock()
+    # бэкенд хранения очередей: PersistenceManager (файлы) или SqliteStorage
+    storage: StorageBackend = PersistenceManager
+    # движок очередей, для которых он не указан явно
+    engine: QueueEngine = QueueEngine.LINKED
+    # memory_budget - сколько задач всего могут держать резидентные очереди, idle_timeout - через сколько
+    # секунд без обращений очередь выгружается; None отключает ограничение.
+    memory_budget: int | None = None
+    idle_timeout: float | None = None
+    # счётчики для статистики, обновляются без блокировки: под нагрузкой часть инкрементов может потеряться
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    # Тёплый старт: очереди из base_path восстанавливаются параллельно ещё до запросов клиентов.
+    # Восстановленная очередь ждёт в _warm, пока её не заберёт create_queue. ready сброшен,
+    # пока идёт тёплый старт; recovery_timings - время восстановления каждой очереди в секундах.
+    _warm: dict[int, Future[TaskQueue]] = {}
+    ready = threading.Event()
+    ready.set()
+    recovery_timings: dict[int, float] = {}
+
+    @classmethod
+    def _stripe(cls, employer_id: int) -> threading.RLock:
+        return cls._stripes[employer_id % len(cls._stripes)]
 
     @classmethod
     def get_queue(cls, employer_id: int) -> TaskQueue:
-        with cls._lock:
-            queue = cls._queues.get(employer_id, None)
-            if queue is None:
-                raise ValueError(f"No queue for employer_id {employer_id}")
+        queue = cls._queues.get(employer_id)
+        if queue is not None:
+            cls.hits += 1
+            cls._touch(employer_id)
             return queue
+        with cls._stripe(employer_id):
+            # пока ждали полосу, очередь мог поднять другой поток
+            queue = cls._queues.get(employer_id)
+            if queue is not None:
+                cls.hits += 1
+                cls._touch(employer_id)
+                return queue
+            if employer_id not in cls._evicted:
+                raise ValueError(f"No queue for employer_id {employer_id}")
+            cls.misses += 1
+            queue = cls._load_queue(employer_id, *cls._evicted[employer_id])
+            del cls._evicted[employer_id]
+            cls._admit(employer_id, queue)
+        cls._enforce(keep=employer_id)
+        return queue
 
     @classmethod
-    def create_queue(cls, employer_id: int) -> TaskQueue:
-        with cls._lock:
-            if employer_id in cls._queues:
+    def create_queue(
+        cls, employer_id: int, durability: Durability | None = None, engine: QueueEngine | None = None,
+    ) -> TaskQueue:
+        with cls._stripe(employer_id):
+            if employer_id in cls._queues or employer_id in cls._evicted:
                 raise ValueError(f"Queue for employer_id {employer_id} already exists")
-            queue = TaskQueue(employer_id)
-            tasks = PersistenceManager.recover(employer_id)
-            prev = None
-            for data in tasks:
-                node = TaskNode(data['id'], data['duration'], data['done_date'])
-                queue.add_task(node, prev_task=prev, log=False)
-                prev = node
-            cls._queues[employer_id] = queue
+            warm = cls._warm.pop(employer_id, None)
+            queue = cls._adopt(warm) if warm is not None else None
+            # тёплая очередь поднята с движком и долговечностью по умолчанию; если просят другие - поднимаем заново
+            if (
+                queue is None
+                or (engine is not None and type(queue) is not ENGINES[engine])
+                or (durability is not None and queue.durability is not durability)
+            ):
+                queue = cls._load_queue(employer_id, durability, engine)
+            cls._admit(employer_id, queue)
+        cls._enforce(keep=employer_id)
+        return queue
+
+    @classmethod
+    def _touch(cls, employer_id: int) -> None:
+        # get_queue читает _queues без блокировки, и очередь могли выгрузить до этой записи:
+        # время обращения к уже выгруженной очереди в _access не оставляем
+        cls._access[employer_id] = time.monotonic()
+        if employer_id not in cls._queues:
+            cls._access.pop(employer_id, None)
+
+    @classmethod
+    def _admit(cls, employer_id: int, queue: TaskQueue) -> None:
+        # время обращения - раньше самой очереди: _enforce не должен увидеть очередь без него
+        cls._access[employer_id] = time.monotonic()
+        cls._queues[employer_id] = queue
+
+    @classmethod
+    def _enforce(cls, keep: int | None = None) -> None:
+        # выгружает с холодного конца LRU сначала простаивающие очереди,
+        # затем - пока резидентные задачи не уложатся в memory_budget
+        if cls.idle_timeout is None and cls.memory_budget is None:
+            return
+        with cls._evict_lock:
+            # копии - резидентные очереди меняются под полосами параллельно с обходом
+            queues = list(cls._queues.items())
+            queues.sort(key=lambda item: cls._access.get(item[0], float('inf')))
+            if cls.idle_timeout is not None:
+                deadline = time.monotonic() - cls.idle_timeout
+                for employer_id, _ in queues:
+                    if cls._access.get(employer_id, float('inf')) <= deadline and employer_id != keep:
+                        cls._evict(employer_id)
+            if cls.memory_budget is None:
+                return
+            queues = [(employer_id, queue) for employer_id, queue in queues if employer_id in cls._queues]
+            resident = sum(len(queue) for _, queue in queues)
+            for employer_id, queue in queues:
+                if resident <= cls.memory_budget:
+                    break
+                if employer_id == keep:
+                    continue
+                size = len(queue)
+                if cls._evict(employer_id):
+                    resident -= size
+
+    @classmethod
+    def _evict(cls, employer_id: int) -> bool:
+        # вызывается под _evict_lock; очередь с занятой полосой пропускаем - ждать её нельзя,
+        # держатель полосы сам может ждать _evict_lock
+        stripe = cls._stripe(employer_id)
+        if not stripe.acquire(blocking=False):
+            return False
+        try:
+            queue = cls._queues.get(employer_id)
+            # очередь без диска выгрузить нельзя - её нечем будет поднять
+            if queue is None or queue.durability is Durability.MEMORY:
+                return False
+            del cls._queues[employer_id]
+            cls._access.pop(employer_id, None)
+            # Новые обращения уже идут через полосу и поднимут очередь заново; те, кто успел взять объект,
+            # либо закончат изменение до retire и попадут в снапшот выгрузки, либо получат QueueRetiredError.
+            # Блокировку очереди retire не держит: снапшот выгрузки снимается под её чтением.
+            queue.retire()
+            cls.storage.unload(employer_id)
+            cls._evicted[employer_id] = queue.durability, cls._engine_of(queue)
+            cls.evictions += 1
+            return True
+        finally:
+            stripe.release()
+
+    @classmethod
+    def evict_idle(cls) -> None:
+        cls._enforce()
+
+    @staticmethod
+    def _engine_of(queue: TaskQueue) -> QueueEngine:
+        return next(engine for engine, queue_class in ENGINES.items() if type(queue) is queue_class)
+
+    @classmethod
+    def _load_queue(
+        cls, employer_id: int, durability: Durability | None = None, engine: QueueEngine | None = None,
+    ) -> TaskQueue:
+        queue = ENGINES[engine or cls.engine](employer_id, durability, cls.storage)
+        tasks = cls.storage.recover(employer_id) if queue.durability is not Durability.MEMORY else []
+        prev = None
+        for data in tasks:
+            node = TaskNode(data['id'], data['duration'], data['done_date'])
+            queue.add_task(node, prev_task=prev, log=False)
+            prev = node
+        if queue.durability is not Durability.MEMORY:
+            cls.storage.attach(employer_id, queue.capture)
+        return queue
+
+    @staticmethod
+    def _adopt(warm: Future[TaskQueue]) -> TaskQueue | None:
+        # если тёплое восстановление упало, очередь восстанавливается заново обычным путём
+        try:
+            return warm.result()
+        except Exception:
+            return None
+
+    @classmethod
+    def warm_start(cls, durability: Durability | None = None, workers: int = 4) -> dict[int, float]:
+        if (durability or cls.storage.durability) is Durability.MEMORY:
+            return {}
+        cls.ready.clear()
+        timings: dict[int, float] = {}
+
+        def recover(employer_id: int) -> TaskQueue:
+            started = time.perf_counter()
+            queue = cls._load_queue(employer_id, durability)
+            timings[employer_id] = time.perf_counter() - started
             return queue
 
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for employer_id in cls.storage.stored_employers():
+                    with cls._stripe(employer_id):
+                        if employer_id not in cls._queues and employer_id not in cls._warm:
+                            cls._warm[employer_id] = executor.submit(recover, employer_id)
+        finally:
+            cls.recovery_timings = timings
+            cls.ready.set()
+        return timings
+
     @classmethod
     def delete_queue(cls, employer_id: int) -> None:
-        with cls._lock:
-            if employer_id not in cls._queues:
+        with cls._stripe(employer_id):
+            if employer_id not in cls._queues and employer_id not in cls._evicted:
                 raise ValueError(f"No queue for employer_id {employer_id}")
-            del cls._queues[employer_id]
-            PersistenceManager.clear(employer_id)
+            cls._queues.pop(employer_id, None)
+            cls._access.pop(employer_id, None)
+            cls._evicted.pop(employer_id, None)
+            cls.storage.clear(employer_id)
 
     @classmethod
     def clear(cls) -> None:
-        with cls._lock:
+        with ExitStack() as stack:
+            for stripe in cls._stripes:
+                stack.enter_context(stripe)
             cls._queues.clear()
-            PersistenceManager.clear()
+            cls._access.clear()
+            cls._evicted.clear()
+            cls.hits = cls.misses = cls.evictions = 0
+            # дожидаемся начатых восстановлений, чтобы они не писали в уже очищенный base_path
+            for warm in cls._warm.values():
+                warm.exception()
+            cls._warm.clear()
+            cls.storage.clear()
@@ -2,13 +2,19 @@ from typing import Optional
 
 
 class TaskNode:
-    prev: Optional['TaskNode'] = None
-    next: Optional['TaskNode'] = None
+    # __slots__ вместо __dict__: в очередях миллионы узлов, без словаря на экземпляр узел занимает
+    # в несколько раз меньше памяти. Значения по умолчанию поэтому задаются в __init__, а не на классе.
+    __slots__ = ('prev', 'next', 'id', 'duration', 'done_date')
+
+    prev: Optional['TaskNode']
+    next: Optional['TaskNode']
     id: int
-    duration: Optional[float] = None
-    done_date: Optional[float] = None
+    duration: Optional[float]
+    done_date: Optional[float]
 
     def __init__(self, task_id: int, duration: float, done_date: float | None = None) -> None:
+        self.prev = None
+        self.next = None
         self.id = task_id
         self.duration = duration
         self.done_date = done_date if done_date else 0
@@ -1,152 +1,776 @@
-import json
+import heapq
+import os
 import queue
 import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from enum import StrEnum
 from pathlib import Path
 from typing import Any
 
+import structlog
+
+from .snapshot import decode_snapshot, encode_snapshot
+from .wal import LogWriter, convert_log, encode_op, is_legacy_log, iter_records, read_header, segment_files
+
+logger = structlog.get_logger('PersistenceManager')
+
+
+class Durability(StrEnum):
+    # Гарантии на момент возврата из мутации TaskQueue:
+    # MEMORY      - на диск ничего не пишется, очередь теряется при любом перезапуске;
+    # ASYNC       - запись буферизуется и уходит фоновым групповым коммитом без fsync,
+    #               при падении процесса теряются операции за последние group_commit_window секунд,
+    #               при падении ОС - всё, что не успело дойти из page cache до диска;
+    # GROUP_FSYNC - мутация ждёт, пока её запись попадёт в лог и будет fsync'нута вместе с записями
+    #               других клиентов, пришедшими за это время; переживает падение процесса и ОС;
+    # FSYNC       - каждая запись пишется и fsync'ается отдельно, прямо под блокировкой очереди:
+    #               гарантии как у GROUP_FSYNC, но без группировки и с самой низкой пропускной способностью.
+    MEMORY = 'memory'
+    ASYNC = 'async'
+    GROUP_FSYNC = 'group_fsync'
+    FSYNC = 'fsync'
+
+
+class SnapshotMode(StrEnum):
+    # Откуда берётся состояние очереди для снапшота (.bac):
+    # SHADOW  - пул держит теневую копию каждой очереди (TaskChain) и проигрывает в неё операции лога;
+    #           не требует ничего от TaskQueue, но удваивает память;
+    # CAPTURE - теневой копии нет, под короткой блокировкой живой очереди снимается список кортежей
+    #           (id, duration, done_date), сериализация идёт уже без блокировки;
+    # FORK    - теневой копии нет, под блокировкой очереди делается os.fork(), дочерний процесс
+    #           сериализует copy-on-write копию живой очереди (как BGSAVE в Redis); блокировка держится
+    #           только на время fork(). Где fork недоступен, работает как CAPTURE.
+    SHADOW = 'shadow'
+    CAPTURE = 'capture'
+    FORK = 'fork'
+
+
+# Источник снапшота живой очереди: вызывает переданную функцию под своей блокировкой
+# с задачами (id, duration, done_date) в порядке очереди и LSN последней залогированной операции.
+SnapshotSource = Callable[[Callable[[Iterator[tuple[int, float, float]], int | None], Any]], Any]
+
+
+class ChainNode:
+    __slots__ = ('task', 'prev', 'next')
+
+    def __init__(self, task: dict[str, Any]) -> None:
+        self.task = task
+        self.prev: ChainNode | None = None
+        self.next: ChainNode | None = None
+
+
+class TaskChain:
+    # Теневая копия очереди для проигрывания лога: та же раскладка, что у TaskQueue
+    # (двусвязный список + индекс по id), поэтому каждая операция лога стоит O(1).
+    _index: dict[int, ChainNode]
+    _first: ChainNode | None
+    _last: ChainNode | None
+
+    def __init__(self, tasks: list[dict[str, Any]] | None = None) -> None:
+        self._index = {}
+        self._first = None
+        self._last = None
+        for task in tasks or ():
+            self.add(task)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _link_after(self, node: ChainNode, prev: ChainNode | None) -> None:
+        node.prev = prev
+        node.next = prev.next if prev else self._first
+        if node.next:
+            node.next.prev = node
+        else:
+            self._last = node
+        if prev:
+            prev.next = node
+        else:
+            self._first = node
+
+    def _unlink(self, node: ChainNode) -> None:
+        if node.prev:
+            node.prev.next = node.next
+        else:
+            self._first = node.next
+        if node.next:
+            node.next.prev = node.prev
+        else:
+            self._last = node.prev
+        node.prev = node.next = None
+
+    def add(self, task: dict[str, Any], prev_id: int | None = None) -> None:
+        if task['id'] in self._index:
+            return
+        node = ChainNode(task)
+        self._index[task['id']] = node
+        # как и TaskQueue, без предыдущей задачи (или если её нет) добавляем в конец
+        prev = self._index.get(prev_id) if prev_id is not None else None
+        self._link_after(node, prev or self._last)
+
+    def delete(self, task_id: int) -> None:
+        node = self._index.pop(task_id, None)
+        if node is not None:
+            self._unlink(node)
+
+    def update(self, task: dict[str, Any]) -> None:
+        node = self._index.get(task['id'])
+        if node is not None:
+            node.task.update(task)
+
+    def move(self, task_id: int, prev_id: int | None = None) -> None:
+        node = self._index.get(task_id)
+        if node is None:
+            return
+        self._unlink(node)
+        if prev_id is None:
+            self._link_after(node, None)
+            return
+        prev = self._index.get(prev_id) if prev_id != task_id else None
+        self._link_after(node, prev or self._last)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        node = self._first
+        while node:
+            yield node.task
+            node = node.next
+
+    def to_list(self) -> list[dict[str, Any]]:
+        return list(self)
+
+    def apply(self, op: dict[str, Any]) -> None:
+        action = op['action']
+        if action == 'add':
+            self.add(op['task'], op.get('prev'))
+        elif action == 'delete':
+            self.delete(op['task_id'])
+        elif action == 'update':
+            self.update(op['task'])
+        elif action == 'move':
+            self.move(op['task_id'], op.get('prev'))
+        elif action == 'batch':
+            for sub in op['ops']:
+                self.apply(sub)
+
+
+def _op_task_id(op: dict[str, Any]) -> int:
+    return op['task']['id'] if op['action'] in ('add', 'update') else op['task_id']
+
+
+def coalesce_ops(ops: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    # Сворачивает подряд идущие операции над одной задачей так, что проигрывание результата в TaskChain
+    # даёт ту же очередь, что и проигрывание исходной пачки:
+    # - из нескольких update задачи остаётся последний, update сразу после add вливается в add;
+    # - из нескольких move задачи остаётся последний, если между ними никто не встаёт после неё (prev);
+    # - add и delete одной задачи выпадают вместе со всем, что было с ней между ними,
+    #   если в этом промежутке на неё никто не ссылался как на prev.
+    # Пакетные записи (batch) разворачиваются во вложенные операции: проигрывание от этого не меняется.
+    # Пачка просматривается с конца: для каждой задачи помним, что с ней будет дальше.
+    ops = [sub for op in ops for sub in (op['ops'] if op['action'] == 'batch' else (op,))]
+    keep = [True] * len(ops)
+    replaced: dict[int, dict[str, Any]] = {}
+    later_update: dict[int, int] = {}
+    later_move: set[int] = set()
+    # задача удаляется дальше по пачке: индекс delete и индексы её операций после add
+    later_delete: dict[int, list[int]] = {}
+    for index in range(len(ops) - 1, -1, -1):
+        op = ops[index]
+        action = op['action']
+        task_id = _op_task_id(op)
+        if action == 'delete':
+            later_update.pop(task_id, None)
+            later_move.discard(task_id)
+            later_delete[task_id] = [index]
+        elif action == 'update':
+            if task_id in later_update:
+                keep[index] = False
+            else:
+                later_update[task_id] = index
+            if task_id in later_delete:
+                later_delete[task_id].append(index)
+        elif action == 'move':
+            if task_id in later_move:
+                keep[index] = False
+            else:
+                later_move.add(task_id)
+            if task_id in later_delete:
+                later_delete[task_id].append(index)
+        elif action == 'add':
+            dropped = later_delete.pop(task_id, None)
+            if dropped is not None:
+                for dropped_index in (index, *dropped):
+                    keep[dropped_index] = False
+            elif task_id in later_update:
+                update = later_update[task_id]
+                keep[update] = False
+                replaced[index] = {**op, 'task': {**op['task'], **ops[update]['task']}}
+            later_update.pop(task_id, None)
+            later_move.discard(task_id)
+        prev = op.get('prev') if action in ('add', 'move') else None
+        if prev is not None:
+            # на задачу prev сейчас опираются, её положение до этой операции важно
+            later_move.discard(prev)
+            later_delete.pop(prev, None)
+    return [replaced.get(index, op) for index, op in enumerate(ops) if keep[index]]
+
+
+class SnapshotState:
+    # Теневое состояние одного employer'а в общем пуле снапшотов. Все поля, кроме tasks/offset/pending,
+    # меняются под lock; tasks/offset/pending трогает только поток пула, держащий employer'а (busy).
+    def __init__(self, tasks: TaskChain | None = None, offset: int = 0) -> None:
+        self.backlog: deque[tuple[dict[str, Any], int]] = deque()
+        self.tasks = tasks
+        self.offset = offset
+        self.pending = 0
+        self.deadline = 0.0
+        # scheduled - employer стоит в очереди пула или обрабатывается; гарантирует, что его операции
+        # применяет не больше одного потока за раз и строго в порядке лога
+        self.scheduled = False
+        self.busy = False
+        self.closed = False
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+
 
 class PersistenceManager:
     base_path = Path('storage')
-    _queues: dict[int, 'queue.Queue[dict]'] = {}
-    _workers: dict[int, threading.Thread] = {}
-    _locks: dict[int, threading.Lock] = {}
+    # Файлы employer'а лежат в шарде base_path/<employer_id % shard_count в hex>, чтобы ни один каталог
+    # не разрастался до сотен тысяч записей. Созданные каталоги запоминаются в _dirs, поэтому mkdir и
+    # exists не вызываются на каждую операцию. shard_count нельзя менять у существующего хранилища.
+    # Файлы старой плоской раскладки переносятся в шарды при первом обращении к base_path.
+    shard_count: int = 256
+    _dirs: set[Path] = set()
+    _dirs_lock = threading.Lock()
+    # Снапшот (.bac) пишется не на каждую операцию, а раз в snapshot_every_ops операций
+    # или не позже чем через snapshot_interval секунд после первой несохранённой операции.
+    # Между снапшотами долговечность обеспечивает append-only .log,
+    # восстановление - это снапшот плюс проигрывание хвоста лога после .offset.
+    snapshot_every_ops: int = 1000
+    snapshot_interval: float = 5.0
+    # Лог пишется через открытый LogWriter с групповым коммитом: записи, пришедшие в течение
+    # group_commit_window, сбрасываются на диск одним write (и одним fsync для уровней с fsync).
+    # Уровень долговечности задаётся на employer'а (см. Durability), durability - значение по умолчанию.
+    group_commit_window: float = 0.005
+    # Лог режется на сегменты по segment_size байт. Закрытые сегменты, целиком покрытые снапшотом,
+    # удаляются (или переносятся в archive_path), так что размер лога на диске и время восстановления
+    # зависят от размера очереди, а не от её возраста.
+    segment_size: int = 64 * 1024 * 1024
+    archive_path: Path | None = None
+    durability: Durability = Durability.ASYNC
+    snapshot_mode: SnapshotMode = SnapshotMode.SHADOW
+    # кодек сжатия снапшотов (см. snapshot.register_codec); None - прежний чистый JSON без заголовка
+    snapshot_codec: str | None = None
+    _sources: dict[int, SnapshotSource] = {}
+    _durability: dict[int, Durability] = {}
+    # Теневые копии всех employer'ов обслуживает общий пул из pool_size потоков. Готовые к работе
+    # employer'ы стоят в одной FIFO-очереди, поток берёт не больше pool_batch операций одного employer'а
+    # и ставит его в конец очереди, так что шумный employer не задерживает снапшоты остальных.
+    pool_size: int = 4
+    pool_batch: int = 256
+    _states: dict[int, SnapshotState] = {}
+    _states_lock = threading.Lock()
+    _ready: 'queue.Queue[int]' = queue.Queue()
+    _pool: list[threading.Thread] = []
+    _pool_lock = threading.Lock()
+    _deadlines: list[tuple[float, int]] = []
+    _deadlines_cond = threading.Condition()
+    _writers: dict[int, LogWriter] = {}
+    _writers_lock = threading.Lock()
+    _dirty: set[int] = set()
+    _dirty_lock = threading.Lock()
+    _commit_event = threading.Event()
+    _committer: threading.Thread | None = None
+
+    @classmethod
+    def _shard_dir(cls, base: Path, employer_id: int) -> Path:
+        return base / f'{employer_id % cls.shard_count:02x}'
+
+    @classmethod
+    def _base_dir(cls) -> Path:
+        base = cls.base_path
+        if base not in cls._dirs:
+            with cls._dirs_lock:
+                if base not in cls._dirs:
+                    base.mkdir(parents=True, exist_ok=True)
+                    cls._migrate_layout(base)
+                    cls._dirs.add(base)
+        return base
+
+    @classmethod
+    def _migrate_layout(cls, base: Path) -> None:
+        # <id>.log, <id>.<LSN>.log, <id>.bac, <id>.offset из корня base_path переезжают в свой шард
+        for file in base.iterdir():
+            if not file.is_file():
+                continue
+            try:
+                employer_id = int(file.name.split('.', 1)[0])
+            except ValueError:
+                continue
+            shard = cls._shard_dir(base, employer_id)
+            shard.mkdir(exist_ok=True)
+            os.replace(file, shard / file.name)
+
+    @classmethod
+    def _employer_dir(cls, employer_id: int) -> Path:
+        directory = cls._shard_dir(cls._base_dir(), employer_id)
+        if directory not in cls._dirs:
+            with cls._dirs_lock:
+                directory.mkdir(exist_ok=True)
+                cls._dirs.add(directory)
+        return directory
 
     @classmethod
     def _log_file(cls, employer_id: int) -> Path:
-        cls.base_path.mkdir(exist_ok=True)
-        return cls.base_path / f'{employer_id}.log'
+        return cls._employer_dir(employer_id) / f'{employer_id}.log'
 
     @classmethod
     def _backup_file(cls, employer_id: int) -> Path:
-        cls.base_path.mkdir(exist_ok=True)
-        return cls.base_path / f'{employer_id}.bac'
+        return cls._employer_dir(employer_id) / f'{employer_id}.bac'
 
     @classmethod
     def _offset_file(cls, employer_id: int) -> Path:
-        cls.base_path.mkdir(exist_ok=True)
-        return cls.base_path / f'{employer_id}.offset'
+        return cls._employer_dir(employer_id) / f'{employer_id}.offset'
 
     @classmethod
     def _get_offset(cls, employer_id: int) -> int:
-        file = cls._offset_file(employer_id)
-        return int(file.read_text()) if file.exists() else 0
+        try:
+            return int(cls._offset_file(employer_id).read_text())
+        except FileNotFoundError:
+            return 0
 
     @classmethod
     def _set_offset(cls, employer_id: int, value: int) -> None:
-        cls._offset_file(employer_id).write_text(str(value))
+        cls._replace_file(cls._offset_file(employer_id), str(value))
+
+    @staticmethod
+    def _replace_file(file: Path, data: str | bytes) -> None:
+        # пишем во временный файл и атомарно подменяем, чтобы сбой посреди записи не испортил снапшот
+        tmp = file.with_name(file.name + '.tmp')
+        if isinstance(data, bytes):
+            tmp.write_bytes(data)
+        else:
+            tmp.write_text(data)
+        os.replace(tmp, file)
 
     @classmethod
     def _load_backup(cls, employer_id: int) -> list[dict[str, Any]]:
-        file = cls._backup_file(employer_id)
-        if not file.exists():
+        try:
+            return decode_snapshot(cls._backup_file(employer_id).read_bytes())
+        except FileNotFoundError:
             return []
-        return json.loads(file.read_text())
 
     @classmethod
     def _write_backup(cls, employer_id: int, tasks: list[dict[str, Any]]) -> None:
-        cls._backup_file(employer_id).write_text(json.dumps(tasks))
+        cls._replace_file(cls._backup_file(employer_id), encode_snapshot(tasks, cls.snapshot_codec))
 
     @classmethod
-    def _apply_op(cls, tasks: list[dict[str, Any]], op: dict[str, Any]) -> None:
-        action = op['action']
-        if action == 'add':
-            task = op['task']
-            prev = op.get('prev')
-            if prev is None:
-                tasks.append(task)
-            else:
-                idx = next((i for i, t in enumerate(tasks) if t['id'] == prev), len(tasks) - 1)
-                tasks.insert(idx + 1, task)
-        elif action == 'delete':
-            tid = op['task_id']
-            tasks[:] = [t for t in tasks if t['id'] != tid]
-        elif action == 'update':
-            task = op['task']
-            for t in tasks:
-                if t['id'] == task['id']:
-                    t.update(task)
-        elif action == 'move':
-            tid = op['task_id']
-            prev = op.get('prev')
-            task = next((t for t in tasks if t['id'] == tid), None)
-            if task:
-                tasks[:] = [t for t in tasks if t['id'] != tid]
-                if prev is None:
-                    tasks.insert(0, task)
-                else:
-                    idx = next((i for i, t in enumerate(tasks) if t['id'] == prev), len(tasks) - 1)
-                    tasks.insert(idx + 1, task)
-
-    @classmethod
-    def log(cls, employer_id: int, op: dict[str, Any]) -> None:
+    def _apply_op(cls, tasks: 'TaskChain', op: dict[str, Any]) -> None:
+        tasks.apply(op)
+
+    @classmethod
+    def _writer(cls, employer_id: int) -> LogWriter:
+        writer = cls._writers.get(employer_id)
+        if writer is None:
+            with cls._writers_lock:
+                writer = cls._writers.get(employer_id)
+                if writer is None:
+                    fsync = cls.get_durability(employer_id) in (Durability.GROUP_FSYNC, Durability.FSYNC)
+                    writer = LogWriter(cls._open_log(employer_id), fsync=fsync, segment_size=cls.segment_size)
+                    cls._writers[employer_id] = writer
+        return writer
+
+    @classmethod
+    def _open_log(cls, employer_id: int) -> Path:
+        # лог, оставшийся от JSON-формата, переводим в бинарный до первой записи или чтения
         log_file = cls._log_file(employer_id)
-        with log_file.open('a', encoding='utf-8') as f:
-            f.write(json.dumps(op) + '\n')
-        cls._ensure_worker(employer_id)
-        cls._queues[employer_id].put(op)
+        if log_file.exists() and is_legacy_log(log_file):
+            # старый .offset считал строки, новый хранит байтовую позицию в логе
+            _, position = convert_log(log_file, cls._get_offset(employer_id))
+            if cls._offset_file(employer_id).exists():
+                cls._set_offset(employer_id, position)
+        return log_file
 
     @classmethod
-    def _ensure_worker(cls, employer_id: int) -> None:
-        if employer_id in cls._workers:
+    def _close_writer(cls, employer_id: int) -> None:
+        writer = cls._writers.pop(employer_id, None)
+        if writer is not None:
+            writer.close()
+
+    @classmethod
+    def _commit(cls, employer_id: int) -> None:
+        writer = cls._writers.get(employer_id)
+        if writer is not None:
+            writer.commit()
+
+    @classmethod
+    def _release(cls, employer_id: int, offset: int) -> None:
+        writer = cls._writers.get(employer_id)
+        if writer is not None:
+            writer.release(offset, cls.archive_path)
+
+    @classmethod
+    def _schedule_commit(cls, employer_id: int) -> None:
+        with cls._dirty_lock:
+            cls._dirty.add(employer_id)
+            if cls._committer is None:
+                cls._committer = threading.Thread(target=cls._commit_loop, daemon=True)
+                cls._committer.start()
+        cls._commit_event.set()
+
+    @classmethod
+    def _commit_loop(cls) -> None:
+        while True:
+            cls._commit_event.wait()
+            # копим записи в течение окна, чтобы сбросить их одной группой
+            time.sleep(cls.group_commit_window)
+            cls._commit_event.clear()
+            with cls._dirty_lock:
+                dirty, cls._dirty = cls._dirty, set()
+            for employer_id in dirty:
+                cls._commit(employer_id)
+
+    @classmethod
+    def get_durability(cls, employer_id: int) -> Durability:
+        return cls._durability.get(employer_id, cls.durability)
+
+    @classmethod
+    def set_durability(cls, employer_id: int, durability: Durability) -> None:
+        cls._durability[employer_id] = durability
+        writer = cls._writers.get(employer_id)
+        if writer is not None:
+            writer.fsync = durability in (Durability.GROUP_FSYNC, Durability.FSYNC)
+
+    @classmethod
+    def log(cls, employer_id: int, op: dict[str, Any]) -> int:
+        writer = cls._writer(employer_id)
+        lsn = writer.append(encode_op(op))
+        if cls.get_durability(employer_id) is Durability.FSYNC:
+            writer.wait(lsn)
+        else:
+            cls._schedule_commit(employer_id)
+        cls._enqueue(employer_id, (op, lsn))
+        return lsn
+
+    @classmethod
+    def wait(cls, employer_id: int, lsn: int) -> None:
+        if cls.get_durability(employer_id) is not Durability.GROUP_FSYNC:
+            return
+        writer = cls._writers.get(employer_id)
+        if writer is not None:
+            writer.wait(lsn)
+
+    @classmethod
+    def backlog(cls) -> dict[int, int]:
+        # глубина очереди неприменённых операций по employer'ам (только непустые)
+        return {employer_id: depth for employer_id, state in list(cls._states.items())
+                if (depth := len(state.backlog))}
+
+    @classmethod
+    def _state(cls, employer_id: int) -> SnapshotState:
+        state = cls._states.get(employer_id)
+        if state is None:
+            with cls._states_lock:
+                state = cls._states.setdefault(employer_id, SnapshotState())
+        return state
+
+    @classmethod
+    def _enqueue(cls, employer_id: int, item: tuple[dict[str, Any], int]) -> None:
+        while True:
+            state = cls._state(employer_id)
+            with state.lock:
+                # закрытое состояние уже убрано из _states, следующая итерация создаст новое
+                if state.closed:
+                    continue
+                state.backlog.append(item)
+                if state.scheduled:
+                    return
+                state.scheduled = True
+            break
+        cls._ensure_pool()
+        cls._ready.put(employer_id)
+
+    @classmethod
+    def _wake(cls, employer_id: int) -> None:
+        state = cls._states.get(employer_id)
+        if state is None:
+            return
+        with state.lock:
+            if state.scheduled or state.closed:
+                # поток, держащий employer'а, сам проверит дедлайн после своей пачки
+                return
+            state.scheduled = True
+        cls._ready.put(employer_id)
+
+    @classmethod
+    def _ensure_pool(cls) -> None:
+        if cls._pool:
             return
-        q: 'queue.Queue[dict]' = queue.Queue()
-        cls._queues[employer_id] = q
-        lock = threading.Lock()
-        cls._locks[employer_id] = lock
-
-        def worker() -> None:
-            tasks = cls._load_backup(employer_id)
-            offset = cls._get_offset(employer_id)
+        with cls._pool_lock:
+            if cls._pool:
+                return
+            threads = [threading.Thread(target=cls._pool_loop, daemon=True) for _ in range(cls.pool_size)]
+            threads.append(threading.Thread(target=cls._deadline_loop, daemon=True))
+            for thread in threads:
+                thread.start()
+            cls._pool = threads
+
+    @classmethod
+    def _pool_loop(cls) -> None:
+        while True:
+            employer_id = cls._ready.get()
+            state = cls._states.get(employer_id)
+            if state is not None:
+                cls._process(employer_id, state)
+
+    @classmethod
+    def _deadline_loop(cls) -> None:
+        # снапшоты по snapshot_interval для employer'ов, к которым перестали приходить операции
+        with cls._deadlines_cond:
             while True:
-                op = q.get()
-                if op is None:
-                    break
-                cls._apply_op(tasks, op)
-                with lock:
-                    cls._write_backup(employer_id, tasks)
-                    offset += 1
-                    cls._set_offset(employer_id, offset)
-                q.task_done()
+                if not cls._deadlines:
+                    cls._deadlines_cond.wait()
+                    continue
+                delay = cls._deadlines[0][0] - time.monotonic()
+                if delay > 0:
+                    cls._deadlines_cond.wait(delay)
+                    continue
+                _, employer_id = heapq.heappop(cls._deadlines)
+                cls._wake(employer_id)
+
+    @classmethod
+    def _schedule_deadline(cls, employer_id: int, deadline: float) -> None:
+        with cls._deadlines_cond:
+            heapq.heappush(cls._deadlines, (deadline, employer_id))
+            cls._deadlines_cond.notify()
+
+    @classmethod
+    def _process(cls, employer_id: int, state: SnapshotState) -> None:
+        with state.lock:
+            if state.closed:
+                return
+            state.busy = True
+            batch = [state.backlog.popleft() for _ in range(min(len(state.backlog), cls.pool_batch))]
+        try:
+            cls._apply_batch(employer_id, state, batch)
+        except Exception:
+            logger.exception("snapshot failed", employer_id=employer_id)
+        finally:
+            with state.lock:
+                state.busy = False
+                requeue = bool(state.backlog) and not state.closed
+                if not requeue:
+                    state.scheduled = False
+                    state.idle.notify_all()
+            if requeue:
+                cls._ready.put(employer_id)
+
+    @classmethod
+    def attach(cls, employer_id: int, source: SnapshotSource) -> None:
+        # в режимах CAPTURE/FORK снапшот снимается с живой очереди, а не с теневой копии
+        cls._sources[employer_id] = source
 
-        thread = threading.Thread(target=worker, daemon=True)
-        thread.start()
-        cls._workers[employer_id] = thread
+    @classmethod
+    def _source(cls, employer_id: int) -> SnapshotSource | None:
+        if cls.snapshot_mode is SnapshotMode.SHADOW:
+            return None
+        return cls._sources.get(employer_id)
+
+    @classmethod
+    def _apply_batch(cls, employer_id: int, state: SnapshotState, batch: list[tuple[dict[str, Any], int]]) -> None:
+        live = cls._source(employer_id) is not None
+        if live:
+            # живая очередь заменяет теневую копию, держать её больше незачем
+            state.tasks = None
+        elif state.tasks is None:
+            state.tasks = TaskChain(cls._load_backup(employer_id))
+            state.offset = cls._get_offset(employer_id)
+        start = 0
+        while start < len(batch):
+            # пачка режется по порогу снапшота, чтобы снапшоты не зависели от того, как лягут пачки;
+            # внутри куска операции над одной задачей сворачиваются перед проигрыванием
+            end = min(len(batch), start + max(1, cls.snapshot_every_ops - state.pending))
+            chunk = batch[start:end]
+            if not live:
+                for op in coalesce_ops([op for op, _ in chunk]):
+                    cls._apply_op(state.tasks, op)
+            if not state.pending:
+                state.deadline = time.monotonic() + cls.snapshot_interval
+                cls._schedule_deadline(employer_id, state.deadline)
+            state.offset = chunk[-1][1]
+            state.pending += len(chunk)
+            if state.pending >= cls.snapshot_every_ops:
+                cls._snapshot(employer_id, state)
+            start = end
+        if state.pending and time.monotonic() >= state.deadline:
+            cls._snapshot(employer_id, state)
+
+    @classmethod
+    def _snapshot(cls, employer_id: int, state: SnapshotState) -> None:
+        source = cls._source(employer_id)
+        if source is None:
+            tasks, offset = state.tasks.to_list(), state.offset
+        elif cls.snapshot_mode is SnapshotMode.FORK and hasattr(os, 'fork'):
+            cls._fork_snapshot(employer_id, state, source)
+            return
+        else:
+            captured, lsn = source(lambda items, lsn: (list(items), lsn))
+            tasks = [{'id': task_id, 'duration': duration, 'done_date': done_date}
+                     for task_id, duration, done_date in captured]
+            offset = state.offset if lsn is None else lsn
+        # снапшот не должен опережать лог на диске, иначе .offset укажет за его конец
+        cls._commit(employer_id)
+        cls._write_backup(employer_id, tasks)
+        cls._set_offset(employer_id, offset)
+        cls._release(employer_id, offset)
+        state.pending = 0
+
+    @classmethod
+    def _fork_snapshot(cls, employer_id: int, state: SnapshotState, source: SnapshotSource) -> None:
+        backup = cls._backup_file(employer_id)
+        tmp = backup.with_name(backup.name + '.tmp')
+
+        def fork(items: Iterator[tuple[int, float, float]], lsn: int | None) -> tuple[int, int | None]:
+            pid = os.fork()
+            if pid == 0:
+                # дочерний процесс: блокировки и потоки родителя здесь не существуют, только пишем файл
+                code = 1
+                try:
+                    tmp.write_bytes(encode_snapshot([
+                        {'id': task_id, 'duration': duration, 'done_date': done_date}
+                        for task_id, duration, done_date in items
+                    ], cls.snapshot_codec))
+                    code = 0
+                finally:
+                    os._exit(code)
+            return pid, lsn
+
+        pid, lsn = source(fork)
+        _, status = os.waitpid(pid, 0)
+        if os.waitstatus_to_exitcode(status) != 0:
+            raise RuntimeError(f"Snapshot child for employer_id {employer_id} failed with status {status}")
+        offset = state.offset if lsn is None else lsn
+        # снапшот подменяется только после коммита лога, как и в остальных режимах
+        cls._commit(employer_id)
+        os.replace(tmp, backup)
+        cls._set_offset(employer_id, offset)
+        cls._release(employer_id, offset)
+        state.pending = 0
+
+    @classmethod
+    def flush(cls, employer_id: int) -> None:
+        # дождаться, пока пул применит все уже залогированные операции employer'а
+        state = cls._states.get(employer_id)
+        if state is None:
+            return
+        with state.lock:
+            while state.scheduled and not state.closed:
+                state.idle.wait()
+
+    @classmethod
+    def close(cls, employer_id: int, snapshot: bool = True) -> None:
+        # убрать employer'а из пула; при snapshot=True остаток очереди применяется и сохраняется сразу
+        state = cls._states.get(employer_id)
+        if state is None:
+            return
+        with state.lock:
+            state.closed = True
+            while state.busy:
+                state.idle.wait()
+            backlog = list(state.backlog)
+            state.backlog.clear()
+            with cls._states_lock:
+                if cls._states.get(employer_id) is state:
+                    del cls._states[employer_id]
+            state.idle.notify_all()
+        # Снапшот - уже без state.lock: в CAPTURE/FORK он берёт блокировку чтения очереди, а писатель
+        # очереди под её блокировкой записи ждёт state.lock в _enqueue - вместе это была бы взаимоблокировка.
+        # Закрытое состояние пул больше не трогает, новые операции employer'а попадут в новое состояние.
+        if snapshot and (backlog or state.pending):
+            cls._apply_batch(employer_id, state, backlog)
+            if state.pending:
+                cls._snapshot(employer_id, state)
+
+    @classmethod
+    def unload(cls, employer_id: int) -> None:
+        # очередь выгружается из памяти: сохраняем её снапшотом и отпускаем теневую копию и файл лога
+        cls.close(employer_id)
+        cls._sources.pop(employer_id, None)
+        cls._close_writer(employer_id)
 
     @classmethod
     def clear(cls, employer_id: int | None = None) -> None:
         if employer_id is None:
-            for eid in list(cls._queues.keys()):
+            for eid in set(cls._states) | set(cls._writers) | set(cls._sources):
                 cls.clear(eid)
             return
-        q = cls._queues.pop(employer_id, None)
-        thread = cls._workers.pop(employer_id, None)
-        if q is not None:
-            q.put(None)
-        if thread is not None:
-            thread.join()
-        cls._locks.pop(employer_id, None)
+        cls.close(employer_id, snapshot=False)
+        cls._close_writer(employer_id)
+        cls._durability.pop(employer_id, None)
+        cls._sources.pop(employer_id, None)
+        log_file = cls._log_file(employer_id)
         for file in (
-            cls._log_file(employer_id),
+            *(segment for _, segment in segment_files(log_file)),
+            log_file,
             cls._backup_file(employer_id),
             cls._offset_file(employer_id),
         ):
-            if file.exists():
-                file.unlink()
+            file.unlink(missing_ok=True)
+
+    @classmethod
+    def stored_employers(cls) -> list[int]:
+        # employer'ы, у которых в base_path есть снапшот или лог (в том числе только закрытые сегменты)
+        employers = set()
+        for file in cls._base_dir().glob('*/*'):
+            if file.suffix not in ('.log', '.bac'):
+                continue
+            try:
+                employers.add(int(file.name.split('.', 1)[0]))
+            except ValueError:
+                continue
+        return sorted(employers)
 
     @classmethod
     def recover(cls, employer_id: int) -> list[dict[str, Any]]:
-        tasks = cls._load_backup(employer_id)
-        offset = cls._get_offset(employer_id)
-        log_file = cls._log_file(employer_id)
+        # прежняя теневая копия устарела: всё, что она не успела сохранить, есть в логе
+        cls.close(employer_id, snapshot=False)
+        tasks = TaskChain(cls._load_backup(employer_id))
+        # writer откроется заново уже на восстановленном логе и с верной позицией конца файла
+        cls._close_writer(employer_id)
+        log_file = cls._open_log(employer_id)
+        offset = end = cls._get_offset(employer_id)
+        # .offset - LSN первой неприменённой записи; сегменты, целиком лежащие до него, не читаются вовсе
+        segments = segment_files(log_file)
+        bounds = [base for base, _ in segments[1:]]
+        for (_, segment), segment_end in zip(segments, bounds + [None]):
+            if segment_end is not None and segment_end <= offset:
+                continue
+            with segment.open('rb') as f:
+                for op, end in iter_records(f, offset):
+                    cls._apply_op(tasks, op)
         if log_file.exists():
-            lines = log_file.read_text().splitlines()
-            for line in lines[offset:]:
-                if not line:
-                    continue
-                op = json.loads(line)
-                cls._apply_op(tasks, op)
-                offset += 1
-            cls._write_backup(employer_id, tasks)
-            cls._set_offset(employer_id, offset)
-        cls._ensure_worker(employer_id)
-        return tasks
+            size = log_file.stat().st_size
+            valid = 0
+            with log_file.open('rb') as f:
+                header = read_header(f)
+                if header is not None:
+                    base, header_size = header
+                    # если лог короче чекпоинта (потерян или обрезан), проигрывать нечего
+                    valid = min(max(offset - base, header_size), size)
+                    for op, end in iter_records(f, offset):
+                        cls._apply_op(tasks, op)
+                        valid = end - base
+                    end = base + valid
+            # недописанная при падении запись в конце лога отбрасывается
+            if size > valid:
+                os.truncate(log_file, valid)
+        if log_file.exists() or segments:
+            cls._write_backup(employer_id, tasks.to_list())
+            cls._set_offset(employer_id, end)
+            cls._writer(employer_id).release(end, cls.archive_path)
+        # пул продолжает с только что восстановленной теневой копией (в SHADOW) или только с позицией
+        with cls._states_lock:
+            shadow = tasks if cls.snapshot_mode is SnapshotMode.SHADOW else None
+            cls._states[employer_id] = SnapshotState(shadow, end)
+        return tasks.to_list()
@@ -1,17 +1,101 @@
+import struct
 import threading
-from collections.abc import Callable, Iterator
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
 from functools import wraps
-from typing import Any
+from itertools import islice
+from typing import Any, TypeVar
 
+from .date_index import DoneDateIndex
 from .node import TaskNode
-from .persistence import PersistenceManager
+from .persistence import Durability, PersistenceManager
+from .rank import RankIndex
+from .rwlock import RWLock
+from .storage import StorageBackend
+
+T = TypeVar('T')
+
+
+# курсор list_tasks_page: границы диапазона, последняя отданная задача, первая неотданная,
+# позиции последней и to-границы
+CURSOR = struct.Struct('<4iqq')
+
+
+def _encode_cursor(from_id: int, to_id: int, last_id: int, next_id: int, position: int, to_position: int) -> str:
+    return CURSOR.pack(from_id, to_id, last_id, next_id, position, to_position).hex()
+
+
+def _decode_cursor(cursor: str) -> tuple[int, int, int, int, int, int]:
+    try:
+        return CURSOR.unpack(bytes.fromhex(cursor))
+    except (ValueError, struct.error):
+        raise ValueError("'cursor' is invalid") from None
+
+
+class QueueRetiredError(ValueError):
+    # очередь выгружена QueueManager'ом, пока вызывающий держал её объект: изменение не выполнено,
+    # актуальную очередь нужно взять заново через QueueManager.get_queue
+    pass
 
 
 def synchronized(fn: Callable) -> Callable:
     @wraps(fn)
     def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
         with self._lock:
+            if self._retired:
+                # изменение выгруженной очереди не попало бы ни в её лог, ни в очередь, поднятую заново
+                raise QueueRetiredError(f"Queue for employer_id {self._employer_id} was unloaded, get it again")
+            return fn(self, *args, **kwargs)
+    return wrapper
+
+
+def reading(fn: Callable) -> Callable:
+    # чтение под разделяемой блокировкой: читатели одной очереди не ждут друг друга
+    @wraps(fn)
+    def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+        self._lock.acquire_read()
+        try:
             return fn(self, *args, **kwargs)
+        finally:
+            self._lock.release_read()
+    return wrapper
+
+
+def optimistic(fn: Callable) -> Callable:
+    # Короткое чтение без блокировки: если за время чтения version не сменилась и писателя не было,
+    # результат согласован; иначе (или если чтение упало на полуизменённой очереди) - повтор под чтением.
+    @wraps(fn)
+    def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+        lock = self._lock
+        version = lock.version
+        if not version & 1:
+            try:
+                result = fn(self, *args, **kwargs)
+            except Exception:
+                if lock.version == version:
+                    raise
+            else:
+                if lock.version == version:
+                    return result
+        lock.acquire_read()
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            lock.release_read()
+    return wrapper
+
+
+def durable(fn: Callable) -> Callable:
+    # подтверждения записи в лог ждём уже после освобождения блокировки очереди,
+    # чтобы задержка диска не задерживала остальных клиентов этой очереди
+    @wraps(fn)
+    def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+        result = fn(self, *args, **kwargs)
+        seq = getattr(self._pending, 'seq', None)
+        if seq is not None:
+            self._pending.seq = None
+            self._storage.wait(self._employer_id, seq)
+        return result
     return wrapper
 
 
@@ -30,23 +114,162 @@ class TaskIndex:
     def delete(self, task_id: int) -> None:
         del self._tasks[task_id]
 
+    def __len__(self) -> int:
+        return len(self._tasks)
+
 
 class TaskQueue:
     _first: TaskNode | None = None
     _last: TaskNode | None = None
     _index: TaskIndex
-    _lock: threading.Lock
+    _lock: RWLock
     _employer_id: int | None
-
-    def __init__(self, employer_id: int | None = None) -> None:
+    _durability: Durability
+    _storage: StorageBackend
+    _pending: threading.local
+    _lsn: int | None
+    _rank: RankIndex | None
+    _dates: DoneDateIndex | None
+    _index_lock: threading.Lock
+    _batch: list[dict[str, Any]] | None
+    _retired: bool
+
+    def __init__(
+        self, employer_id: int | None = None, durability: Durability | None = None,
+        storage: StorageBackend | None = None,
+    ) -> None:
         self._index = TaskIndex()
-        self._lock = threading.RLock()
+        self._lock = RWLock()
+        self._index_lock = threading.Lock()
         self._first = None
         self._last = None
         self._employer_id = employer_id
+        self._storage = storage or PersistenceManager
+        self._durability = durability or self._storage.durability
+        self._pending = threading.local()
+        self._lsn = None
+        self._rank = None
+        self._dates = None
+        self._batch = None
+        self._retired = False
+        if employer_id is not None and self._durability is not Durability.MEMORY:
+            self._storage.set_durability(employer_id, self._durability)
+
+    @property
+    def durability(self) -> Durability:
+        return self._durability
+
+    def __len__(self) -> int:
+        return len(self._index)
 
+    def _log(self, op: dict[str, Any]) -> None:
+        if self._batch is not None:
+            self._batch.append(op)
+            return
+        if self._employer_id is not None and self._durability is not Durability.MEMORY:
+            self._lsn = self._pending.seq = self._storage.log(self._employer_id, op)
+
+    @contextmanager
+    def _batched(self) -> Iterator[None]:
+        # вызывается под блокировкой очереди: операции внутри копятся и уходят в лог одной пакетной записью,
+        # которая и на диск ложится, и при восстановлении проигрывается целиком или никак
+        self._batch = []
+        try:
+            yield
+        finally:
+            ops, self._batch = self._batch, None
+            if ops:
+                self._log({'action': 'batch', 'ops': ops})
+
+    def retire(self) -> None:
+        # QueueManager выгружает очередь: дожидаемся начатых изменений, дальше они запрещены (см. synchronized)
+        with self._lock:
+            self._retired = True
+
+    def capture(self, fn: Callable[[Iterator[tuple[int, float, float]], int | None], T]) -> T:
+        # Источник снапшота для бэкенда хранения: fn вызывается под блокировкой очереди с задачами
+        # в её порядке и LSN последней залогированной операции, поэтому они согласованы между собой.
+        # fn должна только снять копию (или сделать fork) и сразу вернуть управление.
+        with self._lock.read():
+            return fn(self._iter_fields(), self._lsn)
+
+    def _iter_fields(
+        self, from_task: TaskNode | None = None, to_task: TaskNode | None = None,
+    ) -> Iterator[tuple[int, float, float]]:
+        # без блокировки: итерируется либо под capture/list_tasks, либо в дочернем процессе после fork;
+        # границы - как у get_tasks
+        current = from_task or self._first
+        after = to_task.next if to_task else None
+        while current and current is not after:
+            yield current.id, current.duration, current.done_date
+            current = current.next
+
+    @reading
+    def list_tasks(
+        self, from_task: TaskNode | None = None, to_task: TaskNode | None = None,
+    ) -> list[tuple[int, float, float]]:
+        # Согласованный снимок (id, duration, done_date) задач для отдачи клиенту: блокировка чтения держится
+        # только на копирование кортежей, кодирование и отправка по сети идут уже без неё.
+        return list(self._iter_fields(from_task, to_task))
+
+    @reading
+    def list_tasks_page(
+        self, limit: int, cursor: str = '', from_task: TaskNode | None = None, to_task: TaskNode | None = None,
+    ) -> tuple[list[tuple[int, float, float]], str]:
+        # Страница list_tasks: до limit задач и курсор следующей страницы, '' - страниц больше нет.
+        # Границы диапазона берутся из курсора, from_task и to_task нужны только для первой страницы. Если,
+        # пока клиент листал, удалили from-границу, она снимается; если to-границу - отдаются только задачи,
+        # стоявшие между последней отданной и ней на момент прошлой страницы. Следующая страница начинается сразу за
+        # последней отданной задачей, пока та остаётся в диапазоне; иначе - с первой неотданной, а если ушла
+        # и она - с прежней позиции последней: туда сдвигается задача, стоявшая за обеими.
+        # Позиции берутся из RankIndex, поэтому каждая страница - O(log n + limit).
+        if limit <= 0:
+            raise ValueError("'limit' must be positive")
+        if cursor:
+            from_id, to_id, last_id, next_id, position, to_position = _decode_cursor(cursor)
+            from_task = self.get_task(from_id) if from_id else None
+            to_task = self.get_task(to_id) if to_id else None
+        else:
+            from_id, to_id = from_task.id if from_task else 0, to_task.id if to_task else 0
+        rank = self._rank_index()
+        low = rank.position(from_task.id) if from_task else 0
+        high = rank.position(to_task.id) if to_task else len(rank) - 1
+        if high < low:
+            # to_task раньше from_task: как и get_tasks, идём до конца очереди
+            high = len(rank) - 1
+
+        def inside(task_id: int) -> bool:
+            return bool(task_id) and task_id in rank and low <= rank.position(task_id) <= high
+
+        if not cursor:
+            start = low
+        elif inside(last_id):
+            start = rank.position(last_id) + 1
+        elif inside(next_id):
+            start = rank.position(next_id)
+        else:
+            start = max(low, position)
+        if cursor and to_id and to_task is None and to_position > position:
+            # to-граница ушла из очереди: за ней не идём, отдаём столько задач, сколько стояло перед ней
+            high = min(high, start + to_position - position - 2)
+        if start > high:
+            return [], ''
+        first = self.get_task(rank.select(start))
+        tasks = list(islice(self._iter_fields(first, to_task), min(limit + 1, high - start + 1)))
+        if len(tasks) <= limit:
+            return tasks, ''
+        next_id = tasks.pop()[0]
+        # ушедшую to-границу переносим в следующий курсор: сразу за последней задачей, которую ещё можно отдать
+        to_position = rank.position(to_task.id) if to_task else high + 1 if to_id else -1
+        return tasks, _encode_cursor(from_id, to_id, tasks[-1][0], next_id, start + limit - 1, to_position)
+
+    @durable
     @synchronized
     def add_task(self, task: TaskNode, prev_task: TaskNode | None = None, *, log: bool = True) -> None:
+        self._add_task(task, prev_task, log)
+
+    def _add_task(self, task: TaskNode, prev_task: TaskNode | None, log: bool = True) -> None:
+        # тела изменяющих методов вынесены без декораторов: пакетные методы зовут их под уже взятой блокировкой
         if self._index.get(task.id) is not None:
             raise ValueError(f"Task with id {task.id} already exists in the queue")
 
@@ -54,11 +277,15 @@ class TaskQueue:
             raise ValueError("prev_task is not in the queue")
 
         self._index.set(task.id, task)
+        if self._dates is not None:
+            self._dates.add(task.id, task.done_date)
 
         if not self._first:
             self._first = self._last = task
-            if log and self._employer_id is not None:
-                PersistenceManager.log(self._employer_id, {
+            if self._rank is not None:
+                self._rank.insert_after(task.id, None, task.duration or 0)
+            if log:
+                self._log({
                     'action': 'add',
                     'task': {'id': task.id, 'duration': task.duration, 'done_date': task.done_date},
                     'prev': None,
@@ -78,14 +305,60 @@ class TaskQueue:
         if prev_task is self._last:
             self._last = task
 
-        if log and self._employer_id is not None:
-            PersistenceManager.log(self._employer_id, {
+        if self._rank is not None:
+            self._rank.insert_after(task.id, prev_task.id, task.duration or 0)
+
+        if log:
+            self._log({
                 'action': 'add',
                 'task': {'id': task.id, 'duration': task.duration, 'done_date': task.done_date},
                 'prev': prev_task.id if prev_task else None,
             })
 
+    def _check_batch(self, tasks: Sequence[TaskNode], prev_task: TaskNode | None, exist: bool) -> None:
+        # пачка проверяется целиком до первого изменения, чтобы не применить её наполовину
+        ids = [task.id for task in tasks]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Tasks in the batch must be unique")
+        for task_id in ids:
+            if self.task_exists(task_id) is not exist:
+                state = "does not exist" if exist else "already exists"
+                raise ValueError(f"Task with id {task_id} {state} in the queue")
+        if prev_task and (not self.task_exists(prev_task.id) or prev_task.id in ids):
+            raise ValueError("prev_task is not in the queue")
+
+    @durable
+    @synchronized
+    def add_tasks(self, tasks: Sequence[TaskNode], prev_task: TaskNode | None = None) -> None:
+        # задачи встают подряд в заданном порядке после prev_task, без prev_task - в конец очереди
+        self._check_batch(tasks, prev_task, exist=False)
+        prev_task = self.get_task(prev_task.id) if prev_task else None
+        with self._batched():
+            for task in tasks:
+                self._add_task(task, prev_task)
+                prev_task = task
+
+    @durable
+    @synchronized
+    def move_tasks(self, tasks: Sequence[TaskNode], prev_task: TaskNode | None = None) -> None:
+        # задачи встают подряд в заданном порядке после prev_task, без prev_task - в начало очереди
+        self._check_batch(tasks, prev_task, exist=True)
+        prev_task = self.get_task(prev_task.id) if prev_task else None
+        with self._batched():
+            for task in tasks:
+                task = self.get_task(task.id)
+                self._move_task(task, prev_task)
+                prev_task = task
+
+    @durable
     @synchronized
+    def delete_tasks(self, tasks: Sequence[TaskNode]) -> None:
+        self._check_batch(tasks, None, exist=True)
+        with self._batched():
+            for task in tasks:
+                self._delete_task(self.get_task(task.id))
+
+    @optimistic
     def get_task(self, task_id: int) -> TaskNode | None:
         return self._index.get(task_id)
 
@@ -104,48 +377,68 @@ class TaskQueue:
         if task is self._last:
             self._last = task.prev
 
+    @durable
     @synchronized
     def delete_task(self, task: TaskNode) -> TaskNode | None:
+        return self._delete_task(task)
+
+    def _delete_task(self, task: TaskNode) -> TaskNode | None:
         self.unlink_task(task)
+        if self._dates is not None:
+            self._dates.remove(task.id)
         self._index.delete(task.id)
-        if self._employer_id is not None:
-            PersistenceManager.log(self._employer_id, {
-                'action': 'delete',
-                'task_id': task.id,
-            })
+        if self._rank is not None:
+            self._rank.remove(task.id)
+        self._log({
+            'action': 'delete',
+            'task_id': task.id,
+        })
         return task.next
 
-    @synchronized
+    @optimistic
     def task_exists(self, task_id: int) -> bool:
         return self._index.get(task_id) is not None
 
+    @durable
     @synchronized
     def update_task(self, task: TaskNode) -> None:
         original = self.get_task(task.id)
         if original is None:
             raise ValueError(f"Task with id {task.id} does not exist in the queue")
+        if self._dates is not None:
+            self._dates.remove(task.id)
+            self._dates.add(task.id, task.done_date)
         original.duration = task.duration
         original.done_date = task.done_date
-        if self._employer_id is not None:
-            PersistenceManager.log(self._employer_id, {
-                'action': 'update',
-                'task': {'id': task.id, 'duration': task.duration, 'done_date': task.done_date},
-            })
-
+        if self._rank is not None:
+            self._rank.set_duration(task.id, task.duration or 0)
+        self._log({
+            'action': 'update',
+            'task': {'id': task.id, 'duration': task.duration, 'done_date': task.done_date},
+        })
+
+    @durable
     @synchronized
     def move_task(self, task: TaskNode, prev_task: TaskNode | None = None) -> None:
+        self._move_task(task, prev_task)
+
+    def _move_task(self, task: TaskNode, prev_task: TaskNode | None) -> None:
+        # проверки - до unlink_task: после него исключение оставило бы задачу вне списка, но в индексе
+        if prev_task and (prev_task.id == task.id or not self._index.get(prev_task.id)):
+            raise ValueError("prev_task is not in the queue")
         self.unlink_task(task)
+        if self._rank is not None:
+            self._rank.move_after(task.id, prev_task.id if prev_task else None)
 
         if prev_task:
             task.link_after(prev_task)
             if prev_task is self._last:
                 self._last = task
-            if self._employer_id is not None:
-                PersistenceManager.log(self._employer_id, {
-                    'action': 'move',
-                    'task_id': task.id,
-                    'prev': prev_task.id if prev_task else None,
-                })
+            self._log({
+                'action': 'move',
+                'task_id': task.id,
+                'prev': prev_task.id if prev_task else None,
+            })
             return
 
         # Если prev_task равен None, добавляем задачу в начало очереди
@@ -154,27 +447,85 @@ class TaskQueue:
         if self._first:
             self._first.prev = task
         self._first = task
-        if self._employer_id is not None:
-            PersistenceManager.log(self._employer_id, {
-                'action': 'move',
-                'task_id': task.id,
-                'prev': prev_task.id if prev_task else None,
-            })
-
+        self._log({
+            'action': 'move',
+            'task_id': task.id,
+            'prev': prev_task.id if prev_task else None,
+        })
+
+    def _rank_index(self) -> RankIndex:
+        # строится при первом запросе по позиции или длительности, дальше поддерживается каждым изменением очереди.
+        # Запросы идут под блокировкой чтения, поэтому строит индекс только один из параллельных читателей.
+        if self._rank is None:
+            with self._index_lock:
+                if self._rank is None:
+                    self._rank = RankIndex((task_id, duration or 0) for task_id, duration, _ in self._iter_fields())
+        return self._rank
+
+    def _date_index(self) -> DoneDateIndex:
+        # как _rank_index: строится при первом запросе по done_date, очереди без таких запросов его не держат
+        if self._dates is None:
+            with self._index_lock:
+                if self._dates is None:
+                    self._dates = DoneDateIndex((task_id, done_date) for task_id, _, done_date in self._iter_fields())
+        return self._dates
+
+    @reading
+    def get_task_ids_by_done_date(self, start: float | None = None, end: float | None = None) -> list[int]:
+        # id задач с start <= done_date < end в порядке done_date, None - без границы; задачи без done_date
+        # не попадают. Список, а не итератор: блокировка чтения держится только на копирование.
+        return list(self._date_index().between(start, end))
+
+    @reading
+    def get_task_at(self, position: int) -> TaskNode | None:
+        if not 0 <= position < len(self):
+            return None
+        return self.get_task(self._rank_index().select(position))
+
+    @reading
+    def get_position(self, task_id: int) -> int:
+        if not self.task_exists(task_id):
+            raise ValueError(f"Task with id {task_id} does not exist in the queue")
+        return self._rank_index().position(task_id)
+
+    @reading
+    def get_eta(self, task_id: int) -> float:
+        # ожидаемое время до начала задачи: сумма длительностей всех задач перед ней
+        if not self.task_exists(task_id):
+            raise ValueError(f"Task with id {task_id} does not exist in the queue")
+        return self._rank_index().duration_before(task_id)
+
+    @reading
+    def get_total_duration(self, from_task: TaskNode | None = None, to_task: TaskNode | None = None) -> float:
+        # суммарная длительность задач от from_task до to_task включительно, границы - как у get_tasks
+        for task in (from_task, to_task):
+            if task and not self.task_exists(task.id):
+                raise ValueError(f"Task with id {task.id} does not exist in the queue")
+        rank = self._rank_index()
+        start = rank.duration_before(from_task.id) if from_task else 0.0
+        if to_task is None or (from_task and rank.position(to_task.id) < rank.position(from_task.id)):
+            # to_task раньше from_task: get_tasks в этом случае идёт до конца очереди
+            return rank.total_duration - start
+        return rank.duration_before(to_task.id) + rank.duration(to_task.id) - start
+
+    @reading
     def get_tasks(self, from_task: TaskNode | None = None, to_task: TaskNode | None = None) -> Iterator[TaskNode]:
-        with self._lock:
-            current = from_task or self._first
-            after = to_task.next if to_task else None
-            while current and current is not after:
-                yield current
-                current = current.next
+        # узлы собираются под блокировкой, а отдаются уже без неё: медленный или брошенный на середине
+        # потребитель не держит очередь
+        tasks = []
+        current = from_task or self._first
+        after = to_task.next if to_task else None
+        while current and current is not after:
+            tasks.append(current)
+            current = current.next
+        return iter(tasks)
 
     @property
+    @optimistic
     def first_task(self) -> TaskNode | None:
-        with self._lock:
-            return self._first
+        return self._first
 
     @property
+    @optimistic
     def latest_task(self) -> TaskNode | None:
-        with self._lock:
-            return self._last
+        return self._last
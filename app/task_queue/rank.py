@@ -0,0 +1,194 @@
+import random
+from collections.abc import Iterable
+from typing import Optional
+
+
+class RankNode:
+    __slots__ = ('task_id', 'priority', 'left', 'right', 'parent', 'size', 'duration', 'total')
+
+    task_id: int
+    priority: float
+    left: Optional['RankNode']
+    right: Optional['RankNode']
+    parent: Optional['RankNode']
+    size: int
+    duration: float
+    total: float
+
+    def __init__(self, task_id: int, duration: float) -> None:
+        self.task_id = task_id
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.size = 1
+        self.duration = self.total = duration
+
+
+def _size(node: RankNode | None) -> int:
+    return node.size if node else 0
+
+
+def _total(node: RankNode | None) -> float:
+    return node.total if node else 0.0
+
+
+def _update(node: RankNode) -> None:
+    node.size = 1 + _size(node.left) + _size(node.right)
+    node.total = node.duration + _total(node.left) + _total(node.right)
+    if node.left:
+        node.left.parent = node
+    if node.right:
+        node.right.parent = node
+
+
+def _merge(left: RankNode | None, right: RankNode | None) -> RankNode | None:
+    if not left:
+        return right
+    if not right:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _split(node: RankNode | None, count: int) -> tuple[RankNode | None, RankNode | None]:
+    # первые count узлов по порядку - в левое дерево, остальные - в правое
+    if not node:
+        return None, None
+    if _size(node.left) >= count:
+        left, node.left = _split(node.left, count)
+        _update(node)
+        return left, node
+    node.right, right = _split(node.right, count - _size(node.left) - 1)
+    _update(node)
+    return node, right
+
+
+class RankIndex:
+    # Порядковый индекс очереди: декартово дерево (treap) по неявному ключу - позиции задачи в очереди.
+    # Узел хранит размер и суммарную длительность поддерева и ссылку на родителя, поэтому позиция задачи
+    # и сумма длительностей перед ней (подъём к корню), задача по позиции (спуск от корня) - O(log n).
+    # Префиксные суммы на массиве (Fenwick) здесь не подходят: перемещение сдвигает позиции всех задач
+    # между старым и новым местом. Порядок задач в дереве повторяет связный список очереди; очередь
+    # сама сообщает индексу о вставках, удалениях, перемещениях и смене длительности.
+    _root: RankNode | None
+    _nodes: dict[int, RankNode]
+
+    def __init__(self, tasks: Iterable[tuple[int, float]] = ()) -> None:
+        self._nodes = {}
+        self._root = self._build(tasks)
+
+    def _build(self, tasks: Iterable[tuple[int, float]]) -> RankNode | None:
+        # за O(n): задачи уже упорядочены, остаётся расставить приоритеты стеком правой ветви
+        stack: list[RankNode] = []
+        for task_id, duration in tasks:
+            node = self._nodes[task_id] = RankNode(task_id, duration)
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        if not stack:
+            return None
+        root = stack[0]
+        # размеры поддеревьев - обходом в обратном порядке без рекурсии
+        order, pending = [], [root]
+        while pending:
+            node = pending.pop()
+            order.append(node)
+            pending.extend(child for child in (node.left, node.right) if child)
+        for node in reversed(order):
+            _update(node)
+        root.parent = None
+        return root
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def __contains__(self, task_id: int) -> bool:
+        return task_id in self._nodes
+
+    def position(self, task_id: int) -> int:
+        node = self._nodes[task_id]
+        position = _size(node.left)
+        while node.parent:
+            if node is node.parent.right:
+                position += _size(node.parent.left) + 1
+            node = node.parent
+        return position
+
+    def duration_before(self, task_id: int) -> float:
+        # сумма длительностей всех задач перед task_id
+        node = self._nodes[task_id]
+        total = _total(node.left)
+        while node.parent:
+            if node is node.parent.right:
+                total += _total(node.parent.left) + node.parent.duration
+            node = node.parent
+        return total
+
+    def duration(self, task_id: int) -> float:
+        return self._nodes[task_id].duration
+
+    @property
+    def total_duration(self) -> float:
+        return _total(self._root)
+
+    def set_duration(self, task_id: int, duration: float) -> None:
+        node: RankNode | None = self._nodes[task_id]
+        node.duration = duration
+        while node:
+            node.total = node.duration + _total(node.left) + _total(node.right)
+            node = node.parent
+
+    def select(self, position: int) -> int:
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        node = self._root
+        while True:
+            left = _size(node.left)
+            if position < left:
+                node = node.left
+            elif position == left:
+                return node.task_id
+            else:
+                position -= left + 1
+                node = node.right
+
+    def insert_after(self, task_id: int, prev_id: int | None, duration: float) -> None:
+        # prev_id равен None - задача встаёт в начало
+        self._attach(RankNode(task_id, duration), prev_id)
+
+    def remove(self, task_id: int) -> None:
+        self._detach(task_id)
+
+    def move_after(self, task_id: int, prev_id: int | None) -> None:
+        self._attach(self._detach(task_id), prev_id)
+
+    def _attach(self, node: RankNode, prev_id: int | None) -> None:
+        position = self.position(prev_id) + 1 if prev_id is not None else 0
+        self._nodes[node.task_id] = node
+        node.left = node.right = None
+        _update(node)
+        left, right = _split(self._root, position)
+        self._set_root(_merge(_merge(left, node), right))
+
+    def _detach(self, task_id: int) -> RankNode:
+        position = self.position(task_id)
+        node = self._nodes.pop(task_id)
+        left, right = _split(self._root, position)
+        _, right = _split(right, 1)
+        self._set_root(_merge(left, right))
+        return node
+
+    def _set_root(self, root: RankNode | None) -> None:
+        if root:
+            root.parent = None
+        self._root = root
@@ -0,0 +1,82 @@
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+class RWLock:
+    # Блокировка читателей и писателей: читатели работают параллельно, писатель - один и без читателей.
+    # Ожидающий писатель не пропускает вперёд новых читателей, иначе при постоянном чтении он бы не дождался.
+    # Обе стороны реентерабельны, писатель может брать и чтение; повышение чтения до записи запрещено -
+    # два таких читателя ждали бы друг друга вечно.
+    # `with lock:` - запись, как у обычной блокировки; чтение - `with lock.read():`.
+    # version - счётчик как у seqlock: нечётный, пока писатель держит блокировку; по нему короткие чтения
+    # могут идти вовсе без блокировки и перепроверять, что их не пересёк писатель (см. optimistic).
+    version: int
+
+    def __init__(self) -> None:
+        self.version = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._readers: dict[int, int] = {}
+        self._writer: int | None = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+
+    def acquire_read(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            depth = self._readers.get(me)
+            if depth is None and self._writer != me:
+                while self._writer is not None or self._writers_waiting:
+                    self._cond.wait()
+            self._readers[me] = (depth or 0) + 1
+
+    def release_read(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            depth = self._readers[me] - 1
+            if depth:
+                self._readers[me] = depth
+                return
+            del self._readers[me]
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("Cannot upgrade a read lock to a write lock")
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._writer_depth = 1
+            self.version += 1
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writer_depth -= 1
+            if not self._writer_depth:
+                self.version += 1
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    def __enter__(self) -> None:
+        self.acquire_write()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.release_write()
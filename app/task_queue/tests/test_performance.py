@@ -1,14 +1,57 @@
+import io
+import json
 import logging
+import random
+import struct
+import threading
 import time
+import tracemalloc
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
 
 import pytest
 import structlog
 from structlog.testing import capture_logs
 
+from task_queue.array_queue import ArrayTaskQueue
+from task_queue.manager import QueueManager
 from task_queue.node import TaskNode
+from task_queue.persistence import Durability, PersistenceManager, TaskChain
 from task_queue.queue import TaskQueue
+from task_queue.snapshot import decode_snapshot, encode_snapshot
+from task_queue.sqlite_storage import SqliteStorage
+from task_queue.wal import LOG_HEADER, encode_op, iter_records
 
 QUEUE_SIZE = 10_000
+REPLAY_OPS = 10_000
+LOG_FORMAT_OPS = 1_000_000
+DURABILITY_OPS = 2_000
+DURABILITY_THREADS = 8
+SNAPSHOT_TASKS = 1_000_000
+NODE_MEMORY_TASKS = 1_000_000
+RANK_TASKS = 100_000
+RANK_QUERIES = 1_000
+BULK_TASKS = 20_000
+BULK_SIZE = 500
+CONTENTION_TASKS = 2_000
+CONTENTION_READERS = 16
+CONTENTION_WRITERS = 2
+CONTENTION_SECONDS = 2.0
+CONTENTION_LIST_EVERY = 50
+LISTING_TASKS = 100_000
+LISTING_SECONDS = 2.0
+REGISTRY_QUEUES = 100
+REGISTRY_READERS = 8
+REGISTRY_CREATORS = 2
+REGISTRY_STORED = 40
+REGISTRY_RECOVERY_TASKS = 5_000
+REGISTRY_SECONDS = 2.0
+DONE_INDEX_TASKS = 100_000
+DONE_INDEX_QUERIES = 100
+DONE_INDEX_WIDTH = 100
+STORAGE_OPS = {Durability.ASYNC: 100_000, Durability.FSYNC: 2_000}
 
 memory_usage = pytest.importorskip("memory_profiler").memory_usage
 
@@ -124,3 +167,498 @@ def test_performance(f_large_queue: TaskQueue) -> None:
             measure_performance(f_large_queue, func)
     count = sum("elapsed_time" in log for log in logs)
     assert count == len(PERFORMANCE_FUNCS)
+
+
+def build_replay_log(size: int) -> list[dict]:
+    tasks = size // 2
+    ops = [
+        {'action': 'add', 'task': {'id': i, 'duration': 10, 'done_date': 0}, 'prev': i - 1 if i > 1 else None}
+        for i in range(1, tasks + 1)
+    ]
+    for i in range(1, size - tasks + 1):
+        if i % 4 == 0:
+            ops.append({'action': 'delete', 'task_id': i})
+        else:
+            ops.append({'action': 'move', 'task_id': i, 'prev': tasks - i})
+    return ops
+
+
+def list_apply_op(tasks: list[dict], op: dict) -> None:
+    # реализация проигрывания лога до перехода на TaskChain, оставлена для сравнения
+    action = op['action']
+    if action == 'add':
+        prev = op.get('prev')
+        if prev is None:
+            tasks.append(op['task'])
+        else:
+            idx = next((i for i, t in enumerate(tasks) if t['id'] == prev), len(tasks) - 1)
+            tasks.insert(idx + 1, op['task'])
+    elif action == 'delete':
+        tasks[:] = [t for t in tasks if t['id'] != op['task_id']]
+    elif action == 'move':
+        tid = op['task_id']
+        task = next((t for t in tasks if t['id'] == tid), None)
+        if task:
+            tasks[:] = [t for t in tasks if t['id'] != tid]
+            prev = op.get('prev')
+            idx = next((i for i, t in enumerate(tasks) if t['id'] == prev), len(tasks) - 1)
+            tasks.insert(idx + 1, task)
+
+
+def replay_with_list(ops: list[dict]) -> list[dict]:
+    tasks: list[dict] = []
+    for op in ops:
+        list_apply_op(tasks, op)
+    return tasks
+
+
+def replay_with_chain(ops: list[dict]) -> list[dict]:
+    tasks = TaskChain()
+    for op in ops:
+        PersistenceManager._apply_op(tasks, op)
+    return tasks.to_list()
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+def test_replay_performance() -> None:
+    ops = build_replay_log(REPLAY_OPS)
+    results = {}
+    with capture_logs() as logs:
+        for func in (replay_with_list, replay_with_chain):
+            start_time = time.time()
+            results[func.__name__] = func(ops)
+            logger.info("performance", function=func.__name__, ops=len(ops), elapsed_time=time.time() - start_time)
+    assert results['replay_with_list'] == results['replay_with_chain']
+    assert sum("elapsed_time" in log for log in logs) == 2
+
+
+def add_tasks_concurrently(queue: TaskQueue) -> None:
+    def worker(runner_id: int) -> None:
+        for i in range(DURABILITY_OPS // DURABILITY_THREADS):
+            queue.add_task(TaskNode(runner_id * DURABILITY_OPS + i + 1, 10))
+
+    with ThreadPoolExecutor(max_workers=DURABILITY_THREADS) as executor:
+        list(executor.map(worker, range(DURABILITY_THREADS)))
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+def test_durability_performance(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    with capture_logs() as logs:
+        for employer_id, durability in enumerate(Durability, start=1):
+            queue = TaskQueue(employer_id, durability)
+            start_time = time.time()
+            add_tasks_concurrently(queue)
+            elapsed_time = time.time() - start_time
+            logger.info(
+                "performance",
+                durability=durability,
+                elapsed_time=elapsed_time,
+                ops_per_second=DURABILITY_OPS / elapsed_time,
+            )
+            PersistenceManager.clear(employer_id)
+    assert sum("elapsed_time" in log for log in logs) == len(Durability)
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+def test_log_format_performance() -> None:
+    ops = build_replay_log(LOG_FORMAT_OPS)
+    text = ''.join(json.dumps(op) + '\n' for op in ops).encode('utf-8')
+    binary = LOG_HEADER + b''.join(encode_op(op) for op in ops)
+    with capture_logs() as logs:
+        start_time = time.time()
+        decoded_text = [json.loads(line) for line in io.BytesIO(text)]
+        logger.info("performance", format='json', size=len(text), elapsed_time=time.time() - start_time)
+
+        start_time = time.time()
+        decoded_binary = [op for op, _ in iter_records(io.BytesIO(binary))]
+        logger.info("performance", format='binary', size=len(binary), elapsed_time=time.time() - start_time)
+    assert len(decoded_text) == len(decoded_binary) == len(ops)
+    assert sum("elapsed_time" in log for log in logs) == 2
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+@pytest.mark.parametrize('codec', [None, 'zlib', 'lzma'])
+def test_snapshot_codec_performance(tmp_path: Path, codec: str | None) -> None:
+    tasks = [
+        {'id': i, 'duration': float(i % 600), 'done_date': 1700000000.0 + i if i % 3 else None}
+        for i in range(1, SNAPSHOT_TASKS + 1)
+    ]
+    file = tmp_path / '1.bac'
+    with capture_logs() as logs:
+        start_time = time.time()
+        file.write_bytes(encode_snapshot(tasks, codec))
+        write_time = time.time() - start_time
+
+        start_time = time.time()
+        decoded = decode_snapshot(file.read_bytes())
+        logger.info(
+            "performance",
+            codec=codec or 'json',
+            size=file.stat().st_size,
+            write_time=write_time,
+            recover_time=time.time() - start_time,
+        )
+    assert decoded == tasks
+    assert sum("write_time" in log for log in logs) == 1
+
+
+def fill_storage(storage, durability: Durability) -> None:
+    queue = TaskQueue(1, durability, storage)
+    storage.attach(1, queue.capture)
+    for i in range(1, STORAGE_OPS[durability] + 1):
+        queue.add_task(TaskNode(i, 10))
+    for i in range(1, STORAGE_OPS[durability] + 1, 2):
+        queue.update_task(TaskNode(i, 20))
+    # дожидаемся, пока всё записанное ляжет на диск
+    if storage is SqliteStorage:
+        storage._flush()
+    else:
+        storage.flush(1)
+        storage._commit(1)
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+@pytest.mark.parametrize('backend', ['file', 'sqlite'])
+@pytest.mark.parametrize('durability', [Durability.ASYNC, Durability.FSYNC])
+def test_storage_backend_performance(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, backend: str, durability: Durability,
+) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(SqliteStorage, 'path', tmp_path / 'queues.sqlite3')
+    storage = SqliteStorage if backend == 'sqlite' else PersistenceManager
+    with capture_logs() as logs:
+        start_time = time.time()
+        fill_storage(storage, durability)
+        write_time = time.time() - start_time
+        # поднимаем очередь так, как после перезапуска: теневые копии и кэши сброшены
+        storage.unload(1)
+        start_time = time.time()
+        tasks = storage.recover(1)
+        recover_time = time.time() - start_time
+        logger.info(
+            "performance",
+            backend=backend,
+            durability=durability,
+            ops_per_second=STORAGE_OPS[durability] * 1.5 / write_time,
+            recover_time=recover_time,
+            disk_bytes=sum(file.stat().st_size for file in tmp_path.rglob('*') if file.is_file()),
+        )
+    storage.clear(1)
+    assert len(tasks) == STORAGE_OPS[durability]
+    assert sum("ops_per_second" in log for log in logs) == 1
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+@pytest.mark.parametrize('queue_class', [TaskQueue, ArrayTaskQueue])
+def test_task_node_memory(queue_class: type[TaskQueue]) -> None:
+    tracemalloc.start()
+    try:
+        queue = queue_class()
+        for i in range(1, NODE_MEMORY_TASKS + 1):
+            queue.add_task(TaskNode(i, 10.0))
+        used, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    with capture_logs() as logs:
+        # в байты на задачу входят узел (или слот массивов), запись индекса и объекты id/duration
+        logger.info("performance", engine=queue_class.__name__, tasks=NODE_MEMORY_TASKS,
+                    bytes_per_task=used / NODE_MEMORY_TASKS)
+    assert len(queue) == NODE_MEMORY_TASKS
+    assert sum("bytes_per_task" in log for log in logs) == 1
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+def test_rank_performance() -> None:
+    queue = TaskQueue()
+    for i in range(1, RANK_TASKS + 1):
+        queue.add_task(TaskNode(i, 10.0))
+    task_ids = random.Random(RANK_TASKS).sample(range(1, RANK_TASKS + 1), RANK_QUERIES)
+
+    started = time.perf_counter()
+    for task_id in task_ids:
+        next(position for position, task in enumerate(queue.get_tasks()) if task.id == task_id)
+    walk = time.perf_counter() - started
+
+    started = time.perf_counter()
+    queue.get_task_at(0)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    positions = [queue.get_position(task_id) for task_id in task_ids]
+    rank = time.perf_counter() - started
+
+    started = time.perf_counter()
+    etas = [queue.get_eta(task_id) for task_id in task_ids]
+    eta = time.perf_counter() - started
+    with capture_logs() as logs:
+        logger.info("performance", tasks=RANK_TASKS, queries=RANK_QUERIES, walk_seconds=walk,
+                    build_seconds=build, rank_seconds=rank, eta_seconds=eta)
+    assert positions == [task_id - 1 for task_id in task_ids]
+    assert etas == [position * 10.0 for position in positions]
+    assert sum("rank_seconds" in log for log in logs) == 1
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+@pytest.mark.parametrize('durability', [Durability.ASYNC, Durability.GROUP_FSYNC])
+def test_bulk_performance(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, durability: Durability) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    single = TaskQueue(1, durability)
+    started = time.perf_counter()
+    for i in range(1, BULK_TASKS + 1):
+        single.add_task(TaskNode(i, 10.0))
+    single_seconds = time.perf_counter() - started
+    # пул снапшотов должен разобрать хвост первой очереди, чтобы не мешать замеру второй
+    PersistenceManager.flush(1)
+
+    bulk = TaskQueue(2, durability)
+    started = time.perf_counter()
+    for start in range(1, BULK_TASKS + 1, BULK_SIZE):
+        bulk.add_tasks([TaskNode(i, 10.0) for i in range(start, start + BULK_SIZE)])
+    bulk_seconds = time.perf_counter() - started
+    PersistenceManager.flush(2)
+    with capture_logs() as logs:
+        logger.info("performance", durability=durability, tasks=BULK_TASKS, batch=BULK_SIZE,
+                    single_seconds=single_seconds, bulk_seconds=bulk_seconds)
+    assert len(single) == len(bulk) == BULK_TASKS
+    assert sum("bulk_seconds" in log for log in logs) == 1
+
+
+class ExclusiveLock:
+    # прежняя схема для сравнения: одна RLock и на чтение, и на запись; нечётная version отправляет
+    # короткие чтения под блокировку
+    version = 1
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+
+    def acquire_read(self) -> None:
+        self._lock.acquire()
+
+    def release_read(self) -> None:
+        self._lock.release()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._lock:
+            yield
+
+    def __enter__(self) -> None:
+        self._lock.acquire()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._lock.release()
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+@pytest.mark.parametrize('queue_class', [TaskQueue, ArrayTaskQueue])
+@pytest.mark.parametrize('lock', ['rwlock', 'exclusive'])
+def test_lock_contention_performance(queue_class: type[TaskQueue], lock: str) -> None:
+    # много читателей (get_task и изредка полный список) и пара писателей (move_task) на одной очереди
+    queue = queue_class()
+    if lock == 'exclusive':
+        queue._lock = ExclusiveLock()  # type: ignore[assignment]
+    for i in range(1, CONTENTION_TASKS + 1):
+        queue.add_task(TaskNode(i, 10.0))
+
+    threads_count = CONTENTION_READERS + CONTENTION_WRITERS
+    # старт по барьеру: запуск потоков под GIL дольше самого замера
+    barrier = threading.Barrier(threads_count)
+    stop_at: list[float] = []
+    counts = [0] * threads_count
+    latencies: list[float] = []
+
+    def wait_start() -> float:
+        if barrier.wait() == 0:
+            stop_at.append(time.monotonic() + CONTENTION_SECONDS)
+        while not stop_at:
+            time.sleep(0.001)
+        return stop_at[0]
+
+    def reader(n: int) -> None:
+        rnd, done, stop = random.Random(n), 0, wait_start()
+        while time.monotonic() < stop:
+            if done % CONTENTION_LIST_EVERY == 0:
+                for _ in queue.get_tasks():
+                    pass
+            else:
+                queue.get_task(rnd.randint(1, CONTENTION_TASKS))
+            done += 1
+        counts[n] = done
+
+    def writer(n: int) -> None:
+        rnd, done, stop = random.Random(n), 0, wait_start()
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            queue.move_task(queue.get_task(rnd.randint(1, CONTENTION_TASKS)))
+            latencies.append(time.perf_counter() - started)
+            done += 1
+        counts[n] = done
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(CONTENTION_READERS)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(CONTENTION_READERS, threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    with capture_logs() as logs:
+        logger.info("performance", queue=queue_class.__name__, lock=lock,
+                    reads=sum(counts[:CONTENTION_READERS]), writes=sum(counts[CONTENTION_READERS:]),
+                    write_p50_us=latencies[len(latencies) // 2] * 1e6,
+                    write_p99_us=latencies[int(len(latencies) * 0.99)] * 1e6)
+    assert len(queue) == CONTENTION_TASKS
+    assert sum("write_p99_us" in log for log in logs) == 1
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+@pytest.mark.parametrize('queue_class', [TaskQueue, ArrayTaskQueue])
+@pytest.mark.parametrize('listing', ['locked', 'snapshot'])
+def test_listing_writer_latency_performance(queue_class: type[TaskQueue], listing: str) -> None:
+    # задержка записи, пока другой поток без перерыва отдаёт полный список большой очереди:
+    # locked - прежний путь, кодирование по полю под блокировкой; snapshot - list_tasks и кодирование без неё
+    queue = queue_class()
+    queue.add_tasks([TaskNode(i, 10.0) for i in range(1, LISTING_TASKS + 1)])
+    record = struct.Struct('=idd')
+    stop = threading.Event()
+    lists = 0
+
+    def lister() -> None:
+        nonlocal lists
+        while not stop.is_set():
+            buffer = bytearray()
+            if listing == 'locked':
+                with queue._lock.read():
+                    for task in queue.get_tasks():
+                        buffer += struct.pack('i', task.id)
+                        buffer += struct.pack('d', task.duration)
+                        buffer += struct.pack('d', task.done_date or 0)
+            else:
+                buffer += b''.join([
+                    record.pack(task_id, duration, done_date or 0)
+                    for task_id, duration, done_date in queue.list_tasks()
+                ])
+            lists += 1
+
+    thread = threading.Thread(target=lister)
+    thread.start()
+    rnd = random.Random(1)
+    latencies: list[float] = []
+    finish = time.monotonic() + LISTING_SECONDS
+    while time.monotonic() < finish:
+        started = time.perf_counter()
+        queue.move_task(queue.get_task(rnd.randint(1, LISTING_TASKS)))
+        latencies.append(time.perf_counter() - started)
+    stop.set()
+    thread.join()
+
+    latencies.sort()
+    with capture_logs() as logs:
+        logger.info("performance", queue=queue_class.__name__, listing=listing, tasks=LISTING_TASKS,
+                    lists=lists, writes=len(latencies),
+                    write_p50_us=latencies[len(latencies) // 2] * 1e6,
+                    write_p99_us=latencies[int(len(latencies) * 0.99)] * 1e6,
+                    write_max_ms=latencies[-1] * 1e3)
+    assert len(queue) == LISTING_TASKS
+    assert sum("write_max_ms" in log for log in logs) == 1
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+def test_registry_performance(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # поиск резидентных очередей, пока другие потоки создают очереди с восстановлением с диска
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    stored = list(range(REGISTRY_QUEUES + 1, REGISTRY_QUEUES + REGISTRY_STORED + 1))
+    for employer_id in stored:
+        queue = TaskQueue(employer_id, Durability.ASYNC)
+        queue.add_tasks([TaskNode(i, 10.0) for i in range(1, REGISTRY_RECOVERY_TASKS + 1)])
+        PersistenceManager.flush(employer_id)
+        PersistenceManager.unload(employer_id)
+    for employer_id in range(1, REGISTRY_QUEUES + 1):
+        QueueManager.create_queue(employer_id, Durability.MEMORY)
+
+    barrier = threading.Barrier(REGISTRY_READERS + REGISTRY_CREATORS)
+    stop_at: list[float] = []
+    lookups = [0] * REGISTRY_READERS
+    latencies: list[float] = []
+    created: list[int] = []
+
+    def wait_start() -> float:
+        if barrier.wait() == 0:
+            stop_at.append(time.monotonic() + REGISTRY_SECONDS)
+        while not stop_at:
+            time.sleep(0.001)
+        return stop_at[0]
+
+    def reader(n: int) -> None:
+        rnd, done, stop = random.Random(n), 0, wait_start()
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            QueueManager.get_queue(rnd.randint(1, REGISTRY_QUEUES))
+            latencies.append(time.perf_counter() - started)
+            done += 1
+        lookups[n] = done
+
+    def creator(n: int) -> None:
+        stop = wait_start()
+        for employer_id in stored[n::REGISTRY_CREATORS]:
+            if time.monotonic() >= stop:
+                break
+            QueueManager.create_queue(employer_id)
+            created.append(employer_id)
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(REGISTRY_READERS)]
+    threads += [threading.Thread(target=creator, args=(n,)) for n in range(REGISTRY_CREATORS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    with capture_logs() as logs:
+        logger.info("performance", lookups=sum(lookups), creates=len(created),
+                    lookup_p50_us=latencies[len(latencies) // 2] * 1e6,
+                    lookup_p99_us=latencies[int(len(latencies) * 0.99)] * 1e6,
+                    lookup_max_ms=latencies[-1] * 1e3)
+    QueueManager.clear()
+    assert sum("lookup_max_ms" in log for log in logs) == 1
+
+
+@pytest.mark.skip(reason="Performance tests are skipped by default")
+@pytest.mark.parametrize('queue_class', [TaskQueue, ArrayTaskQueue])
+def test_done_date_index_performance(queue_class: type[TaskQueue]) -> None:
+    # выборка узкого диапазона done_date: полный обход очереди против индекса, и цена обновлений с индексом
+    rnd = random.Random(DONE_INDEX_TASKS)
+    queue = queue_class()
+    queue.add_tasks([
+        TaskNode(i, 10.0, float(rnd.randrange(1, DONE_INDEX_TASKS))) for i in range(1, DONE_INDEX_TASKS + 1)
+    ])
+    starts = [float(rnd.randrange(1, DONE_INDEX_TASKS - DONE_INDEX_WIDTH)) for _ in range(DONE_INDEX_QUERIES)]
+
+    started = time.perf_counter()
+    scanned = [
+        sorted(
+            (done_date, task_id) for task_id, _, done_date in queue.list_tasks()
+            if start <= done_date < start + DONE_INDEX_WIDTH
+        )
+        for start in starts
+    ]
+    scan = time.perf_counter() - started
+
+    started = time.perf_counter()
+    queue.get_task_ids_by_done_date(0, 0)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    found = [queue.get_task_ids_by_done_date(start, start + DONE_INDEX_WIDTH) for start in starts]
+    query = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for task_id in rnd.sample(range(1, DONE_INDEX_TASKS + 1), DONE_INDEX_QUERIES * 10):
+        queue.update_task(TaskNode(task_id, 10.0, float(rnd.randrange(1, DONE_INDEX_TASKS))))
+    update = (time.perf_counter() - started) / (DONE_INDEX_QUERIES * 10)
+    with capture_logs() as logs:
+        logger.info("performance", queue=queue_class.__name__, tasks=DONE_INDEX_TASKS, queries=DONE_INDEX_QUERIES,
+                    scan_seconds=scan, build_seconds=build, query_seconds=query, update_us=update * 1e6)
+    assert found == [[task_id for _, task_id in keys] for keys in scanned]
+    assert sum("query_seconds" in log for log in logs) == 1
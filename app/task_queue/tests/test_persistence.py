@@ -1,36 +1,53 @@
 import json
 import queue
+import random
 import threading
+import time
+from collections.abc import Iterator
 from pathlib import Path
 
 import pytest
 
-from task_queue.persistence import PersistenceManager
+from task_queue.manager import QueueManager
+from task_queue.node import TaskNode
+from task_queue.persistence import Durability, PersistenceManager, SnapshotMode, TaskChain, coalesce_ops
+from task_queue.queue import TaskQueue
+from task_queue.wal import LOG_HEADER, LogWriter, encode_op, iter_records, segment_files
 
 
-def _stub_worker(cls: type[PersistenceManager], employer_id: int) -> None:
-    cls._queues[employer_id] = queue.Queue()
-    cls._locks[employer_id] = threading.Lock()
+def _add_op(task_id: int, prev: int | None = None) -> dict:
+    return {'action': 'add', 'task': {'id': task_id, 'duration': 1, 'done_date': None}, 'prev': prev}
+
+
+def _log_end(*ops: dict) -> str:
+    return str(len(LOG_HEADER) + sum(len(encode_op(op)) for op in ops))
+
+
+@pytest.fixture(autouse=True)
+def clear_persistence(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    # теневые копии общего пула не должны переживать тест и его base_path
+    yield
+    PersistenceManager.clear()
+
+
+def _stub_enqueue(cls: type[PersistenceManager], employer_id: int, item: tuple[dict, int]) -> None:
+    pass
 
 
 def test_recover_pending_log(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
     monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
-    monkeypatch.setattr(PersistenceManager, '_ensure_worker', classmethod(_stub_worker))
+    monkeypatch.setattr(PersistenceManager, '_enqueue', classmethod(_stub_enqueue))
 
     op = {'action': 'add', 'task': {'id': 1, 'duration': 1, 'done_date': None}, 'prev': None}
     PersistenceManager.log(1, op)
 
-    assert not (tmp_path / '1.bac').exists()
-
-    PersistenceManager._queues.clear()
-    PersistenceManager._workers.clear()
-    PersistenceManager._locks.clear()
+    assert not PersistenceManager._backup_file(1).exists()
 
     tasks = PersistenceManager.recover(1)
 
     assert tasks == [{'id': 1, 'duration': 1, 'done_date': None}]
-    assert json.loads((tmp_path / '1.bac').read_text()) == tasks
-    assert (tmp_path / '1.offset').read_text() == '1'
+    assert json.loads(PersistenceManager._backup_file(1).read_text()) == tasks
+    assert PersistenceManager._offset_file(1).read_text() == _log_end(op)
 
 
 def test_recover_partial_log(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
@@ -38,26 +55,18 @@ def test_recover_partial_log(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) ->
 
     op1 = {'action': 'add', 'task': {'id': 1, 'duration': 1, 'done_date': None}, 'prev': None}
     PersistenceManager.log(1, op1)
-    PersistenceManager._queues[1].join()
-
-    PersistenceManager._queues[1].put(None)
-    PersistenceManager._workers[1].join()
-
-    PersistenceManager._queues.clear()
-    PersistenceManager._workers.clear()
-    PersistenceManager._locks.clear()
+    PersistenceManager.flush(1)
+    PersistenceManager.close(1)
 
     op2 = {'action': 'add', 'task': {'id': 2, 'duration': 1, 'done_date': None}, 'prev': 1}
-    with (tmp_path / '1.log').open('a', encoding='utf-8') as f:
-        f.write(json.dumps(op2) + '\n')
-
-    monkeypatch.setattr(PersistenceManager, '_ensure_worker', classmethod(_stub_worker))
+    with PersistenceManager._log_file(1).open('ab') as f:
+        f.write(encode_op(op2))
 
     tasks = PersistenceManager.recover(1)
 
     assert [t['id'] for t in tasks] == [1, 2]
-    assert json.loads((tmp_path / '1.bac').read_text()) == tasks
-    assert (tmp_path / '1.offset').read_text() == '2'
+    assert json.loads(PersistenceManager._backup_file(1).read_text()) == tasks
+    assert PersistenceManager._offset_file(1).read_text() == _log_end(op1, op2)
 
 
 def test_recover_clean_restart(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
@@ -65,32 +74,541 @@ def test_recover_clean_restart(tmp_path: Path, monkeypatch: pytest.MonkeyPatch)
 
     op = {'action': 'add', 'task': {'id': 1, 'duration': 1, 'done_date': None}, 'prev': None}
     PersistenceManager.log(1, op)
-    PersistenceManager._queues[1].join()
+    PersistenceManager.flush(1)
+    PersistenceManager.close(1)
+
+    backup = json.loads(PersistenceManager._backup_file(1).read_text())
+    offset = PersistenceManager._offset_file(1).read_text()
+
+    tasks = PersistenceManager.recover(1)
 
-    PersistenceManager._queues[1].put(None)
-    PersistenceManager._workers[1].join()
+    assert tasks == backup
+    assert PersistenceManager._offset_file(1).read_text() == offset
 
-    backup = json.loads((tmp_path / '1.bac').read_text())
-    offset = (tmp_path / '1.offset').read_text()
 
-    PersistenceManager._queues.clear()
-    PersistenceManager._workers.clear()
-    PersistenceManager._locks.clear()
+def test_recover_reads_tail_after_byte_offset(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
 
-    monkeypatch.setattr(PersistenceManager, '_ensure_worker', classmethod(_stub_worker))
+    ops = [_add_op(1), _add_op(2, 1), _add_op(3, 2)]
+    PersistenceManager._log_file(1).write_bytes(LOG_HEADER + b''.join(encode_op(op) for op in ops))
+    # снапшот покрывает первые две записи, повторно они проигрываться не должны
+    PersistenceManager._backup_file(1).write_text(json.dumps([{'id': 2, 'duration': 1, 'done_date': None}]))
+    PersistenceManager._offset_file(1).write_text(_log_end(*ops[:2]))
 
     tasks = PersistenceManager.recover(1)
 
-    assert tasks == backup
-    assert (tmp_path / '1.offset').read_text() == offset
+    assert [t['id'] for t in tasks] == [2, 3]
+    assert PersistenceManager._offset_file(1).read_text() == _log_end(*ops)
 
 
 def test_recover_no_data(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
     monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
-    monkeypatch.setattr(PersistenceManager, '_ensure_worker', classmethod(_stub_worker))
 
     tasks = PersistenceManager.recover(1)
 
     assert tasks == []
-    assert not (tmp_path / '1.bac').exists()
-    assert not (tmp_path / '1.log').exists()
+    assert not PersistenceManager._backup_file(1).exists()
+    assert not PersistenceManager._log_file(1).exists()
+
+
+def test_snapshot_every_ops(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_every_ops', 3)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_interval', 60)
+
+    for i in (1, 2):
+        PersistenceManager.log(1, _add_op(i))
+    PersistenceManager.flush(1)
+
+    assert not PersistenceManager._backup_file(1).exists()
+
+    PersistenceManager.log(1, _add_op(3))
+    PersistenceManager.flush(1)
+
+    assert [t['id'] for t in json.loads(PersistenceManager._backup_file(1).read_text())] == [1, 2, 3]
+    assert PersistenceManager._offset_file(1).read_text() == _log_end(_add_op(1), _add_op(2), _add_op(3))
+
+    PersistenceManager.clear(1)
+
+
+def test_snapshot_interval(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_every_ops', 1000)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_interval', 0.05)
+
+    PersistenceManager.log(1, _add_op(1))
+
+    deadline = time.monotonic() + 2
+    while not PersistenceManager._offset_file(1).exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert PersistenceManager._offset_file(1).read_text() == _log_end(_add_op(1))
+    assert [t['id'] for t in json.loads(PersistenceManager._backup_file(1).read_text())] == [1]
+
+    PersistenceManager.clear(1)
+
+
+def test_apply_op_replays_queue_order() -> None:
+    tasks = TaskChain()
+    for op in (
+        {'action': 'add', 'task': {'id': 1, 'duration': 1, 'done_date': None}, 'prev': None},
+        {'action': 'add', 'task': {'id': 2, 'duration': 1, 'done_date': None}, 'prev': 1},
+        {'action': 'add', 'task': {'id': 3, 'duration': 1, 'done_date': None}, 'prev': 1},
+        {'action': 'move', 'task_id': 2, 'prev': None},
+        {'action': 'move', 'task_id': 1, 'prev': 3},
+        {'action': 'update', 'task': {'id': 3, 'duration': 5, 'done_date': 10}},
+        {'action': 'add', 'task': {'id': 4, 'duration': 1, 'done_date': None}, 'prev': 2},
+        {'action': 'delete', 'task_id': 3},
+        {'action': 'delete', 'task_id': 99},
+        {'action': 'move', 'task_id': 99, 'prev': None},
+    ):
+        PersistenceManager._apply_op(tasks, op)
+
+    assert [t['id'] for t in tasks] == [2, 4, 1]
+    assert tasks._first.task['id'] == 2
+    assert tasks._last.task['id'] == 1
+
+
+def test_apply_op_unknown_prev_appends() -> None:
+    tasks = TaskChain([{'id': 1}, {'id': 2}, {'id': 3}])
+
+    PersistenceManager._apply_op(tasks, {'action': 'add', 'task': {'id': 4}, 'prev': 99})
+    PersistenceManager._apply_op(tasks, {'action': 'move', 'task_id': 1, 'prev': 99})
+
+    assert [t['id'] for t in tasks] == [2, 3, 4, 1]
+
+
+def test_log_writer_group_commit(tmp_path: Path) -> None:
+    writer = LogWriter(tmp_path / '1.log')
+    lsns = [writer.append(f'{i}\n'.encode()) for i in range(3)]
+
+    assert lsns == [len(LOG_HEADER) + 2, len(LOG_HEADER) + 4, len(LOG_HEADER) + 6]
+    assert (tmp_path / '1.log').read_bytes() == LOG_HEADER
+
+    writer.wait(lsns[0])
+
+    assert (tmp_path / '1.log').read_bytes() == LOG_HEADER + b'0\n1\n2\n'
+    assert not writer.dirty
+
+    writer.close()
+
+
+@pytest.mark.parametrize('durability, logged', [
+    (Durability.MEMORY, False),
+    (Durability.ASYNC, False),
+    (Durability.GROUP_FSYNC, True),
+    (Durability.FSYNC, True),
+])
+def test_queue_durability(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, durability: Durability, logged: bool,
+) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    # без фонового коммита запись может попасть в файл только через ожидание подтверждения
+    monkeypatch.setattr(PersistenceManager, '_schedule_commit', classmethod(lambda cls, employer_id: None))
+
+    queue = TaskQueue(1, durability)
+    queue.add_task(TaskNode(1, 10))
+
+    log_file = PersistenceManager._log_file(1)
+    assert (log_file.exists() and log_file.stat().st_size > len(LOG_HEADER)) is logged
+    if durability is not Durability.MEMORY:
+        assert 1 in PersistenceManager._writers
+
+    PersistenceManager.clear(1)
+
+
+def test_recover_across_segments(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(PersistenceManager, 'segment_size', 64)
+    monkeypatch.setattr(PersistenceManager, '_enqueue', classmethod(_stub_enqueue))
+
+    for i in range(1, 11):
+        PersistenceManager.wait(1, PersistenceManager.log(1, _add_op(i)))
+        PersistenceManager._commit(1)
+
+    assert len(segment_files(PersistenceManager._log_file(1))) > 1
+
+    tasks = PersistenceManager.recover(1)
+
+    assert [t['id'] for t in tasks] == list(range(1, 11))
+    # после восстановления снапшот покрывает весь лог, закрытые сегменты больше не нужны
+    assert segment_files(PersistenceManager._log_file(1)) == []
+
+    PersistenceManager.clear(1)
+
+
+def test_snapshot_releases_segments(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(PersistenceManager, 'segment_size', 64)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_every_ops', 5)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_interval', 60)
+
+    for i in range(1, 11):
+        PersistenceManager.log(1, _add_op(i))
+        PersistenceManager._commit(1)
+    PersistenceManager.flush(1)
+
+    offset = int(PersistenceManager._offset_file(1).read_text())
+    segments = segment_files(PersistenceManager._log_file(1))
+    assert all(base < offset for base, _ in segments)
+    assert len(segments) <= 1
+
+    PersistenceManager.clear(1)
+
+    assert not list(tmp_path.glob('*/*'))
+
+
+def test_pool_keeps_per_employer_order(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(PersistenceManager, 'pool_batch', 2)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_every_ops', 1000)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_interval', 60)
+
+    for i in range(1, 21):
+        for employer_id in (1, 2, 3):
+            PersistenceManager.log(employer_id, _add_op(i, i - 1 if i > 1 else None))
+    for employer_id in (1, 2, 3):
+        PersistenceManager.flush(employer_id)
+        PersistenceManager.close(employer_id)
+
+    for employer_id in (1, 2, 3):
+        backup = json.loads(PersistenceManager._backup_file(employer_id).read_text())
+        assert [t['id'] for t in backup] == list(range(1, 21))
+    assert PersistenceManager.backlog() == {}
+
+
+def test_pool_is_fair_between_employers(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(PersistenceManager, 'pool_batch', 10)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_every_ops', 1)
+
+    processed = []
+    apply_batch = PersistenceManager._apply_batch.__func__
+    ensure_pool = PersistenceManager._ensure_pool.__func__
+
+    def recording_apply_batch(cls, employer_id, state, batch):
+        processed.append((employer_id, len(batch)))
+        apply_batch(cls, employer_id, state, batch)
+
+    monkeypatch.setattr(PersistenceManager, 'pool_size', 1)
+    monkeypatch.setattr(PersistenceManager, '_pool', [])
+    monkeypatch.setattr(PersistenceManager, '_ready', queue.Queue())
+    monkeypatch.setattr(PersistenceManager, '_apply_batch', classmethod(recording_apply_batch))
+    # пул стартует только после того, как в очередь встанут все операции обоих employer'ов
+    monkeypatch.setattr(PersistenceManager, '_ensure_pool', classmethod(lambda cls: None))
+
+    for i in range(1, 31):
+        PersistenceManager.log(1, _add_op(i))
+    PersistenceManager.log(2, _add_op(1))
+
+    assert PersistenceManager.backlog() == {1: 30, 2: 1}
+
+    ensure_pool(PersistenceManager)
+    PersistenceManager.flush(1)
+    PersistenceManager.flush(2)
+
+    # один поток пула: после первой пачки employer'а 1 очередь доходит до employer'а 2, а не до его хвоста
+    assert processed == [(1, 10), (2, 1), (1, 10), (1, 10)]
+    assert PersistenceManager.backlog() == {}
+
+
+@pytest.mark.parametrize('mode', [SnapshotMode.CAPTURE, SnapshotMode.FORK])
+def test_live_snapshot_modes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, mode: SnapshotMode) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_mode', mode)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_every_ops', 3)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_interval', 60)
+
+    queue = QueueManager.create_queue(1)
+    first = TaskNode(1, 10)
+    queue.add_task(first)
+    queue.add_task(TaskNode(2, 20))
+    queue.add_task(TaskNode(3, 30), prev_task=first)
+    PersistenceManager.flush(1)
+
+    backup = json.loads(PersistenceManager._backup_file(1).read_text())
+    assert [(t['id'], t['duration']) for t in backup] == [(1, 10), (3, 30), (2, 20)]
+    assert int(PersistenceManager._offset_file(1).read_text()) == queue._lsn
+    # теневой копии нет, снапшот снят с живой очереди
+    assert PersistenceManager._states[1].tasks is None
+
+    QueueManager.clear()
+
+
+@pytest.mark.parametrize('mode', [SnapshotMode.CAPTURE, SnapshotMode.FORK])
+def test_unload_with_concurrent_writer(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, mode: SnapshotMode) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_mode', mode)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_every_ops', 1000)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_interval', 60)
+
+    queue = QueueManager.create_queue(1)
+    queue.add_task(TaskNode(1, 10))
+    PersistenceManager.flush(1)
+    locked, unloading = threading.Event(), threading.Event()
+
+    def writer() -> None:
+        # писатель держит блокировку очереди, пока unload снимает снапшот, и сам логирует операцию
+        with queue._lock:
+            locked.set()
+            unloading.wait(5)
+            time.sleep(0.1)
+            queue.add_task(TaskNode(2, 20))
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=PersistenceManager.unload, args=(1,))]
+    threads[0].start()
+    assert locked.wait(5)
+    threads[1].start()
+    unloading.set()
+    for thread in threads:
+        thread.join(5)
+    assert not any(thread.is_alive() for thread in threads)
+
+    QueueManager.clear()
+
+
+def test_stored_employers(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+
+    for name in ('1.log', '1.bac', '1.offset', '258.00000000000000000064.log', '3.bac', '4.offset'):
+        (tmp_path / name).write_text('')
+    (tmp_path / 'notes.log').write_text('')
+
+    assert PersistenceManager.stored_employers() == [1, 3, 258]
+
+
+def test_flat_layout_is_migrated_to_shards(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+
+    ops = [_add_op(1), _add_op(2, 1)]
+    (tmp_path / '257.log').write_bytes(LOG_HEADER + b''.join(encode_op(op) for op in ops))
+    (tmp_path / '257.bac').write_text(json.dumps([{'id': 1, 'duration': 1, 'done_date': None}]))
+    (tmp_path / '257.offset').write_text(_log_end(ops[0]))
+    (tmp_path / 'notes.txt').write_text('')
+
+    tasks = PersistenceManager.recover(257)
+
+    assert [t['id'] for t in tasks] == [1, 2]
+    # 257 % 256 == 1: файлы employer'а переехали в шард 01, чужие файлы остались на месте
+    assert sorted(p.name for p in (tmp_path / '01').iterdir()) == ['257.bac', '257.log', '257.offset']
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['01', 'notes.txt']
+
+
+def test_warm_start(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+
+    for employer_id in (1, 2, 3):
+        PersistenceManager._log_file(employer_id).write_bytes(
+            LOG_HEADER + b''.join(encode_op(_add_op(i, i - 1 if i > 1 else None)) for i in range(1, employer_id + 1))
+        )
+
+    timings = QueueManager.warm_start(workers=2)
+
+    assert QueueManager.ready.is_set()
+    assert sorted(timings) == [1, 2, 3]
+    assert QueueManager.recovery_timings == timings
+
+    queue = QueueManager.create_queue(3)
+    assert [task.id for task in queue.get_tasks()] == [1, 2, 3]
+    # тёплая очередь с другой долговечностью не подходит, очередь поднимается заново с запрошенной
+    queue = QueueManager.create_queue(2, Durability.FSYNC)
+    assert queue.durability is Durability.FSYNC
+    assert [task.id for task in queue.get_tasks()] == [1, 2]
+    # тёплая очередь отдаётся один раз, дальше create_queue ведёт себя как обычно
+    with pytest.raises(ValueError):
+        QueueManager.create_queue(3)
+
+    QueueManager.clear()
+
+
+def test_evict_over_memory_budget(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(QueueManager, 'memory_budget', 3)
+
+    for employer_id in (1, 2):
+        queue = QueueManager.create_queue(employer_id)
+        queue.add_task(TaskNode(1, 10))
+        queue.add_task(TaskNode(2, 20))
+
+    # две очереди по две задачи не влезают в бюджет, выгружается наименее давно использованная
+    QueueManager.create_queue(3)
+    assert list(QueueManager._queues) == [2, 3]
+    assert QueueManager.evictions == 1
+    assert 1 not in PersistenceManager._writers
+
+    queue = QueueManager.get_queue(1)
+    assert [(task.id, task.duration) for task in queue.get_tasks()] == [(1, 10), (2, 20)]
+    assert (QueueManager.hits, QueueManager.misses) == (0, 1)
+    assert list(QueueManager._queues) == [3, 1]
+
+    QueueManager.get_queue(1)
+    assert (QueueManager.hits, QueueManager.misses) == (1, 1)
+
+    QueueManager.clear()
+
+
+def test_evict_idle_queues(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(QueueManager, 'idle_timeout', 0.0)
+
+    QueueManager.create_queue(1).add_task(TaskNode(1, 10))
+    QueueManager.create_queue(2, Durability.MEMORY)
+
+    QueueManager.evict_idle()
+
+    # очередь без диска остаётся в памяти, её нечем было бы поднять
+    assert list(QueueManager._queues) == [2]
+    with pytest.raises(ValueError):
+        QueueManager.create_queue(1)
+    assert [task.id for task in QueueManager.get_queue(1).get_tasks()] == [1]
+
+    QueueManager.delete_queue(1)
+    with pytest.raises(ValueError):
+        QueueManager.get_queue(1)
+
+    QueueManager.clear()
+
+
+def test_evicted_queue_object_is_retired(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    old = QueueManager.create_queue(1)
+    old.add_task(TaskNode(1, 10))
+    monkeypatch.setattr(QueueManager, 'memory_budget', 0)
+
+    # выгрузка ждёт запись, начатую через старый объект, и эта запись попадает в снапшот выгрузки
+    old._lock.acquire_write()
+    evicting = threading.Thread(target=QueueManager.create_queue, args=(2,))
+    evicting.start()
+    evicting.join(0.1)
+    assert evicting.is_alive()
+    old.add_task(TaskNode(2, 20))
+    old._lock.release_write()
+    evicting.join(5)
+    assert 1 not in QueueManager._queues
+    # get_queue, прочитавший _queues до выгрузки, не оставляет время обращения выгруженной очереди
+    QueueManager._touch(1)
+    assert 1 not in QueueManager._access
+
+    new = QueueManager.get_queue(1)
+    assert new is not old
+    # запись в старый объект после подъёма очереди заново не теряется молча
+    with pytest.raises(ValueError):
+        old.add_task(TaskNode(3, 30))
+    with pytest.raises(ValueError):
+        old.delete_task(old.get_task(1))
+    new.add_task(TaskNode(4, 40))
+    assert [task.id for task in new.get_tasks()] == [1, 2, 4]
+
+    QueueManager.clear()
+
+
+def test_recovery_does_not_block_other_employers(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    first = QueueManager.create_queue(1)
+    recovering, release = threading.Event(), threading.Event()
+    recover = PersistenceManager.recover
+
+    def slow_recover(employer_id: int) -> list[dict]:
+        if employer_id == 2:
+            recovering.set()
+            release.wait(5)
+        return recover(employer_id)
+
+    monkeypatch.setattr(PersistenceManager, 'recover', slow_recover)
+    creator = threading.Thread(target=QueueManager.create_queue, args=(2,))
+    creator.start()
+    assert recovering.wait(5)
+    # пока очередь 2 восстанавливается, остальные employer'ы работают без ожидания
+    started = time.monotonic()
+    assert QueueManager.get_queue(1) is first
+    QueueManager.create_queue(3)
+    QueueManager.delete_queue(3)
+    assert time.monotonic() - started < 1
+    release.set()
+    creator.join(5)
+    assert not creator.is_alive()
+    assert QueueManager.get_queue(2) is not None
+
+    QueueManager.clear()
+
+
+def _random_ops(rnd: random.Random, size: int) -> list[dict]:
+    # поток операций, какой мог бы записать TaskQueue: только над существующими задачами
+    ids: list[int] = []
+    next_id = 1
+    ops = []
+    for _ in range(size):
+        action = rnd.choice(['add', 'delete', 'update', 'move', 'move']) if ids else 'add'
+        prev = rnd.choice([None, *ids])
+        if action == 'add':
+            ops.append({'action': 'add', 'task': {'id': next_id, 'duration': 1, 'done_date': None}, 'prev': prev})
+            ids.append(next_id)
+            next_id += 1
+        elif action == 'delete':
+            task_id = rnd.choice(ids)
+            ids.remove(task_id)
+            ops.append({'action': 'delete', 'task_id': task_id})
+        elif action == 'update':
+            ops.append({'action': 'update', 'task': {'id': rnd.choice(ids), 'duration': rnd.random(), 'done_date': 1}})
+        else:
+            ops.append({'action': 'move', 'task_id': rnd.choice(ids), 'prev': prev})
+    return ops
+
+
+def test_coalesce_ops_keeps_replay_result() -> None:
+    rnd = random.Random(15)
+    for _ in range(500):
+        initial = [{'id': -i, 'duration': 1, 'done_date': None} for i in range(1, rnd.randint(1, 4))]
+        ops = _random_ops(rnd, rnd.randint(1, 30))
+        expected, actual = TaskChain([dict(t) for t in initial]), TaskChain([dict(t) for t in initial])
+        for op in json.loads(json.dumps(ops)):
+            expected.apply(op)
+        for op in coalesce_ops(json.loads(json.dumps(ops))):
+            actual.apply(op)
+        assert actual.to_list() == expected.to_list(), ops
+
+
+def test_coalesce_ops_drops_redundant_ops() -> None:
+    ops = [
+        _add_op(1),
+        {'action': 'update', 'task': {'id': 1, 'duration': 2, 'done_date': None}},
+        {'action': 'update', 'task': {'id': 1, 'duration': 3, 'done_date': 5}},
+        _add_op(2),
+        {'action': 'move', 'task_id': 2, 'prev': None},
+        {'action': 'move', 'task_id': 2, 'prev': 1},
+        _add_op(3, 2),
+        _add_op(4),
+        {'action': 'update', 'task': {'id': 4, 'duration': 7, 'done_date': None}},
+        {'action': 'delete', 'task_id': 4},
+    ]
+
+    assert coalesce_ops(ops) == [
+        {'action': 'add', 'task': {'id': 1, 'duration': 3, 'done_date': 5}, 'prev': None},
+        _add_op(2),
+        {'action': 'move', 'task_id': 2, 'prev': 1},
+        _add_op(3, 2),
+    ]
+
+
+def test_coalesce_ops_unpacks_batches() -> None:
+    ops = [
+        {'action': 'batch', 'ops': [_add_op(1), _add_op(2, 1)]},
+        {'action': 'batch', 'ops': [{'action': 'delete', 'task_id': 2}]},
+    ]
+
+    assert coalesce_ops(ops) == [_add_op(1)]
+
+
+def test_bulk_operations_log_one_record(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(PersistenceManager, '_enqueue', classmethod(_stub_enqueue))
+
+    queue = TaskQueue(1)
+    queue.add_tasks([TaskNode(i, i) for i in range(1, 6)])
+    queue.move_tasks([TaskNode(5, 5), TaskNode(4, 4)])
+    queue.delete_tasks([TaskNode(1, 1), TaskNode(3, 3)])
+    PersistenceManager._writers[1].commit()
+
+    with PersistenceManager._log_file(1).open('rb') as f:
+        assert [op['action'] for op, _ in iter_records(f)] == ['batch'] * 3
+    assert [task['id'] for task in PersistenceManager.recover(1)] == [5, 4, 2]
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from task_queue.array_queue import ArrayTaskQueue
+from task_queue.node import TaskNode
+from task_queue.queue import TaskQueue
+from task_queue.rank import RankIndex
+
+
+def test_rank_index_matches_list() -> None:
+    # длительности целые, чтобы суммы сравнивались точно
+    rnd = random.Random(18)
+    order = list(range(1, 200))
+    rnd.shuffle(order)
+    durations = {task_id: rnd.randint(1, 100) for task_id in order}
+    index = RankIndex((task_id, durations[task_id]) for task_id in order)
+    next_id = 1000
+    for _ in range(3000):
+        action = rnd.choice(['insert', 'remove', 'move', 'update'] if order else ['insert'])
+        if action == 'insert':
+            prev = rnd.choice(order + [None]) if order else None
+            order.insert(order.index(prev) + 1 if prev is not None else 0, next_id)
+            durations[next_id] = rnd.randint(1, 100)
+            index.insert_after(next_id, prev, durations[next_id])
+            next_id += 1
+        elif action == 'remove':
+            task_id = rnd.choice(order)
+            order.remove(task_id)
+            index.remove(task_id)
+        elif action == 'move':
+            task_id = rnd.choice(order)
+            order.remove(task_id)
+            prev = rnd.choice(order + [None]) if order else None
+            order.insert(order.index(prev) + 1 if prev is not None else 0, task_id)
+            index.move_after(task_id, prev)
+        else:
+            task_id = rnd.choice(order)
+            durations[task_id] = rnd.randint(1, 100)
+            index.set_duration(task_id, durations[task_id])
+    assert len(index) == len(order)
+    assert [index.select(position) for position in range(len(order))] == order
+    assert [index.position(task_id) for task_id in order] == list(range(len(order)))
+    assert [index.duration_before(task_id) for task_id in order] == [
+        sum(durations[task_id] for task_id in order[:position]) for position in range(len(order))
+    ]
+    assert index.total_duration == sum(durations[task_id] for task_id in order)
+    with pytest.raises(IndexError):
+        index.select(len(order))
+
+
+@pytest.mark.parametrize('queue_class', [TaskQueue, ArrayTaskQueue])
+def test_queue_positions_follow_changes(queue_class: type[TaskQueue]) -> None:
+    queue = queue_class()
+    for i in range(1, 6):
+        queue.add_task(TaskNode(i, 10))
+    assert queue.get_task_at(0).id == 1
+    assert queue.get_position(5) == 4
+
+    # индекс уже построен и дальше обновляется вместе с очередью
+    queue.add_task(TaskNode(6, 10), queue.get_task(2))
+    queue.move_task(queue.get_task(5))
+    queue.delete_task(queue.get_task(3))
+    queue.move_task(queue.get_task(1), queue.get_task(4))
+    expected = [task.id for task in queue.get_tasks()]
+    assert expected == [5, 2, 6, 4, 1]
+    assert [queue.get_task_at(position).id for position in range(len(expected))] == expected
+    assert [queue.get_position(task_id) for task_id in expected] == list(range(len(expected)))
+    assert queue.get_task_at(len(expected)) is None
+    assert queue.get_task_at(-1) is None
+    with pytest.raises(ValueError):
+        queue.get_position(3)
+    # перемещение за саму себя отклоняется до изменения очереди
+    with pytest.raises(ValueError):
+        queue.move_task(queue.get_task(4), queue.get_task(4))
+    assert [task.id for task in queue.get_tasks()] == expected
+    assert len(queue) == len(expected)
+    assert queue.get_position(1) == 4
+
+
+@pytest.mark.parametrize('queue_class', [TaskQueue, ArrayTaskQueue])
+def test_queue_eta_follows_changes(queue_class: type[TaskQueue]) -> None:
+    queue = queue_class()
+    for i in range(1, 5):
+        queue.add_task(TaskNode(i, i * 10))
+    assert queue.get_eta(1) == 0
+    assert queue.get_eta(4) == 60
+    assert queue.get_total_duration() == 100
+
+    queue.update_task(TaskNode(2, 5))
+    queue.move_task(queue.get_task(4))
+    queue.add_task(TaskNode(5, 1), queue.get_task(1))
+    queue.delete_task(queue.get_task(3))
+    # порядок: 4 (40), 1 (10), 5 (1), 2 (5)
+    assert [queue.get_eta(task_id) for task_id in (4, 1, 5, 2)] == [0, 40, 50, 51]
+    assert queue.get_total_duration() == 56
+    assert queue.get_total_duration(queue.get_task(1), queue.get_task(5)) == 11
+    assert queue.get_total_duration(queue.get_task(5)) == 6
+    assert queue.get_total_duration(to_task=queue.get_task(1)) == 50
+    # to_task раньше from_task - как get_tasks, до конца очереди
+    assert queue.get_total_duration(queue.get_task(5), queue.get_task(4)) == 6
+    with pytest.raises(ValueError):
+        queue.get_eta(3)
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from task_queue.node import TaskNode
+from task_queue.queue import TaskQueue
+from task_queue.rwlock import RWLock
+
+TIMEOUT = 5
+
+
+def test_readers_share_lock() -> None:
+    lock = RWLock()
+    inside = threading.Barrier(3, timeout=TIMEOUT)
+
+    def reader() -> None:
+        with lock.read():
+            # все три читателя должны оказаться внутри одновременно, иначе барьер упадёт по таймауту
+            inside.wait()
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    reader()
+    for thread in threads:
+        thread.join()
+
+
+def test_writer_excludes_readers() -> None:
+    lock = RWLock()
+    entered = threading.Event()
+
+    def reader() -> None:
+        with lock.read():
+            entered.set()
+
+    with lock:
+        thread = threading.Thread(target=reader)
+        thread.start()
+        assert not entered.wait(0.1)
+    assert entered.wait(TIMEOUT)
+    thread.join()
+
+
+def test_waiting_writer_blocks_new_readers() -> None:
+    lock = RWLock()
+    order: list[str] = []
+
+    def writer() -> None:
+        with lock:
+            order.append('writer')
+
+    def reader() -> None:
+        with lock.read():
+            order.append('reader')
+
+    with lock.read():
+        writer_thread = threading.Thread(target=writer)
+        writer_thread.start()
+        while not lock._writers_waiting:
+            time.sleep(0.001)
+        reader_thread = threading.Thread(target=reader)
+        reader_thread.start()
+        time.sleep(0.05)
+        assert order == []
+    writer_thread.join(TIMEOUT)
+    reader_thread.join(TIMEOUT)
+    assert order == ['writer', 'reader']
+
+
+def test_reentrancy_and_upgrade() -> None:
+    lock = RWLock()
+    with lock:
+        with lock:
+            with lock.read():
+                assert lock.version % 2 == 1
+    assert lock.version == 2
+    with lock.read():
+        with lock.read():
+            with pytest.raises(RuntimeError):
+                lock.acquire_write()
+    # после неудачного повышения блокировка свободна
+    with lock:
+        pass
+
+
+def test_optimistic_read_retries_under_lock() -> None:
+    queue = TaskQueue()
+    queue.add_task(TaskNode(1, 10))
+    queue._lock.acquire_write()
+    found: list[TaskNode | None] = []
+    # пока пишет другой поток, короткое чтение ждёт блокировку, а не читает полуизменённую очередь
+    thread = threading.Thread(target=lambda: found.append(queue.get_task(1)))
+    thread.start()
+    thread.join(0.1)
+    assert found == []
+    queue._lock.release_write()
+    thread.join(TIMEOUT)
+    assert found[0].id == 1
@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from task_queue.persistence import PersistenceManager
+from task_queue.snapshot import SNAPSHOT_HEADER, decode_snapshot, encode_snapshot, register_codec
+
+TASKS = [{'id': i, 'duration': 10.5, 'done_date': None if i % 2 else 1700000000.0} for i in range(1, 101)]
+
+
+@pytest.mark.parametrize('codec', [None, 'raw', 'zlib', 'lzma'])
+def test_snapshot_roundtrip(codec: str | None) -> None:
+    assert decode_snapshot(encode_snapshot(TASKS, codec)) == TASKS
+
+
+def test_snapshot_without_codec_is_plain_json() -> None:
+    assert json.loads(encode_snapshot(TASKS)) == TASKS
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+def test_snapshot_codec_compresses(codec: str) -> None:
+    assert len(encode_snapshot(TASKS, codec)) * 5 < len(encode_snapshot(TASKS))
+
+
+def test_snapshot_unknown_codec() -> None:
+    with pytest.raises(ValueError):
+        encode_snapshot(TASKS, 'brotli')
+
+    data = bytearray(encode_snapshot(TASKS, 'raw'))
+    data[SNAPSHOT_HEADER.size - 1] = 0xFF
+    with pytest.raises(ValueError):
+        decode_snapshot(bytes(data))
+
+
+def test_register_codec_rejects_duplicates() -> None:
+    with pytest.raises(ValueError):
+        register_codec(1, 'zlib2', bytes, bytes)
+    with pytest.raises(ValueError):
+        register_codec(3, 'zlib', bytes, bytes)
+
+
+def test_recover_mixed_snapshot_formats(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    monkeypatch.setattr(PersistenceManager, 'snapshot_codec', 'zlib')
+
+    # старый снапшот в чистом JSON читается и при включённом кодеке
+    PersistenceManager._backup_file(1).write_text(json.dumps(TASKS))
+    PersistenceManager._log_file(1).write_bytes(b'')
+
+    assert PersistenceManager.recover(1) == TASKS
+    # восстановление переписало снапшот уже в новом формате
+    assert decode_snapshot(PersistenceManager._backup_file(1).read_bytes()) == TASKS
+    assert PersistenceManager._backup_file(1).read_bytes().startswith(b'TQSN')
+
+    PersistenceManager.clear(1)
@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from task_queue.manager import QueueManager
+from task_queue.node import TaskNode
+from task_queue.persistence import Durability
+from task_queue.queue import TaskQueue
+from task_queue.sqlite_storage import SqliteStorage
+
+
+@pytest.fixture
+def f_sqlite(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    path = tmp_path / 'queues.sqlite3'
+    monkeypatch.setattr(SqliteStorage, 'path', path)
+    monkeypatch.setattr(QueueManager, 'storage', SqliteStorage)
+    yield path
+    QueueManager.clear()
+
+
+def _rows(path: Path, table: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+
+
+def test_sqlite_recover_replays_ops(f_sqlite: Path) -> None:
+    queue = QueueManager.create_queue(1)
+    first = TaskNode(1, 10)
+    queue.add_task(first)
+    queue.add_task(TaskNode(2, 20))
+    queue.move_task(queue.get_task(2))
+    queue.update_task(TaskNode(1, 15))
+    SqliteStorage._flush()
+
+    assert SqliteStorage.recover(1) == [
+        {'id': 2, 'duration': 20, 'done_date': 0},
+        {'id': 1, 'duration': 15, 'done_date': 0},
+    ]
+    # проигранный хвост свернулся в снапшот
+    assert (_rows(f_sqlite, 'ops'), _rows(f_sqlite, 'snapshots')) == (0, 1)
+    assert SqliteStorage.stored_employers() == [1]
+
+
+def test_sqlite_snapshot_from_live_queue(f_sqlite: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(SqliteStorage, 'snapshot_every_ops', 3)
+
+    queue = QueueManager.create_queue(1)
+    for i in range(1, 4):
+        queue.add_task(TaskNode(i, 10))
+    SqliteStorage._flush()
+    SqliteStorage._snapshot_due()
+
+    assert (_rows(f_sqlite, 'ops'), _rows(f_sqlite, 'snapshots')) == (0, 1)
+
+    queue.add_task(TaskNode(4, 10))
+    QueueManager.storage.unload(1)
+
+    assert [t['id'] for t in SqliteStorage.recover(1)] == [1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('durability', [Durability.GROUP_FSYNC, Durability.FSYNC])
+def test_sqlite_durable_ops_are_committed(f_sqlite: Path, durability: Durability) -> None:
+    queue = TaskQueue(1, durability, SqliteStorage)
+    queue.add_task(TaskNode(1, 10))
+
+    assert _rows(f_sqlite, 'ops') == 1
+
+
+def test_sqlite_fsync_takes_snapshots(f_sqlite: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(SqliteStorage, 'snapshot_every_ops', 10)
+
+    queue = QueueManager.create_queue(1, Durability.FSYNC)
+    for i in range(1, 101):
+        queue.add_task(TaskNode(i, 10))
+
+    # снапшот снимает поток сброса, ждём его
+    deadline = time.monotonic() + 5
+    while _rows(f_sqlite, 'snapshots') == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _rows(f_sqlite, 'snapshots') == 1
+    assert _rows(f_sqlite, 'ops') < 100
+    assert [t['id'] for t in SqliteStorage.recover(1)] == list(range(1, 101))
+
+
+def test_sqlite_concurrent_employers(f_sqlite: Path) -> None:
+    def worker(employer_id: int) -> None:
+        queue = QueueManager.create_queue(employer_id, Durability.GROUP_FSYNC)
+        for i in range(1, 51):
+            queue.add_task(TaskNode(i, 10))
+
+    threads = [threading.Thread(target=worker, args=(employer_id,)) for employer_id in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert _rows(f_sqlite, 'ops') == 8 * 50
+    for employer_id in range(1, 9):
+        assert [t['id'] for t in SqliteStorage.recover(employer_id)] == list(range(1, 51))
@@ -251,3 +251,120 @@ def test_get_latest_task(f_queue, f_task_factory):
     assert f_queue.latest_task is t1
     f_queue.add_task(t2)
     assert f_queue.latest_task is t2
+
+
+def test_add_tasks(f_queue, f_task_factory):
+    f_queue.add_task(f_task_factory(1))
+    f_queue.add_task(f_task_factory(2))
+    f_queue.add_tasks([f_task_factory(3), f_task_factory(4)], f_queue.get_task(1))
+    f_queue.add_tasks([f_task_factory(5), f_task_factory(6)])
+    assert [task.id for task in f_queue.get_tasks()] == [1, 3, 4, 2, 5, 6]
+
+
+def test_move_tasks(f_queue, f_task_factory):
+    f_queue.add_tasks([f_task_factory(i) for i in range(1, 6)])
+    f_queue.move_tasks([f_task_factory(5), f_task_factory(1)], f_queue.get_task(3))
+    assert [task.id for task in f_queue.get_tasks()] == [2, 3, 5, 1, 4]
+    f_queue.move_tasks([f_task_factory(4), f_task_factory(3)])
+    assert [task.id for task in f_queue.get_tasks()] == [4, 3, 2, 5, 1]
+    assert f_queue.latest_task.id == 1
+
+
+def test_delete_tasks(f_queue, f_task_factory):
+    f_queue.add_tasks([f_task_factory(i) for i in range(1, 6)])
+    f_queue.delete_tasks([f_task_factory(1), f_task_factory(5), f_task_factory(3)])
+    assert [task.id for task in f_queue.get_tasks()] == [2, 4]
+
+
+def test_bulk_operations_are_atomic(f_queue, f_task_factory):
+    f_queue.add_tasks([f_task_factory(i) for i in range(1, 4)])
+    with pytest.raises(ValueError):
+        f_queue.add_tasks([f_task_factory(4), f_task_factory(2)])
+    with pytest.raises(ValueError):
+        f_queue.add_tasks([f_task_factory(4), f_task_factory(4)])
+    with pytest.raises(ValueError):
+        f_queue.move_tasks([f_task_factory(1), f_task_factory(9)])
+    with pytest.raises(ValueError):
+        f_queue.move_tasks([f_task_factory(1), f_task_factory(2)], f_queue.get_task(2))
+    with pytest.raises(ValueError):
+        f_queue.delete_tasks([f_task_factory(3), f_task_factory(9)])
+    assert [task.id for task in f_queue.get_tasks()] == [1, 2, 3]
+
+
+def test_list_tasks_is_snapshot(f_queue, f_task_factory):
+    f_queue.add_tasks([f_task_factory(i, 10) for i in range(1, 5)])
+    tasks = f_queue.list_tasks(f_queue.get_task(2), f_queue.get_task(3))
+    assert [task[:2] for task in tasks] == [(2, 10), (3, 10)]
+    iterator = f_queue.get_tasks()
+    next(iterator)
+    # начатый обход не держит блокировку: запись проходит, а обход видит очередь на момент начала
+    f_queue.delete_task(f_queue.get_task(2))
+    assert [task.id for task in iterator] == [2, 3, 4]
+    assert [task[0] for task in tasks] == [2, 3]
+
+
+def test_list_tasks_page(f_queue, f_task_factory):
+    f_queue.add_tasks([f_task_factory(i, 10) for i in range(1, 8)])
+    tasks, cursor = f_queue.list_tasks_page(3)
+    assert [task[0] for task in tasks] == [1, 2, 3]
+    # курсор переживает изменения очереди между страницами: перемещение последней отданной задачи...
+    f_queue.move_task(f_queue.get_task(3), f_queue.get_task(5))
+    tasks, cursor = f_queue.list_tasks_page(2, cursor)
+    assert [task[0] for task in tasks] == [6, 7]
+    assert cursor == ''
+
+    tasks, cursor = f_queue.list_tasks_page(2, '', f_queue.get_task(2), f_queue.get_task(6))
+    assert [task[0] for task in tasks] == [2, 4]
+    # ...и её удаление: продолжаем с её места
+    f_queue.delete_task(f_queue.get_task(4))
+    tasks, cursor = f_queue.list_tasks_page(2, cursor)
+    assert [task[0] for task in tasks] == [5, 3]
+    tasks, cursor = f_queue.list_tasks_page(2, cursor)
+    assert ([task[0] for task in tasks], cursor) == ([6], '')
+
+    with pytest.raises(ValueError):
+        f_queue.list_tasks_page(0)
+    with pytest.raises(ValueError):
+        f_queue.list_tasks_page(1, 'not a cursor')
+
+
+def test_list_tasks_page_range_changes(f_queue, f_task_factory):
+    f_queue.add_tasks([f_task_factory(i, 10) for i in range(1, 11)])
+    tasks, cursor = f_queue.list_tasks_page(2, '', f_queue.get_task(2), f_queue.get_task(5))
+    assert [task[0] for task in tasks] == [2, 3]
+    # последняя отданная задача ушла за границу диапазона: продолжаем с первой неотданной, а не за её новым местом
+    f_queue.move_task(f_queue.get_task(3), f_queue.get_task(8))
+    tasks, cursor = f_queue.list_tasks_page(2, cursor)
+    assert ([task[0] for task in tasks], cursor) == ([4, 5], '')
+
+    tasks, cursor = f_queue.list_tasks_page(2, '', f_queue.get_task(2), f_queue.get_task(8))
+    assert [task[0] for task in tasks] == [2, 4]
+    # удаление задачи-начала диапазона не обрывает обход: границы хранятся в курсоре
+    f_queue.delete_task(f_queue.get_task(2))
+    tasks, cursor = f_queue.list_tasks_page(2, cursor)
+    assert [task[0] for task in tasks] == [5, 6]
+    # ушли и последняя, и первая неотданная задачи: продолжаем с прежнего места последней
+    f_queue.delete_task(f_queue.get_task(6))
+    f_queue.move_task(f_queue.get_task(7), f_queue.get_task(9))
+    tasks, cursor = f_queue.list_tasks_page(2, cursor)
+    assert ([task[0] for task in tasks], cursor) == ([8], '')
+
+
+def test_list_tasks_page_to_task_deleted(f_queue, f_task_factory):
+    f_queue.add_tasks([f_task_factory(i, 10) for i in range(1, 21)])
+    tasks, cursor = f_queue.list_tasks_page(2, '', f_queue.get_task(2), f_queue.get_task(5))
+    assert [task[0] for task in tasks] == [2, 3]
+    # to-граница удалена: обход доходит до её прежнего места, а не до конца очереди
+    f_queue.delete_task(f_queue.get_task(5))
+    tasks, cursor = f_queue.list_tasks_page(2, cursor)
+    assert ([task[0] for task in tasks], cursor) == ([4], '')
+
+    tasks, cursor = f_queue.list_tasks_page(2, '', f_queue.get_task(6), f_queue.get_task(13))
+    assert [task[0] for task in tasks] == [6, 7]
+    f_queue.delete_task(f_queue.get_task(13))
+    # граница переносится и в следующие курсоры
+    pages = []
+    while cursor:
+        tasks, cursor = f_queue.list_tasks_page(2, cursor)
+        pages.append([task[0] for task in tasks])
+    assert pages == [[8, 9], [10, 11], [12]]
@@ -0,0 +1,202 @@
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from task_queue.persistence import PersistenceManager
+from task_queue.wal import (
+    LOG_HEADER,
+    LogWriter,
+    convert_log,
+    decode_op,
+    encode_op,
+    is_legacy_log,
+    iter_records,
+    main,
+    segment_files,
+)
+
+OPS = [
+    {'action': 'add', 'task': {'id': 1, 'duration': 10.5, 'done_date': None}, 'prev': None},
+    {'action': 'add', 'task': {'id': 2, 'duration': 20.0, 'done_date': 162030.0}, 'prev': 1},
+    {'action': 'update', 'task': {'id': 2, 'duration': 30.0, 'done_date': 162040.0}},
+    {'action': 'move', 'task_id': 2, 'prev': None},
+    {'action': 'move', 'task_id': 1, 'prev': 2},
+    {'action': 'delete', 'task_id': 1},
+]
+
+
+def test_encode_decode_roundtrip() -> None:
+    for op in OPS:
+        record = encode_op(op)
+        assert decode_op(record[6:]) == op
+
+
+def test_batch_roundtrip() -> None:
+    op = {'action': 'batch', 'ops': OPS}
+    record = encode_op(op)
+    assert decode_op(record[6:]) == op
+    with pytest.raises(ValueError):
+        encode_op({'action': 'batch', 'ops': [op]})
+
+
+def test_long_batch_record() -> None:
+    # пачка длиннее 64 КБ пишется с длиной uint32 и отбрасывается целиком, если не дописана
+    batch = {'action': 'batch', 'ops': [
+        {'action': 'add', 'task': {'id': i, 'duration': 1.0, 'done_date': None}, 'prev': i - 1 or None}
+        for i in range(1, 5001)
+    ]}
+    data = LOG_HEADER + encode_op(OPS[0]) + encode_op(batch) + encode_op(OPS[5])
+
+    assert [op for op, _ in iter_records(io.BytesIO(data))] == [OPS[0], batch, OPS[5]]
+    assert list(iter_records(io.BytesIO(data[:-len(encode_op(OPS[5])) - 1]))) == [
+        (OPS[0], len(LOG_HEADER) + len(encode_op(OPS[0])))
+    ]
+
+
+def test_iter_records() -> None:
+    data = LOG_HEADER + b''.join(encode_op(op) for op in OPS)
+
+    records = list(iter_records(io.BytesIO(data)))
+
+    assert [op for op, _ in records] == OPS
+    assert records[-1][1] == len(data)
+
+
+def test_iter_records_stops_at_torn_tail() -> None:
+    data = LOG_HEADER + encode_op(OPS[0]) + encode_op(OPS[1])[:-3]
+
+    assert [op for op, _ in iter_records(io.BytesIO(data))] == OPS[:1]
+
+
+def test_iter_records_stops_at_bad_crc() -> None:
+    second = bytearray(encode_op(OPS[1]))
+    second[-1] ^= 0xFF
+    data = LOG_HEADER + encode_op(OPS[0]) + bytes(second) + encode_op(OPS[2])
+
+    assert [op for op, _ in iter_records(io.BytesIO(data))] == OPS[:1]
+
+
+def test_binary_log_is_smaller_than_json() -> None:
+    binary = sum(len(encode_op(op)) for op in OPS)
+    text = sum(len(json.dumps(op)) + 1 for op in OPS)
+
+    assert binary * 2 < text
+
+
+def test_convert_log(tmp_path: Path) -> None:
+    log_file = tmp_path / '1.log'
+    log_file.write_text(''.join(json.dumps(op) + '\n' for op in OPS))
+
+    assert is_legacy_log(log_file)
+    assert convert_log(log_file, 2) == (len(OPS), len(LOG_HEADER) + sum(len(encode_op(op)) for op in OPS[:2]))
+    assert not is_legacy_log(log_file)
+    with log_file.open('rb') as f:
+        assert [op for op, _ in iter_records(f)] == OPS
+
+
+def test_convert_sharded_logs(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    # после раскладки по шардам старые логи лежат в storage/<xx>/, конвертер должен найти и их
+    legacy = ''.join(json.dumps(op) + '\n' for op in OPS)
+    (tmp_path / '01').mkdir()
+    for log_file in (tmp_path / '2.log', tmp_path / '01' / '257.log'):
+        log_file.write_text(legacy)
+    (tmp_path / '01' / '257.offset').write_text('2')
+
+    main([str(tmp_path)])
+
+    assert not is_legacy_log(tmp_path / '2.log')
+    assert not is_legacy_log(tmp_path / '01' / '257.log')
+    assert int((tmp_path / '01' / '257.offset').read_text()) == len(LOG_HEADER) + sum(
+        len(encode_op(op)) for op in OPS[:2]
+    )
+    assert capsys.readouterr().out.count('ops converted') == 2
+
+
+def test_recover_legacy_log(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    PersistenceManager._log_file(1).write_text(''.join(json.dumps(op) + '\n' for op in OPS))
+    PersistenceManager._backup_file(1).write_text(json.dumps([{'id': 1, 'duration': 10.5, 'done_date': None}]))
+    PersistenceManager._offset_file(1).write_text('1')
+
+    tasks = PersistenceManager.recover(1)
+
+    assert tasks == [{'id': 2, 'duration': 30.0, 'done_date': 162040.0}]
+    assert PersistenceManager._log_file(1).read_bytes().startswith(LOG_HEADER)
+    assert PersistenceManager._offset_file(1).read_text() == str(PersistenceManager._log_file(1).stat().st_size)
+
+    PersistenceManager.clear(1)
+
+
+def test_recover_truncates_torn_tail(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(PersistenceManager, 'base_path', tmp_path)
+    good = LOG_HEADER + encode_op(OPS[0])
+    PersistenceManager._log_file(1).write_bytes(good + encode_op(OPS[1])[:-3])
+
+    tasks = PersistenceManager.recover(1)
+
+    assert [t['id'] for t in tasks] == [1]
+    assert PersistenceManager._log_file(1).read_bytes() == good
+
+    PersistenceManager.clear(1)
+
+
+def _write_ops(writer: LogWriter, ops: list[dict]) -> list[int]:
+    lsns = []
+    for op in ops:
+        lsns.append(writer.append(encode_op(op)))
+        writer.commit()
+    return lsns
+
+
+def test_log_writer_rolls_segments(tmp_path: Path) -> None:
+    log_file = tmp_path / '1.log'
+    writer = LogWriter(log_file, segment_size=40)
+
+    lsns = _write_ops(writer, OPS)
+    writer.close()
+
+    segments = segment_files(log_file)
+    assert [base for base, _ in segments] == writer.segments
+    assert len(segments) > 1
+
+    records = []
+    for _, file in [*segments, (None, log_file)]:
+        with file.open('rb') as f:
+            records.extend(iter_records(f))
+    assert [op for op, _ in records] == OPS
+    assert [lsn for _, lsn in records] == lsns
+
+
+def test_log_writer_continues_lsn_after_reopen(tmp_path: Path) -> None:
+    log_file = tmp_path / '1.log'
+    writer = LogWriter(log_file, segment_size=40)
+    first = _write_ops(writer, OPS[:3])
+    writer.close()
+
+    writer = LogWriter(log_file, segment_size=40)
+    second = _write_ops(writer, OPS[3:])
+    writer.close()
+
+    assert first + second == sorted(first + second)
+
+
+@pytest.mark.parametrize('archive', [False, True])
+def test_log_writer_release(tmp_path: Path, archive: bool) -> None:
+    log_file = tmp_path / '1.log'
+    archive_path = tmp_path / 'archive' if archive else None
+    writer = LogWriter(log_file, segment_size=40)
+    lsns = _write_ops(writer, OPS)
+    rolled = segment_files(log_file)
+
+    # чекпоинт внутри второго сегмента освобождает только первый
+    writer.release(rolled[1][0] + 1, archive_path)
+
+    assert segment_files(log_file) == rolled[1:]
+    assert (archive_path is not None and (archive_path / rolled[0][1].name).exists()) is archive
+
+    writer.release(lsns[-1], archive_path)
+
+    assert segment_files(log_file) == []
+    writer.close()
@@ -0,0 +1,391 @@
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, BinaryIO
+
+# Формат лога, версия 3:
+#   заголовок файла: magic 'TQWL' + версия (uint8) + LSN начала сегмента (uint64);
+#   запись: длина payload (uint16) + crc32 payload (uint32) + payload; если длина не влезает в uint16,
+#   в поле длины пишется 0xFFFF, а настоящая длина (uint32) идёт сразу после crc;
+#   payload: код действия (младшие 4 бита) и флаги (старшие 4 бита) в одном байте + поля действия;
+#   id задач int32, как и в сетевом протоколе, duration и done_date - double, всё little-endian.
+#   Пакетная запись (BATCH) - байт действия и подряд payload'ы вложенных операций: их длина
+#   определяется кодом действия, а вся пачка под одним crc пишется и отбрасывается целиком.
+# Записи с неполным хвостом или неверным crc считаются недописанными при падении и отбрасываются.
+# В версии 1 не было LSN начала сегмента, такие файлы читаются как сегмент с началом в 0.
+# Версия 2 отличается от 3 только отсутствием пакетных и длинных записей.
+#
+# Лог employer'а состоит из сегментов: активный <id>.log и закрытые <id>.<LSN начала>.log.
+# LSN записи - LSN начала её сегмента плюс позиция в файле сразу после записи, поэтому LSN
+# сквозные для всех сегментов и .offset остаётся одним числом.
+LOG_MAGIC = b'TQWL'
+LOG_VERSION = 3
+FILE_HEADER = struct.Struct('<4sB')
+BASE_HEADER = struct.Struct('<Q')
+RECORD_HEADER = struct.Struct('<HI')
+LONG_LENGTH = struct.Struct('<I')
+LONG_RECORD = 0xFFFF
+HEADER_SIZE = FILE_HEADER.size + BASE_HEADER.size
+
+
+def log_header(base: int = 0) -> bytes:
+    return FILE_HEADER.pack(LOG_MAGIC, LOG_VERSION) + BASE_HEADER.pack(base)
+
+
+LOG_HEADER = log_header()
+
+ADD = 1
+DELETE = 2
+UPDATE = 3
+MOVE = 4
+BATCH = 5
+
+# флаги для полей, которые в операции могут быть None
+NO_PREV = 0x10
+NO_DURATION = 0x20
+NO_DONE_DATE = 0x40
+ACTION_MASK = 0x0F
+
+ADD_RECORD = struct.Struct('<Biddi')
+DELETE_RECORD = struct.Struct('<Bi')
+UPDATE_RECORD = struct.Struct('<Bidd')
+MOVE_RECORD = struct.Struct('<Bii')
+RECORDS = {ADD: ADD_RECORD, DELETE: DELETE_RECORD, UPDATE: UPDATE_RECORD, MOVE: MOVE_RECORD}
+
+
+def _task_flags(task: dict[str, Any]) -> int:
+    return (NO_DURATION if task['duration'] is None else 0) | (NO_DONE_DATE if task['done_date'] is None else 0)
+
+
+def encode_op(op: dict[str, Any]) -> bytes:
+    payload = encode_payload(op)
+    if len(payload) < LONG_RECORD:
+        return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+    return RECORD_HEADER.pack(LONG_RECORD, zlib.crc32(payload)) + LONG_LENGTH.pack(len(payload)) + payload
+
+
+def encode_payload(op: dict[str, Any]) -> bytes:
+    action = op['action']
+    if action == 'batch':
+        if any(sub['action'] == 'batch' for sub in op['ops']):
+            raise ValueError("Nested log batches are not supported")
+        return bytes([BATCH]) + b''.join(encode_payload(sub) for sub in op['ops'])
+    if action == 'add':
+        task = op['task']
+        prev = op.get('prev')
+        payload = ADD_RECORD.pack(
+            ADD | _task_flags(task) | (NO_PREV if prev is None else 0),
+            task['id'], task['duration'] or 0, task['done_date'] or 0, prev or 0,
+        )
+    elif action == 'delete':
+        payload = DELETE_RECORD.pack(DELETE, op['task_id'])
+    elif action == 'update':
+        task = op['task']
+        payload = UPDATE_RECORD.pack(
+            UPDATE | _task_flags(task), task['id'], task['duration'] or 0, task['done_date'] or 0,
+        )
+    elif action == 'move':
+        prev = op.get('prev')
+        payload = MOVE_RECORD.pack(MOVE | (NO_PREV if prev is None else 0), op['task_id'], prev or 0)
+    else:
+        raise ValueError(f"Unknown log action {action!r}")
+    return payload
+
+
+def _decode_task(flags: int, task_id: int, duration: float, done_date: float) -> dict[str, Any]:
+    return {
+        'id': task_id,
+        'duration': None if flags & NO_DURATION else duration,
+        'done_date': None if flags & NO_DONE_DATE else done_date,
+    }
+
+
+def decode_op(payload: bytes) -> dict[str, Any]:
+    if payload[0] & ACTION_MASK == BATCH:
+        ops, position = [], 1
+        while position < len(payload):
+            record = RECORDS.get(payload[position] & ACTION_MASK)
+            if record is None:
+                raise ValueError(f"Unknown log record action {payload[position] & ACTION_MASK}")
+            ops.append(decode_op(payload[position:position + record.size]))
+            position += record.size
+        return {'action': 'batch', 'ops': ops}
+    flags = payload[0]
+    action = flags & ACTION_MASK
+    if action == ADD:
+        _, task_id, duration, done_date, prev = ADD_RECORD.unpack(payload)
+        return {
+            'action': 'add',
+            'task': _decode_task(flags, task_id, duration, done_date),
+            'prev': None if flags & NO_PREV else prev,
+        }
+    if action == DELETE:
+        _, task_id = DELETE_RECORD.unpack(payload)
+        return {'action': 'delete', 'task_id': task_id}
+    if action == UPDATE:
+        _, task_id, duration, done_date = UPDATE_RECORD.unpack(payload)
+        return {'action': 'update', 'task': _decode_task(flags, task_id, duration, done_date)}
+    if action == MOVE:
+        _, task_id, prev = MOVE_RECORD.unpack(payload)
+        return {'action': 'move', 'task_id': task_id, 'prev': None if flags & NO_PREV else prev}
+    raise ValueError(f"Unknown log record action {action}")
+
+
+def is_legacy_log(path: Path) -> bool:
+    # логи до версии 1 - JSON по операции на строку, без заголовка
+    with path.open('rb') as f:
+        head = f.read(FILE_HEADER.size)
+    return bool(head) and not head.startswith(LOG_MAGIC)
+
+
+def read_header(f: BinaryIO) -> tuple[int, int] | None:
+    """
+    Чтение заголовка сегмента лога.
+
+    :param f: файл, открытый на чтение в бинарном режиме
+    :return: LSN начала сегмента и размер заголовка или None, если заголовок не дописан
+    """
+    f.seek(0)
+    header = f.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        return None
+    magic, version = FILE_HEADER.unpack(header)
+    if magic != LOG_MAGIC or version not in (1, 2, LOG_VERSION):
+        raise ValueError(f"Unsupported log format in {getattr(f, 'name', f)}")
+    if version == 1:
+        return 0, FILE_HEADER.size
+    base = f.read(BASE_HEADER.size)
+    if len(base) < BASE_HEADER.size:
+        return None
+    return BASE_HEADER.unpack(base)[0], HEADER_SIZE
+
+
+def iter_records(f: BinaryIO, start: int = 0) -> Iterator[tuple[dict[str, Any], int]]:
+    """
+    Потоковое чтение записей сегмента лога, заканчивающихся после LSN start.
+    В памяти одновременно находится только одна запись, так что размер лога на память не влияет.
+
+    :param f: файл сегмента, открытый на чтение в бинарном режиме
+    :param start: LSN первой непрочитанной записи (0 - с начала сегмента)
+    :return: пары (операция, LSN сразу после записи); чтение останавливается на первой битой записи
+    """
+    header = read_header(f)
+    if header is None:
+        return
+    base, header_size = header
+    position = max(start - base, header_size)
+    f.seek(position)
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        length, crc = RECORD_HEADER.unpack(header)
+        size = RECORD_HEADER.size + length
+        if length == LONG_RECORD:
+            long_length = f.read(LONG_LENGTH.size)
+            if len(long_length) < LONG_LENGTH.size:
+                return
+            length = LONG_LENGTH.unpack(long_length)[0]
+            size = RECORD_HEADER.size + LONG_LENGTH.size + length
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        position += size
+        yield decode_op(payload), base + position
+
+
+def segment_path(path: Path, base: int) -> Path:
+    # storage/1.log -> storage/1.00000000000000004096.log
+    return path.with_name(f'{path.stem}.{base:020d}{path.suffix}')
+
+
+def segment_files(path: Path) -> list[tuple[int, Path]]:
+    """
+    Закрытые сегменты лога.
+
+    :param path: путь к активному сегменту
+    :return: пары (LSN начала, путь), упорядоченные по LSN
+    """
+    segments = []
+    for file in path.parent.glob(f'{path.stem}.*{path.suffix}'):
+        base = file.name[len(path.stem) + 1:-len(path.suffix)]
+        if base.isdigit():
+            segments.append((int(base), file))
+    return sorted(segments)
+
+
+def convert_log(path: Path, offset: int = 0) -> tuple[int, int]:
+    """
+    Перевод лога из JSON-строк в бинарный формат на месте.
+
+    :param path: путь к .log
+    :param offset: чекпоинт старого формата - количество уже применённых строк лога
+    :return: количество перенесённых операций и байтовая позиция, соответствующая offset
+    """
+    count = 0
+    position = None
+    tmp = path.with_name(path.name + '.tmp')
+    with path.open('r', encoding='utf-8') as src, tmp.open('wb') as dst:
+        dst.write(LOG_HEADER)
+        for number, line in enumerate(src):
+            if number == offset:
+                position = dst.tell()
+            if not line.strip():
+                continue
+            dst.write(encode_op(json.loads(line)))
+            count += 1
+        if position is None:
+            # чекпоинт указывает на конец лога
+            position = dst.tell()
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(tmp, path)
+    return count, position
+
+
+class LogWriter:
+    # Долгоживущий дескриптор лога одного employer'а с групповым коммитом.
+    # append() только кладёт запись в буфер и возвращает её LSN (позицию в логе сразу после неё),
+    # commit() одним write (и, если включено, одним fsync) сбрасывает всё, что накопилось.
+    # Когда активный сегмент дорастает до segment_size, он закрывается и переименовывается
+    # в <id>.<LSN начала>.log, а записи продолжают идти в новый <id>.log.
+    path: Path
+    fsync: bool
+    segment_size: int
+    segments: list[int]
+
+    def __init__(self, path: Path, fsync: bool = False, segment_size: int = 0) -> None:
+        self.path = path
+        self.fsync = fsync
+        self.segment_size = segment_size
+        self.segments = [base for base, _ in segment_files(path)]
+        self._file = path.open('ab')
+        self._base = self._open_base()
+        self._buffer: list[bytes] = []
+        # _lock защищает буфер и счётчик записей, _commit_lock сериализует запись на диск,
+        # чтобы append не ждал, пока другой поток делает write/fsync
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._appended = self._committed = self._base + self._file.tell()
+
+    def _open_base(self) -> int:
+        if self._file.tell():
+            with self.path.open('rb') as f:
+                header = read_header(f)
+            if header is not None:
+                return header[0]
+            self._file.truncate(0)
+        # новый активный сегмент продолжает LSN последнего закрытого
+        base = 0
+        if self.segments:
+            base = self.segments[-1] + segment_path(self.path, self.segments[-1]).stat().st_size
+        self._file.write(log_header(base))
+        self._file.flush()
+        return base
+
+    @property
+    def dirty(self) -> bool:
+        return self._committed < self._appended
+
+    def append(self, data: bytes) -> int:
+        with self._lock:
+            self._buffer.append(data)
+            self._appended += len(data)
+            return self._appended
+
+    def _commit_locked(self) -> None:
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+            lsn = self._appended
+            roll = bool(self.segment_size) and lsn - self._base >= self.segment_size
+            if roll:
+                # записи, добавленные после этой группы, уже попадут в новый сегмент после его заголовка
+                self._appended += HEADER_SIZE
+        if self._file.closed:
+            return
+        if buffer:
+            self._file.write(b''.join(buffer))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        if roll:
+            self._roll(lsn)
+            lsn += HEADER_SIZE
+        self._committed = lsn
+
+    def _roll(self, end: int) -> None:
+        self._file.close()
+        os.replace(self.path, segment_path(self.path, self._base))
+        self.segments.append(self._base)
+        self._file = self.path.open('ab')
+        self._file.write(log_header(end))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._base = end
+
+    def commit(self) -> None:
+        with self._commit_lock:
+            self._commit_locked()
+
+    def wait(self, lsn: int) -> None:
+        # Пока один поток пишет на диск, остальные продолжают складывать записи в буфер.
+        # Первый из ожидающих, кто получит _commit_lock, сбросит их все одной группой,
+        # остальные увидят, что их запись уже закоммичена, и сразу вернутся.
+        if self._committed >= lsn:
+            return
+        with self._commit_lock:
+            if self._committed < lsn:
+                self._commit_locked()
+
+    def release(self, lsn: int, archive_path: Path | None = None) -> None:
+        """
+        Удаление закрытых сегментов, целиком покрытых чекпоинтом.
+
+        :param lsn: LSN, до которого все операции уже есть в снапшоте
+        :param archive_path: каталог, куда переносить сегменты вместо удаления
+        """
+        with self._commit_lock:
+            while self.segments:
+                # конец закрытого сегмента - начало следующего
+                end = self.segments[1] if len(self.segments) > 1 else self._base
+                if end > lsn:
+                    break
+                file = segment_path(self.path, self.segments.pop(0))
+                if archive_path is not None:
+                    archive_path.mkdir(parents=True, exist_ok=True)
+                    os.replace(file, archive_path / file.name)
+                else:
+                    file.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        with self._commit_lock:
+            self._commit_locked()
+            self._file.close()
+
+
+def main(paths: list[str]) -> None:
+    # python -m task_queue.wal storage/ - перевести старые JSON-логи в каталоге в бинарный формат,
+    # а их .offset из количества строк в байтовую позицию. Логи ищутся и в корне (до раскладки по шардам),
+    # и в каталогах шардов storage/<xx>/; .offset лежит рядом со своим логом.
+    for arg in paths:
+        path = Path(arg)
+        files = sorted([*path.glob('*.log'), *path.glob('*/*.log')]) if path.is_dir() else [path]
+        for file in files:
+            if not is_legacy_log(file):
+                continue
+            offset_file = file.parent / f'{file.stem}.offset'
+            offset = int(offset_file.read_text()) if offset_file.exists() else 0
+            count, position = convert_log(file, offset)
+            if offset_file.exists():
+                offset_file.write_text(str(position))
+            print(f'{file}: {count} ops converted')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])